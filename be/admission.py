@@ -0,0 +1,328 @@
+# be/admission.py
+import hmac
+import json
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from urllib.parse import parse_qsl
+
+import anyio
+
+
+class Overloaded(RuntimeError):
+    """Raised when an ES query cannot get into the in-flight budget in time."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Server busy: too many queries in flight, retry in {math.ceil(retry_after)} s")
+        self.retry_after = retry_after
+
+
+class EsBudget:
+    """Caps the ES queries in flight across the whole process.
+
+    Up to `max_in_flight` queries run at once; up to `max_queue` more wait in
+    FIFO order, each for at most `queue_timeout` seconds. Beyond that a query
+    fails fast with Overloaded instead of piling more work onto a saturated
+    cluster. A `max_in_flight` of 0 disables the budget.
+
+    Counters and waiter events rather than an anyio.Semaphore: slots are
+    handed over directly on release, and nothing is bound to an event loop
+    at import.
+    """
+
+    def __init__(self, *, max_in_flight: int, max_queue: int, queue_timeout: float):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters: deque[anyio.Event] = deque()
+        self.shed = 0
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def _acquire(self, timeout: float | None) -> None:
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            return
+        granted = anyio.Event()
+        self._waiters.append(granted)
+        try:
+            with anyio.fail_after(timeout):
+                await granted.wait()
+        except BaseException:
+            if granted.is_set():
+                # Handed a slot just as we gave up: pass it on.
+                self._release()
+            else:
+                self._waiters.remove(granted)
+            raise
+
+    def _release(self) -> None:
+        if self._waiters:
+            self._waiters.popleft().set()
+        else:
+            self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self, *, shed: bool = True):
+        """Hold one in-flight slot for the block.
+
+        With `shed` off the caller waits as long as it takes, regardless of
+        the queue bound: for work that has already been admitted, such as the
+        later pages of a streaming export.
+        """
+        if self.max_in_flight <= 0:
+            yield
+            return
+        if not shed:
+            await self._acquire(None)
+        elif self.in_flight >= self.max_in_flight and self.waiting >= self.max_queue:
+            self.shed += 1
+            raise Overloaded(self.queue_timeout)
+        else:
+            try:
+                await self._acquire(self.queue_timeout)
+            except TimeoutError:
+                self.shed += 1
+                raise Overloaded(self.queue_timeout) from None
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self) -> dict:
+        return {"in_flight": self.in_flight, "waiting": self.waiting, "shed": self.shed}
+
+
+class TokenBucket:
+    def __init__(self, *, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now: float, cost: float = 1.0) -> float:
+        """Take `cost` tokens; returns 0 on success, else the seconds until there are enough."""
+        cost = min(cost, self.burst)
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+
+def _size_cost(size, per: int = 100) -> float:
+    try:
+        return 1 + max(int(size), 0) / per
+    except (TypeError, ValueError):
+        return 1.0
+
+
+def page_size_cost(scope) -> float:
+    """Tokens a request takes: one, plus one per 100 results asked for with `size`.
+
+    Page size dominates both the ES fetch and the BE's parsing and encoding,
+    so a client paging 1000 samples at a time spends its budget ten times as
+    fast as one paging 10. With `fields` projecting the hits down, each hit
+    is a fraction of a document, so it is one per 1000 instead: the FE's
+    taxId-only expansion of a taxonomy filter (size=10000) costs 11.
+    """
+    params = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+    if "size" not in params:
+        return 1.0
+    return _size_cost(params["size"], 1000 if params.get("fields") else 100)
+
+
+def _json_object(body: bytes) -> dict:
+    try:
+        value = json.loads(body)
+    except ValueError:
+        return {}
+    return value if isinstance(value, dict) else {}
+
+
+def batch_cost(body: bytes) -> float:
+    """A /_batch body costs what its sub-queries would as separate GETs."""
+    queries = _json_object(body).get("queries")
+    if not isinstance(queries, dict) or not queries:
+        return 1.0
+    return sum(
+        _size_cost(query.get("params", {}).get("size", 0)) if isinstance(query, dict) else 1.0
+        for query in queries.values()
+    )
+
+
+def mget_cost(body: bytes) -> float:
+    """An _mget body costs one, plus one per 100 ids, like a page of that size."""
+    ids = _json_object(body).get("ids")
+    return _size_cost(len(ids)) if isinstance(ids, list) else 1.0
+
+
+# Scope key marking a request the BE makes to itself (see warmup.py). Only
+# in-process callers can set scope keys, so clients cannot claim it.
+INTERNAL_REQUEST = "aegis.internal"
+
+# Headers of a trusted server-side caller (the Dash FE): the shared token, and
+# the end user it is calling for. See AdmissionMiddleware.
+CLIENT_TOKEN_HEADER = b"x-client-token"
+END_USER_HEADER = b"x-end-user"
+
+# Requests turned away by AdmissionMiddleware, by reason.
+rejected = {"rate": 0, "concurrency": 0}
+
+
+class AdmissionMiddleware:
+    """Per-client rate and concurrency limits, answered with 429 and Retry-After.
+
+    Clients are told apart by `client_header` when set (the rightmost entry,
+    i.e. the address our proxy saw, for X-Forwarded-For style lists) and by
+    the peer address otherwise. Each client gets a token bucket refilled at
+    `rate` tokens per second up to `burst`; a request takes `cost(scope)`
+    tokens (one by default). POSTs to a path in `priced_bodies` are priced
+    from their body instead: it is read first, then replayed to the app.
+    Each client may also have at most
+    `max_client_in_flight` requests at a time. Buckets are kept for the
+    `max_clients` most recently seen clients; one that is dropped starts again
+    full. `exempt` paths (readiness probes) and internal requests skip the
+    checks.
+
+    A server calling on behalf of many users, such as the FE, would otherwise
+    be one client. When it sends `trusted_token` in X-Client-Token, each
+    X-End-User value it passes is a client of its own; its requests without
+    one are not limited per client. The ES budget still applies.
+    """
+
+    def __init__(
+        self, app, *, rate: float, burst: float, max_client_in_flight: int,
+        client_header: str = "", max_clients: int = 10000, exempt: tuple[str, ...] = (), cost=None,
+        priced_bodies: dict | None = None, trusted_token: str = "", clock=time.monotonic,
+    ):
+        self.app = app
+        self.rate = rate
+        self.burst = burst
+        self.max_client_in_flight = max_client_in_flight
+        self.client_header = client_header.lower().encode()
+        self.max_clients = max_clients
+        self.exempt = exempt
+        self.cost = cost
+        self.priced_bodies = priced_bodies or {}
+        self.trusted_token = trusted_token.encode()
+        self._clock = clock
+        self._buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+        self._in_flight: dict[str, int] = {}
+
+    def _client(self, scope) -> str | None:
+        """The key a request is limited under; None for a trusted caller's own requests."""
+        headers = dict(scope["headers"])
+        token = headers.get(CLIENT_TOKEN_HEADER)
+        if self.trusted_token and token is not None and hmac.compare_digest(token, self.trusted_token):
+            end_user = headers.get(END_USER_HEADER)
+            return "end-user " + end_user.decode("latin-1").strip() if end_user else None
+        if self.client_header in headers:
+            return headers[self.client_header].decode("latin-1").split(",")[-1].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    def _take(self, client: str, cost: float) -> float:
+        now = self._clock()
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = TokenBucket(rate=self.rate, burst=self.burst, now=now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+        return bucket.take(now, cost)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exempt) or scope.get(INTERNAL_REQUEST):
+            await self.app(scope, receive, send)
+            return
+        client = self._client(scope)
+        if client is None:
+            await self.app(scope, receive, send)
+            return
+
+        if self.rate > 0:
+            price_body = self.priced_bodies.get(scope["path"]) if scope["method"] == "POST" else None
+            if price_body is not None:
+                body, receive = await _buffer_body(receive)
+                cost = price_body(body)
+            else:
+                cost = self.cost(scope) if self.cost else 1.0
+            wait = self._take(client, cost)
+            if wait:
+                rejected["rate"] += 1
+                await _reject(send, 429, "Too many requests", wait)
+                return
+
+        in_flight = self._in_flight.get(client, 0)
+        if self.max_client_in_flight and in_flight >= self.max_client_in_flight:
+            rejected["concurrency"] += 1
+            await _reject(send, 429, "Too many concurrent requests", 1)
+            return
+
+        self._in_flight[client] = in_flight + 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            remaining = self._in_flight[client] - 1
+            if remaining:
+                self._in_flight[client] = remaining
+            else:
+                del self._in_flight[client]
+
+
+async def _buffer_body(receive):
+    """Read the whole request body; returns it and a `receive` that replays it."""
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            # Disconnected: let the app see that instead of a body.
+            pending = message
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            pending = None
+            break
+    body = b"".join(chunks)
+    replayed = False
+
+    async def replay():
+        nonlocal replayed
+        if not replayed:
+            replayed = True
+            if pending is not None:
+                return pending
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return body, replay
+
+
+async def _reject(send, status: int, detail: str, retry_after: float) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+# Shared by every ES call in the process (see metrics.timed_es_call).
+es_budget = EsBudget(
+    max_in_flight=int(os.getenv("ES_MAX_IN_FLIGHT", "32")),
+    max_queue=int(os.getenv("ES_MAX_QUEUE", "64")),
+    queue_timeout=float(os.getenv("ES_QUEUE_TIMEOUT_SECONDS", "2")),
+)
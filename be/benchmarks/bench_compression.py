@@ -0,0 +1,141 @@
+"""Bytes-on-wire vs CPU for the response compression settings in compression.py.
+
+Builds payloads shaped like the heaviest responses (`/api/samples?size=1000`
+and a `/api/data_portal` page with full assemblies/annotations arrays), then
+for each gzip level and brotli quality reports the compressed size, the time
+to compress and decompress, and the resulting end-to-end time at a few link
+speeds. Run from be/:
+
+    python benchmarks/bench_compression.py [--repeat N]
+"""
+import argparse
+import json
+import random
+import sys
+import time
+import zlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from compression import brotli  # noqa: E402
+
+# Link speeds in bytes per second.
+LINKS = {"10Mbit": 10e6 / 8, "100Mbit": 100e6 / 8}
+
+
+def samples_page(n=1000, seed=0):
+    rng = random.Random(seed)
+    countries = ["United Kingdom", "Germany", "Spain", "Brazil", "Kenya", "Japan"]
+    results = []
+    for i in range(n):
+        results.append({
+            "accession": f"SAMEA{7522340 + i}",
+            "taxId": rng.randint(1000, 3000000),
+            "scientificName": rng.choice(["Hirudo medicinalis", "Apis mellifera", "Quercus robur"]),
+            "commonName": rng.choice(["medicinal leech", "honey bee", None]),
+            "trackingSystem": rng.choice(["COPO", "ERGA"]),
+            "organismPart": rng.choice(["WHOLE ORGANISM", "LEAF", "MUSCLE"]),
+            "lifestage": "adult",
+            "sex": rng.choice(["male", "female", "not applicable"]),
+            "collectedBy": "Darwin Tree of Life Sampling Team",
+            "collectionDate": f"2021-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "locality": "Wytham Woods, Oxfordshire",
+            "country": rng.choice(countries),
+            "habitat": "woodland",
+            "collectingInstitution": "University of Oxford",
+            "location": {"lat": rng.uniform(-60, 70), "lon": rng.uniform(-180, 180)},
+            "tolid": f"ilHirMedi{i % 9}",
+            "derivedFrom": f"SAMEA{7522000 + i // 3}",
+            "sraAccession": f"ERS{5000000 + i}",
+            "insdcFirstPublic": "2021-06-01T00:00:00Z",
+        })
+    return {"total": 250000, "start": 0, "size": n, "results": results, "aggregations": {}}
+
+
+def data_portal_page(n=100, seed=1):
+    rng = random.Random(seed)
+    results = []
+    for i in range(n):
+        results.append({
+            "taxId": 6344 + i,
+            "scientificName": f"Species {i}",
+            "commonName": None,
+            "phylogeny": {"kingdom": "Metazoa", "phylum": "Annelida", "class": "Clitellata", "order": "Arhynchobdellida"},
+            "currentStatus": "Annotation Complete",
+            "currentStatusOrder": 4,
+            "rawData": [
+                {"accession": f"ERR{9000000 + i * 20 + j}", "instrumentPlatform": "PACBIO_SMRT",
+                 "libraryStrategy": "WGS", "firstPublic": "2022-01-01"}
+                for j in range(rng.randint(5, 20))
+            ],
+            "assemblies": [
+                {"accession": f"GCA_{900000000 + i * 5 + j}.1", "assemblyName": f"ilSpecies{i}.{j}",
+                 "description": "Chromosome-level genome assembly", "version": "1"}
+                for j in range(rng.randint(1, 5))
+            ],
+            "annotations": [
+                {"accession": f"GCA_{900000000 + i}.1", "annotation": {"GTF": "https://ftp.ensembl.org/x.gtf.gz"},
+                 "proteins": {"FASTA": "https://ftp.ensembl.org/x.fa.gz"}}
+            ],
+            "sampleCount": rng.randint(1, 400),
+            "locations": [{"lat": rng.uniform(-60, 70), "lon": rng.uniform(-180, 180)} for _ in range(rng.randint(1, 30))],
+            "countries": ["United Kingdom", "Spain"],
+        })
+    return {"total": 5000, "start": 0, "size": n, "results": results, "aggregations": {}}
+
+
+def gzip_codec(level):
+    def compress(data):
+        c = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return c.compress(data) + c.flush()
+    return compress, lambda data: zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+def brotli_codec(quality):
+    return (lambda data: brotli.compress(data, quality=quality)), brotli.decompress
+
+
+def best_of(fn, arg, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(arg)
+        best = min(best, time.perf_counter() - t0)
+    return out, best
+
+
+def report(name, body, repeat):
+    print(f"\n{name}: {len(body):,} bytes uncompressed")
+    header = f"{'codec':<10}{'bytes':>12}{'ratio':>8}{'comp ms':>10}{'decomp ms':>11}"
+    header += "".join(f"{link + ' ms':>14}" for link in LINKS)
+    print(header)
+
+    rows = [("identity", None, None)]
+    rows += [(f"gzip-{level}", *gzip_codec(level)) for level in range(1, 10)]
+    if brotli is not None:
+        rows += [(f"br-{quality}", *brotli_codec(quality)) for quality in range(0, 12)]
+    for label, compress, decompress in rows:
+        if compress is None:
+            wire, comp_s, decomp_s = body, 0.0, 0.0
+        else:
+            wire, comp_s = best_of(compress, body, repeat)
+            _, decomp_s = best_of(decompress, wire, repeat)
+        line = f"{label:<10}{len(wire):>12,}{len(body) / len(wire):>8.1f}{comp_s * 1e3:>10.2f}{decomp_s * 1e3:>11.2f}"
+        for rate in LINKS.values():
+            line += f"{(comp_s + len(wire) / rate + decomp_s) * 1e3:>14.1f}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="Timing runs per codec; the best is reported")
+    args = parser.parse_args()
+    if brotli is None:
+        print("brotli is not installed; reporting gzip only")
+    report("/api/samples?size=1000", json.dumps(samples_page()).encode(), args.repeat)
+    report("/api/data_portal?size=100", json.dumps(data_portal_page()).encode(), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
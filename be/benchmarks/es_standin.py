@@ -0,0 +1,191 @@
+"""A local Elasticsearch stand-in for benchmarks, plugged in as an elastic_transport node.
+
+`standin_client()` returns a real AsyncElasticsearch whose node class answers
+from recorded responses (see load.py --record) after a configurable latency,
+so request building, the client's JSON handling and the BE's parsing and
+serialization all run as in production while ES itself costs a fixed,
+repeatable delay. Requests with no recording get a synthetic response of the
+right shape, generated from the same documents as bench_compression.py.
+
+Recordings are keyed on the method, the path (ids elided) and the query
+shape (literals elided, as in the slow-query log), so they keep matching
+when only parameter values change.
+"""
+import base64
+import json
+import random
+import re
+import time
+
+import anyio
+from elastic_transport import ApiResponseMeta, BaseAsyncNode, HttpHeaders
+from elastic_transport._node import NodeApiResponse
+from elasticsearch import AsyncElasticsearch
+
+from bench_compression import data_portal_page, samples_page
+from slow_queries import fingerprint, query_shape
+
+_DOC_PATH = re.compile(r"^/([^/]+)/_doc/[^/]+$")
+
+SAMPLE_DOCS = samples_page(n=1000)["results"]
+DATA_PORTAL_DOCS = [
+    {**doc, "bioSamplesStatus": "Done", "rawDataStatus": "Done", "assembliesStatus": "Done", "annotationStatus": None}
+    for doc in data_portal_page(n=200)["results"]
+]
+
+
+def _documents(index: str) -> list[dict]:
+    return DATA_PORTAL_DOCS if index.startswith("data_portal") else SAMPLE_DOCS
+
+
+def request_key(method: str, target: str, body) -> str:
+    path = _DOC_PATH.sub(r"/\1/_doc/{id}", target.split("?", 1)[0])
+    return f"{method} {path} {fingerprint(query_shape(body))}"
+
+
+def decode_body(body: bytes | None):
+    if not body:
+        return None
+    text = body.decode()
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        # msearch: newline-delimited header/body pairs.
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def _terms_buckets(field: str, n: int = 10) -> dict:
+    keys = [6344 + i for i in range(n)] if field == "taxId" else [f"{field}-{i}" for i in range(n)]
+    return {
+        "doc_count_error_upper_bound": 0,
+        "sum_other_doc_count": 0,
+        "buckets": [{"key": key, "doc_count": 100 - i} for i, key in enumerate(keys)],
+    }
+
+
+def _aggregations(aggs: dict) -> dict:
+    rng = random.Random(0)
+    result = {}
+    for name, agg in aggs.items():
+        if "terms" in agg:
+            result[name] = _terms_buckets(agg["terms"]["field"])
+        elif "geotile_grid" in agg:
+            precision = agg["geotile_grid"]["precision"]
+            buckets = []
+            for i in range(200):
+                bucket = {
+                    "key": f"{precision}/{i}/{i}",
+                    "doc_count": rng.randint(1, 500),
+                    "centroid": {"location": {"lat": rng.uniform(-60, 70), "lon": rng.uniform(-180, 180)}, "count": 1},
+                }
+                for sub_name, sub_agg in agg.get("aggs", {}).items():
+                    if "top_hits" in sub_agg:
+                        doc = SAMPLE_DOCS[i % len(SAMPLE_DOCS)]
+                        source = {k: doc.get(k) for k in sub_agg["top_hits"].get("_source", doc)}
+                        bucket[sub_name] = {"hits": {"hits": [{"_source": source}]}}
+                buckets.append(bucket)
+            result[name] = {"buckets": buckets}
+        elif "geo_bounds" in agg:
+            result[name] = {"bounds": {"top_left": {"lat": 70.0, "lon": -20.0}, "bottom_right": {"lat": 35.0, "lon": 40.0}}}
+        elif "composite" in agg:
+            result[name] = {"buckets": []}
+        else:
+            result[name] = {}
+    return result
+
+
+def synthesize(method: str, target: str, body) -> tuple[dict | bytes, str]:
+    """A plausible response for any request the BE makes, and its content type."""
+    path = target.split("?", 1)[0]
+    parts = [p for p in path.split("/") if p]
+    if "_mvt" in parts:
+        return bytes(range(256)) * 8, "application/vnd.mapbox-vector-tile"
+    if parts == ["_pit"] and method == "DELETE":
+        return {"succeeded": True, "num_freed": 1}, "application/json"
+    if len(parts) == 2 and parts[1] == "_pit":
+        return {"id": f"pit-{parts[0]}"}, "application/json"
+    if parts and parts[-1] == "_msearch":
+        responses = []
+        for header, search in zip(body[::2], body[1::2]):
+            responses.append({**_search(header.get("index", "samples"), search), "status": 200})
+        return {"took": 1, "responses": responses}, "application/json"
+    if len(parts) == 3 and parts[1] == "_doc":
+        doc = _documents(parts[0])[0]
+        return {"_index": parts[0], "_id": parts[2], "found": True, "_source": doc}, "application/json"
+    if len(parts) == 2 and parts[1] == "_mget":
+        docs = _documents(parts[0])
+        return {"docs": [
+            {"_index": parts[0], "_id": str(i), "found": True, "_source": docs[n % len(docs)]}
+            for n, i in enumerate(body["ids"])
+        ]}, "application/json"
+    if parts and parts[-1] == "_search":
+        index = parts[0] if len(parts) == 2 else body.get("pit", {}).get("id", "pit-samples").removeprefix("pit-")
+        return _search(index, body or {}), "application/json"
+    return {}, "application/json"
+
+
+def _project(doc: dict, source) -> dict:
+    """Top-level `_source` includes/excludes, enough for the BE's projections."""
+    if not isinstance(source, dict):
+        return doc
+    if "includes" in source:
+        doc = {k: v for k, v in doc.items() if k in source["includes"]}
+    return {k: v for k, v in doc.items() if k not in source.get("excludes", ())}
+
+
+def _search(index: str, body: dict) -> dict:
+    docs = _documents(index)
+    size = body.get("size", 10)
+    start = body.get("from", 0)
+    source = body.get("_source")
+    hits = [
+        {"_index": index, "_id": str(i), "_source": _project(docs[i % len(docs)], source), "sort": [i]}
+        for i in range(start, start + size)
+    ] if "search_after" not in body else []
+    response = {
+        "took": 3,
+        "timed_out": False,
+        "hits": {"total": {"value": 250000, "relation": "eq"}, "hits": hits},
+    }
+    if "pit" in body:
+        response["pit_id"] = body["pit"]["id"]
+    if "aggs" in body:
+        response["aggregations"] = _aggregations(body["aggs"])
+    return response
+
+
+def standin_node_class(*, recordings: dict | None = None, latency_ms: float = 5.0, jitter_ms: float = 0.0):
+    """A node class replaying `recordings` (request_key -> response) after `latency_ms` ± `jitter_ms`."""
+    recordings = recordings or {}
+    rng = random.Random(0)
+
+    class StandinNode(BaseAsyncNode):
+        async def perform_request(self, method, target, body=None, headers=None, request_timeout=None):
+            started = time.perf_counter()
+            decoded = decode_body(body)
+            recorded = recordings.get(request_key(method, target, decoded))
+            if recorded is not None:
+                content, content_type = recorded["body"], recorded["content_type"]
+                if "json" not in content_type:
+                    content = base64.b64decode(content)
+            else:
+                content, content_type = synthesize(method, target, decoded)
+            await anyio.sleep(max(0.0, latency_ms + rng.uniform(-jitter_ms, jitter_ms)) / 1000)
+            raw = content if isinstance(content, bytes) else json.dumps(content).encode()
+            meta = ApiResponseMeta(
+                status=200,
+                http_version="1.1",
+                headers=HttpHeaders({"content-type": content_type, "x-elastic-product": "Elasticsearch"}),
+                duration=time.perf_counter() - started,
+                node=self.config,
+            )
+            return NodeApiResponse(meta, raw)
+
+        async def close(self):
+            pass
+
+    return StandinNode
+
+
+def standin_client(**node_options) -> AsyncElasticsearch:
+    return AsyncElasticsearch("http://es-standin:9200", node_class=standin_node_class(**node_options))
@@ -0,0 +1,326 @@
+"""Concurrent load against every BE route and MCP tool, with saved baselines.
+
+The app runs in-process behind httpx's ASGI transport and talks to the ES
+stand-in (es_standin.py), so results measure query building, parsing and
+serialization plus a fixed ES latency, and are comparable between runs on
+the same machine. The BE's caches are off unless --cache is given, so every
+request does the full work. Run from be/:
+
+    python benchmarks/load.py                                  # synthetic ES responses
+    python benchmarks/load.py --record recordings.json         # capture from ES_URL (one pass)
+    python benchmarks/load.py --replay recordings.json --save-baseline benchmarks/baselines/main.json
+    python benchmarks/load.py --replay recordings.json --compare benchmarks/baselines/main.json
+    python benchmarks/load.py --replay recordings.json --against origin/main   # the pre-merge check
+
+For each route the report gives throughput, p50/p95/p99 latency and CPU
+time per request. With --compare, the process exits non-zero if any route's
+p95 or CPU per request regressed by more than --tolerance against the
+baseline.
+
+Baselines only compare against runs on the machine that produced them, so
+none are committed. --against builds one on the spot instead: it checks the
+given git ref out into a temporary worktree, runs that ref's copy of this
+script with the same settings, then measures the working tree and compares.
+Run it before merging or deploying a BE change; it exits non-zero on a
+regression, so it can gate a CI job as it is.
+"""
+import argparse
+import base64
+import itertools
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import anyio
+from httpx import ASGITransport, AsyncClient
+
+HERE = Path(__file__).resolve().parent
+sys.path[:0] = [str(HERE.parent), str(HERE)]
+
+# All load comes from one in-process client; per-client admission limits
+# would turn the measurement into a measurement of the 429 path.
+os.environ.setdefault("RATE_LIMIT_PER_SECOND", "0")
+os.environ.setdefault("CLIENT_MAX_IN_FLIGHT", "0")
+os.environ.setdefault("METRICS_TOKEN", "load")
+
+from elastic_transport import AiohttpHttpNode  # noqa: E402
+from elasticsearch import AsyncElasticsearch  # noqa: E402
+
+from cache import query_cache, sample_tree_cache  # noqa: E402
+from es_standin import decode_body, request_key, standin_client  # noqa: E402
+from main import app, mcp_app  # noqa: E402
+from mcp_server import set_es_client  # noqa: E402
+from slow_queries import slow_query_log  # noqa: E402
+
+BOUNDS = "top_left_lat=60&top_left_lon=-10&bottom_right_lat=35&bottom_right_lon=30"
+
+# (name, method, path, JSON body): one scenario per route in main.py, except
+# /api/ready, which only reads a flag set by cache warming (see warmup.py).
+HTTP_SCENARIOS = [
+    ("GET /api/data_portal", "GET", "/api/data_portal?size=100", None),
+    ("GET /api/data_portal bounds", "GET", f"/api/data_portal?size=100&{BOUNDS}", None),
+    ("GET /api/data_portal fields", "GET", "/api/data_portal?size=1000&aggs=false&fields=taxId", None),
+    ("GET /api/data_portal/facets", "GET", "/api/data_portal/facets?kingdom=Metazoa", None),
+    ("GET /api/data_portal/suggest", "GET", "/api/data_portal/suggest?prefix=Aren", None),
+    ("GET /api/data_portal/export", "GET", "/api/data_portal/export?kingdom=Metazoa&fields=taxId", None),
+    ("GET /api/data_portal/{record_id}", "GET", "/api/data_portal/6344", None),
+    ("GET /api/data_portal/{tax_id}/summary", "GET", "/api/data_portal/6344/summary", None),
+    ("GET /api/data_portal/{tax_id}/sample_tree", "GET", "/api/data_portal/6344/sample_tree?expand=20", None),
+    ("POST /api/data_portal/_mget", "POST", "/api/data_portal/_mget", {"ids": list(range(6344, 6444))}),
+    ("GET /api/samples", "GET", "/api/samples?size=1000", None),
+    ("GET /api/samples/facets", "GET", "/api/samples/facets?country=Spain", None),
+    ("GET /api/samples/export", "GET", "/api/samples/export?country=Spain", None),
+    ("GET /api/samples/geo_aggregation", "GET", f"/api/samples/geo_aggregation?zoom=5&country=Spain&{BOUNDS}", None),
+    ("GET /api/samples/tiles/{z}/{x}/{y}.mvt", "GET", "/api/samples/tiles/5/16/10.mvt", None),
+    ("POST /api/samples/_mget", "POST", "/api/samples/_mget", {"ids": [f"SAMEA{i}" for i in range(100)]}),
+    ("GET /api/samples/{accession}", "GET", "/api/samples/SAMEA7522340", None),
+    ("POST /api/_batch", "POST", "/api/_batch", {"queries": {
+        "species": {"type": "search", "index": "data_portal", "params": {"size": 20}},
+        "facets": {"type": "facets", "index": "samples", "params": {}},
+        "map": {"type": "geo_aggregation", "index": "samples", "params": {"zoom": 3, "country": "Spain"}},
+    }}),
+    ("GET /api/metrics", "GET", "/api/metrics", None),
+    ("GET /api/slow_queries", "GET", "/api/slow_queries", None),
+]
+
+OPERATOR_PATHS = ("/api/metrics", "/api/slow_queries")
+
+MCP_SCENARIOS = [
+    ("search_species", {"kingdom": "Metazoa", "size": 50}),
+    ("get_species", {"tax_id": 6344}),
+    ("search_samples", {"country": "Spain", "size": 50}),
+    ("get_sample", {"accession": "SAMEA7522340"}),
+    ("aggregate_samples_by_location", {"zoom": 4, "country": "Spain"}),
+    ("build_bulk_download_command", {"kingdom": "Metazoa"}),
+]
+
+NOISE_FLOOR_MS = 1.0
+
+MCP_HEADERS = {"Accept": "application/json, text/event-stream", "Content-Type": "application/json"}
+
+# Responses within an MCP session are routed by JSON-RPC id, so concurrent
+# calls need distinct ones.
+_rpc_ids = itertools.count(1)
+
+
+class RecordingNode(AiohttpHttpNode):
+    """Passes requests to a real ES and keeps every response, keyed like the stand-in."""
+
+    recordings: dict = {}
+
+    async def perform_request(self, method, target, body=None, headers=None, **kwargs):
+        response = await super().perform_request(method, target, body=body, headers=headers, **kwargs)
+        content_type = response.meta.headers.get("content-type", "application/json")
+        if "json" in content_type:
+            recorded = json.loads(response.body)
+        else:
+            recorded = base64.b64encode(response.body).decode()
+        self.recordings[request_key(method, target, decode_body(body))] = {
+            "content_type": content_type, "body": recorded,
+        }
+        return response
+
+
+async def mcp_session(client) -> dict:
+    response = await client.post("/api/mcp/", headers=MCP_HEADERS, json={
+        "jsonrpc": "2.0", "id": 0, "method": "initialize",
+        "params": {"protocolVersion": "2025-03-26", "capabilities": {}, "clientInfo": {"name": "load", "version": "0"}},
+    })
+    headers = {**MCP_HEADERS, "mcp-session-id": response.headers["mcp-session-id"]}
+    await client.post("/api/mcp/", headers=headers, json={"jsonrpc": "2.0", "method": "notifications/initialized"})
+    return headers
+
+
+def scenarios(mcp_headers: dict):
+    for name, method, path, body in HTTP_SCENARIOS:
+        headers = {"Authorization": f"Bearer {os.environ['METRICS_TOKEN']}"} if path in OPERATOR_PATHS else None
+        yield name, dict(method=method, url=path, headers=headers, json=body)
+    for tool, arguments in MCP_SCENARIOS:
+        yield f"mcp:{tool}", dict(method="POST", url="/api/mcp/", headers=mcp_headers, json={
+            "jsonrpc": "2.0", "method": "tools/call", "params": {"name": tool, "arguments": arguments},
+        })
+
+
+async def run_scenario(client, request: dict, *, requests: int, concurrency: int, warmup: int) -> dict:
+    async def one() -> tuple[float, bool]:
+        started = time.perf_counter()
+        if "jsonrpc" in (request["json"] or {}):
+            response = await client.request(**{**request, "json": {**request["json"], "id": next(_rpc_ids)}})
+        else:
+            response = await client.request(**request)
+        ok = response.status_code < 400 and b'"isError":true' not in response.content
+        return time.perf_counter() - started, ok
+
+    for _ in range(warmup):
+        await one()
+
+    latencies, errors = [], 0
+    limiter = anyio.CapacityLimiter(concurrency)
+
+    async def worker():
+        nonlocal errors
+        async with limiter:
+            latency, ok = await one()
+        latencies.append(latency)
+        errors += not ok
+
+    cpu_started, wall_started = time.process_time(), time.perf_counter()
+    async with anyio.create_task_group() as tg:
+        for _ in range(requests):
+            tg.start_soon(worker)
+    cpu, wall = time.process_time() - cpu_started, time.perf_counter() - wall_started
+
+    q = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput": round(requests / wall, 1),
+        "p50_ms": round(q[49] * 1000, 2),
+        "p95_ms": round(q[94] * 1000, 2),
+        "p99_ms": round(q[98] * 1000, 2),
+        "cpu_ms": round(cpu / requests * 1000, 3),
+    }
+
+
+def print_report(results: dict) -> None:
+    print(f"{'route':<44}{'req':>6}{'err':>5}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'cpu ms':>9}")
+    for name, r in results.items():
+        print(f"{name:<44}{r['requests']:>6}{r['errors']:>5}{r['throughput']:>9}"
+              f"{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}{r['cpu_ms']:>9}")
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for name, base in baseline["routes"].items():
+        current = results.get(name)
+        if current is None:
+            continue
+        for metric in ("p95_ms", "cpu_ms"):
+            # Sub-millisecond routes jitter by more than any tolerance; ignore changes below the floor.
+            if current[metric] > base[metric] * (1 + tolerance) and current[metric] - base[metric] > NOISE_FLOOR_MS:
+                regressions.append(f"{name}: {metric} {base[metric]} -> {current[metric]}")
+    return regressions
+
+
+def baseline_from(ref: str, args, directory: Path) -> Path:
+    """Run `ref`'s copy of this benchmark with the same settings; returns the baseline it saved."""
+    top = Path(subprocess.run(
+        ["git", "rev-parse", "--show-toplevel"], cwd=HERE, check=True, capture_output=True, text=True,
+    ).stdout.strip())
+    worktree = directory / "ref"
+    subprocess.run(["git", "worktree", "add", "--detach", str(worktree), ref], cwd=top, check=True)
+    try:
+        be = worktree / HERE.parent.relative_to(top)
+        baseline = directory / "baseline.json"
+        command = [
+            sys.executable, str(be / "benchmarks" / "load.py"), "--save-baseline", str(baseline),
+            "--requests", str(args.requests), "--concurrency", str(args.concurrency), "--warmup", str(args.warmup),
+            "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+        ]
+        for flag, value in (("--cache", args.cache), ("--only", args.only), ("--replay", args.replay)):
+            if value:
+                command += [flag] if value is True else [flag, value]
+        print(f"Measuring {ref} for the baseline")
+        subprocess.run(command, cwd=be, check=True)
+        return baseline
+    finally:
+        subprocess.run(["git", "worktree", "remove", "--force", str(worktree)], cwd=top, check=True)
+
+
+async def main(args) -> int:
+    # Per-request INFO lines from httpx, the ES transport and MCP would dominate the CPU profile.
+    logging.disable(logging.INFO)
+    slow_query_log.threshold_ms = 0
+    if args.record:
+        RecordingNode.recordings = {}
+        es = AsyncElasticsearch(
+            [os.getenv("ES_URL")],
+            http_auth=(os.getenv("ES_USERNAME"), os.getenv("ES_PASSWORD")),
+            node_class=RecordingNode,
+        )
+    else:
+        recordings = json.loads(Path(args.replay).read_text()) if args.replay else None
+        es = standin_client(recordings=recordings, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms)
+    app.state.es_client = es
+    set_es_client(es)
+    if not args.cache:
+        query_cache.maxsize = 0
+        sample_tree_cache.maxsize = 0
+
+    results = {}
+    try:
+        async with mcp_app.router.lifespan_context(app):
+            async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+                mcp_headers = await mcp_session(client)
+                for name, request in scenarios(mcp_headers):
+                    if args.only and args.only not in name:
+                        continue
+                    if args.record:
+                        await client.request(**request)
+                        continue
+                    results[name] = await run_scenario(
+                        client, request, requests=args.requests, concurrency=args.concurrency, warmup=args.warmup,
+                    )
+    finally:
+        await es.close()
+
+    if args.record:
+        Path(args.record).write_text(json.dumps(RecordingNode.recordings))
+        print(f"Recorded {len(RecordingNode.recordings)} responses to {args.record}")
+        return 0
+
+    print_report(results)
+    settings = {k: getattr(args, k) for k in ("requests", "concurrency", "latency_ms", "jitter_ms", "cache", "replay")}
+    if args.save_baseline:
+        Path(args.save_baseline).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.save_baseline).write_text(json.dumps({"settings": settings, "routes": results}, indent=2))
+        print(f"Baseline saved to {args.save_baseline}")
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if baseline["settings"] != settings:
+            print(f"Warning: baseline was taken with {baseline['settings']}")
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.compare}")
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per route")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight per route")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests per route first")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Stand-in ES latency")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +/- jitter on the latency")
+    parser.add_argument("--cache", action="store_true", help="Keep the query cache on")
+    parser.add_argument("--only", help="Run only routes whose name contains this")
+    parser.add_argument("--replay", help="Recordings to answer from (default: synthetic responses)")
+    parser.add_argument("--record", help="Capture responses from the real ES (ES_URL etc.) to this file")
+    parser.add_argument("--save-baseline", help="Write the results here")
+    parser.add_argument("--compare", help="Baseline to compare against")
+    parser.add_argument("--against", help="Git ref to measure first and compare against (e.g. origin/main)")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative p95/CPU increase")
+    return parser.parse_args(argv)
+
+
+def run(args) -> int:
+    if not args.against:
+        return anyio.run(main, args)
+    if args.replay:
+        args.replay = str(Path(args.replay).resolve())
+    with tempfile.TemporaryDirectory() as directory:
+        args.compare = str(baseline_from(args.against, args, Path(directory)))
+        return anyio.run(main, args)
+
+
+if __name__ == "__main__":
+    sys.exit(run(parse_args()))
@@ -88,9 +88,9 @@ aegis-download --type raw-data --kingdom Animalia --dry-run
 | 2 | Invalid arguments |
 | 3 | BE unreachable / planning aborted |
 
-## Pagination ceiling
+## Pagination
 
-The AEGIS BE caps result-set pagination at 10 000 records (Elasticsearch `index.max_result_window`). If your filter matches more, the tool exits with a clear error — narrow the filter (e.g. add `--order` or `--family`) and retry.
+The tool pages through the AEGIS BE with cursors (`cursor`/`next_cursor`), so filters matching more than 10 000 records download in full. Against an older BE without cursor support, which refuses the `cursor` param with a 422, the tool retries with plain `start`/`size` paging; that is capped at 10 000 records (Elasticsearch `index.max_result_window`); if your filter matches more, the tool exits with a clear error — narrow the filter (e.g. add `--order` or `--family`) and retry.
 
 ## Development
 
@@ -0,0 +1,362 @@
+# be/cache.py
+import fcntl
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import anyio
+
+logger = logging.getLogger(__name__)
+
+
+class SharedStore:
+    """A TTL key/value store in one SQLite file that every worker process opens.
+
+    On tmpfs (/dev/shm) this is shared memory with SQLite doing the locking:
+    a result one worker fetched from ES is a hit for all the others. Values
+    are pickled, so the file must only be writable by the BE itself. Keys are
+    scoped by `scope` (the index generation), so a worker that has seen an
+    alias repoint stops reading results for the old indices without flushing
+    what the others are still using; those simply expire.
+
+    SQLite and pickling run in worker threads, never on the event loop. A
+    write that would wait on another worker's lock is skipped, as is a value
+    over `max_value_bytes`; beyond `max_bytes` in all, the entries closest to
+    expiry are dropped. Failures are misses or skipped writes, logged once
+    and then only counted.
+    """
+
+    # Seconds a write may wait for another worker's lock before giving up.
+    BUSY_TIMEOUT = 0.005
+
+    def __init__(self, path: str, *, max_bytes: int, max_value_bytes: int, clock=time.time):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_value_bytes = max_value_bytes
+        self.scope = ""
+        self._clock = clock
+        self._threads = threading.local()
+        self._unpruned_bytes = 0
+        self._logged_failure = False
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.errors = 0
+
+    def _db(self) -> sqlite3.Connection:
+        # One connection per thread, opened lazily, so also one per worker process.
+        conn = getattr(self._threads, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.BUSY_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, expires_at REAL, size INTEGER, value BLOB)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_expiry ON entries (expires_at)")
+            self._threads.conn = conn
+        return conn
+
+    def _read(self, key: str, now: float):
+        row = self._db().execute(
+            "SELECT value, expires_at FROM entries WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        return None if row is None else (pickle.loads(row[0]), row[1] - now)
+
+    def _write(self, key: str, value, expires_at: float, prune: bool) -> int:
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_value_bytes:
+            return 0
+        db = self._db()
+        db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", (key, expires_at, len(data), data))
+        if prune:
+            db.execute("DELETE FROM entries WHERE expires_at <= ?", (self._clock(),))
+            db.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM "
+                "(SELECT key, SUM(size) OVER (ORDER BY expires_at DESC, key) AS total FROM entries) WHERE total > ?)",
+                (self.max_bytes,),
+            )
+        return len(data)
+
+    def _failed(self, action: str, error: Exception) -> None:
+        self.errors += 1
+        if not self._logged_failure:
+            self._logged_failure = True
+            logger.warning("Shared cache %s failed; later failures are only counted", action, exc_info=error)
+
+    async def get(self, key: str) -> tuple[bool, object, float]:
+        """(hit, value, seconds left to live). A store that cannot be read is a miss."""
+        try:
+            found = await anyio.to_thread.run_sync(self._read, f"{self.scope}|{key}", self._clock())
+        except Exception as e:
+            self._failed("read", e)
+            found = None
+        if found is None:
+            self.misses += 1
+            return False, None, 0.0
+        self.hits += 1
+        return True, *found
+
+    async def set(self, key: str, value, ttl: float) -> bool:
+        """Share `value` for `ttl` seconds; False if it was skipped or failed."""
+        # ES client responses carry transport metadata; only the body is shared.
+        value = getattr(value, "body", value)
+        prune = self._unpruned_bytes >= self.max_bytes // 10
+        if prune:
+            self._unpruned_bytes = 0
+        try:
+            size = await anyio.to_thread.run_sync(
+                self._write, f"{self.scope}|{key}", value, self._clock() + ttl, prune,
+            )
+        except sqlite3.OperationalError as e:
+            if e.sqlite_errorcode == sqlite3.SQLITE_BUSY:
+                # Another worker holds the write lock: skip sharing this one.
+                self.skipped += 1
+            else:
+                self._failed("write", e)
+            return False
+        except Exception as e:
+            self._failed("write", e)
+            return False
+        if not size:
+            self.skipped += 1
+        self._unpruned_bytes += size
+        return bool(size)
+
+    async def set_eventually(self, key: str, value, ttl: float, *, attempts: int = 20) -> bool:
+        """`set`, retried for about a second: for the few writes other workers wait on."""
+        for _ in range(attempts):
+            if await self.set(key, value, ttl):
+                return True
+            await anyio.sleep(0.05)
+        return False
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "skipped": self.skipped, "errors": self.errors}
+
+
+class LeadLock:
+    """An exclusive flock on a file beside the shared store.
+
+    The worker holding it is the lead: the only one that builds the geotile
+    pyramid and warms the caches, publishing both for the others (see
+    main.prime_caches). The kernel drops the lock when its holder exits, so
+    another worker takes over the next time it asks.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: int | None = None
+
+    def held(self) -> bool:
+        """Whether this process holds the lock, taking it if it is free."""
+        if self._fd is None:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+            self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after `ttl` seconds.
+
+    get/set never await, so on a single event loop they cannot interleave and
+    need no lock. A `maxsize` or `ttl` of 0 disables caching.
+
+    With `shared`, fetch/put also go to a store the other worker processes
+    fill (see SharedStore): a local miss falls through to it, and an entry
+    found there is kept locally for the rest of its life. `namespace` keeps
+    caches apart within the store. get/set stay local.
+    """
+
+    def __init__(self, *, maxsize: int, ttl: float, clock=time.monotonic, shared: SharedStore | None = None, namespace: str = ""):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self.shared = shared
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0 and self.ttl > 0
+
+    def _local(self, key: str) -> tuple[bool, object]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > self._clock():
+                self._entries.move_to_end(key)
+                return True, value
+            del self._entries[key]
+        return False, None
+
+    def get(self, key: str) -> tuple[bool, object]:
+        hit, value = self._local(key)
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return hit, value
+
+    async def fetch(self, key: str) -> tuple[bool, object]:
+        """get, falling through to the shared store on a local miss."""
+        if self.shared is None or not self.enabled:
+            return self.get(key)
+        hit, value = self._local(key)
+        if not hit:
+            hit, value, ttl = await self.shared.get(f"{self.namespace}|{key}")
+            if hit:
+                self._store(key, value, ttl)
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return hit, value
+
+    def set(self, key: str, value) -> None:
+        if not self.enabled:
+            return
+        self._store(key, value, self.ttl)
+
+    async def put(self, key: str, value) -> None:
+        """set, also writing the shared store."""
+        self.set(key, value)
+        if self.shared is not None and self.enabled:
+            await self.shared.set(f"{self.namespace}|{key}", value, self.ttl)
+
+    def _store(self, key: str, value, ttl: float) -> None:
+        self._entries[key] = (self._clock() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class _Flight:
+    def __init__(self):
+        self.done = anyio.Event()
+        self.result = None
+        self.error: Exception | None = None
+        self.abandoned = False
+
+
+class SingleFlight:
+    """Coalesce concurrent identical calls: the first caller runs `fn`, the rest await its outcome.
+
+    If the running caller is cancelled, one of the waiters takes over rather
+    than inheriting the cancellation.
+    """
+
+    def __init__(self):
+        self._flights: dict[str, _Flight] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn):
+        while True:
+            flight = self._flights.get(key)
+            if flight is None:
+                break
+            self.coalesced += 1
+            await flight.done.wait()
+            if flight.abandoned:
+                self.coalesced -= 1
+                continue
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        flight = self._flights[key] = _Flight()
+        self.executed += 1
+        try:
+            flight.result = await fn()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        except BaseException:
+            flight.abandoned = True
+            raise
+        finally:
+            del self._flights[key]
+            flight.done.set()
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._flights), "executed": self.executed, "coalesced": self.coalesced}
+
+
+def cache_key(*parts) -> str:
+    """Normalise a search body (plus index etc.) into a stable key: dict order does not matter."""
+    return json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+
+
+# Set when several worker processes serve the BE (see serve.py); unset, each
+# process only has its own in-memory caches.
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "")
+# Half of Docker's default 64 MB /dev/shm; values over 1 MB are not shared.
+shared_store = SharedStore(
+    SHARED_CACHE_PATH,
+    max_bytes=int(os.getenv("SHARED_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    max_value_bytes=int(os.getenv("SHARED_CACHE_MAX_VALUE_BYTES", str(1024 * 1024))),
+) if SHARED_CACHE_PATH else None
+
+# What the lead worker publishes for the others: the geotile pyramid, whose
+# levels run to megabytes, and the end of each warm-up pass. Kept apart from
+# shared_store so cached results cannot push them out.
+lead_store = SharedStore(
+    SHARED_CACHE_PATH + ".lead",
+    max_bytes=int(os.getenv("LEAD_STORE_MAX_BYTES", str(16 * 1024 * 1024))),
+    max_value_bytes=int(os.getenv("LEAD_STORE_MAX_VALUE_BYTES", str(8 * 1024 * 1024))),
+) if SHARED_CACHE_PATH else None
+lead_lock = LeadLock(SHARED_CACHE_PATH + ".lock") if SHARED_CACHE_PATH else None
+
+
+def is_lead_worker() -> bool:
+    """True in the worker that builds and warms for all: the only one, or the holder of lead_lock."""
+    return lead_lock is None or lead_lock.held()
+
+
+# ES responses for read-only aliases; flushed whenever an alias is repointed.
+query_cache = TTLCache(
+    maxsize=int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "1024")),
+    ttl=float(os.getenv("QUERY_CACHE_TTL_SECONDS", "300")),
+    shared=shared_store,
+    namespace="query",
+)
+
+# Built sample derivation trees, one per species (see sample_tree.py). Kept
+# apart from query_cache so large species' trees do not evict search results.
+sample_tree_cache = TTLCache(
+    maxsize=int(os.getenv("SAMPLE_TREE_CACHE_MAX_ENTRIES", "128")),
+    ttl=float(os.getenv("SAMPLE_TREE_CACHE_TTL_SECONDS", "3600")),
+    shared=shared_store,
+    namespace="sample_tree",
+)
+
+# In-flight ES queries, keyed like query_cache.
+search_flights = SingleFlight()
@@ -0,0 +1,131 @@
+# be/compression.py
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip alone still works.
+    brotli = None
+
+
+def choose_encoding(accept_encoding: str | None) -> str | None:
+    """Pick "br" or "gzip" from an Accept-Encoding header, preferring br when both are acceptable."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    wildcard = accepted.get("*", 0.0)
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+class _Gzip:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, flush: bool) -> bytes:
+        out = self._compressor.compress(data)
+        return out + self._compressor.flush(zlib.Z_SYNC_FLUSH) if flush else out
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _Brotli:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes, flush: bool) -> bytes:
+        out = self._compressor.process(data)
+        return out + self._compressor.flush() if flush else out
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class CompressionMiddleware:
+    """Content-negotiated gzip/brotli for buffered and streaming responses.
+
+    Single-message bodies under `minimum_size` go out as-is. Streams are
+    compressed incrementally; Server-Sent Events (the MCP transport) are
+    flushed per message so events are not held back by the compressor.
+    """
+
+    def __init__(self, app, *, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        flush_each = False
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, flush_each, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if "content-encoding" in headers or message["status"] in (204, 304):
+                    passthrough = True
+                    await send(message)
+                    return
+                flush_each = headers.get("content-type", "").startswith("text/event-stream")
+                # Hold the start until the first body chunk tells us the size.
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(scope=start_message)
+                headers.add_vary_header("Accept-Encoding")
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = _Brotli(self.brotli_quality) if encoding == "br" else _Gzip(self.gzip_level)
+                headers["Content-Encoding"] = encoding
+                if "content-length" in headers:
+                    del headers["Content-Length"]
+                await send(start_message)
+
+            if more_body:
+                chunk = compressor.compress(body, flush=flush_each)
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            else:
+                chunk = compressor.compress(body, flush=False) + compressor.finish()
+                await send({"type": "http.response.body", "body": chunk, "more_body": False})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,214 @@
+# be/geo_pyramid.py
+import math
+import time
+
+import anyio
+
+from metrics import timed_es_call
+from models import GeoCluster, GeoAggregationResponse
+
+# The precision range samples_geo_aggregation_query clamps zoom + 2 to.
+MIN_PRECISION = 4
+MAX_PRECISION = 12
+# geotile_grid's default bucket cap; sliced answers are capped the same way.
+MAX_CLUSTERS = 10000
+COMPOSITE_PAGE_SIZE = 10000
+
+
+def _tile_bounds(key: str) -> tuple[float, float, float, float]:
+    """(west, south, east, north) of a "z/x/y" geotile key."""
+    z, x, y = (int(p) for p in key.split("/"))
+    n = 2 ** z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360 - 180, lat(y + 1), (x + 1) / n * 360 - 180, lat(y)
+
+
+def _levels_from_rows(rows: dict) -> dict:
+    """Rebuild published levels; the rows were validated by the worker that built them."""
+    return {
+        precision: [
+            (_tile_bounds(key), GeoCluster.model_construct(lat=lat, lon=lon, count=count, key=key))
+            for lat, lon, count, key in level
+        ]
+        for precision, level in rows.items()
+    }
+
+
+def _lon_ranges(west: float, east: float) -> list[tuple[float, float]]:
+    """Normalise a viewport's longitude span, splitting it if it crosses the antimeridian."""
+    if east - west >= 360:
+        return [(-180.0, 180.0)]
+    west = (west + 180) % 360 - 180
+    east = (east + 180) % 360 - 180
+    if west <= east:
+        return [(west, east)]
+    return [(west, 180.0), (-180.0, east)]
+
+
+class GeoPyramid:
+    """Unfiltered geotile clusters for every precision, held in memory.
+
+    Built off the request path (see main.py's lifespan). Until a build has
+    completed for the current index generation, `clusters` returns None and
+    callers fall back to ES. With several workers only the lead builds; it
+    publishes the levels to a SharedStore and the others load them from there.
+    """
+
+    def __init__(self):
+        # precision -> [(tile bounds, cluster)], largest clusters first.
+        self._levels: dict[int, list[tuple[tuple, GeoCluster]]] = {}
+        self._built_at: float | None = None
+        self._building = False
+        self._pending = False
+        # Build time (wall clock) of the levels held, and whether they are published.
+        self._stamp: float | None = None
+        self.published = False
+
+    @property
+    def ready(self) -> bool:
+        return bool(self._levels)
+
+    @property
+    def building(self) -> bool:
+        return self._building
+
+    def age(self) -> float:
+        """Seconds since the levels were swapped in; infinite while there are none."""
+        if not self._levels or self._built_at is None:
+            return math.inf
+        return time.monotonic() - self._built_at
+
+    def clear(self) -> None:
+        self._levels = {}
+        self._stamp = None
+        self.published = False
+
+    async def build(self, es_client, *, index: str, generation) -> bool:
+        """Aggregate every precision and swap the result in; True if it was.
+
+        Asked for while a build is running, it returns at once and the running
+        build goes round once more when done (an alias repoint may have made it
+        stale). A build whose `generation()` changed meanwhile is discarded.
+        """
+        if self._building:
+            self._pending = True
+            return False
+        self._building = True
+        built = False
+        try:
+            while True:
+                self._pending = False
+                built_for = generation()
+                levels = {}
+                for precision in range(MIN_PRECISION, MAX_PRECISION + 1):
+                    clusters = await self._aggregate(es_client, index=index, precision=precision)
+                    levels[precision] = [(_tile_bounds(c.key), c) for c in clusters]
+                if generation() == built_for:
+                    self._levels = levels
+                    self._built_at = time.monotonic()
+                    self._stamp = time.time()
+                    self.published = False
+                    built = True
+                if not self._pending:
+                    return built
+        finally:
+            self._building = False
+            self._pending = False
+
+    async def publish(self, store, *, ttl: float) -> bool:
+        """Put the levels in `store` for the other workers; True once they are there."""
+        if not self._levels:
+            return False
+        stamp = self._stamp
+        rows = {p: [(c.lat, c.lon, c.count, c.key) for _, c in level] for p, level in self._levels.items()}
+        # Levels first: a worker that sees the new stamp finds them.
+        if await store.set_eventually("geo_pyramid", {"stamp": stamp, "levels": rows}, ttl):
+            self.published = await store.set_eventually("geo_pyramid_stamp", stamp, ttl) and stamp == self._stamp
+        return self.published
+
+    async def load(self, store) -> bool:
+        """Take the levels the lead worker published, if they are not the ones held; True if taken."""
+        scope = store.scope
+        found, stamp, _ = await store.get("geo_pyramid_stamp")
+        if not found or stamp == self._stamp:
+            return False
+        found, published, _ = await store.get("geo_pyramid")
+        if not found or published["stamp"] != stamp:
+            return False
+        levels = await anyio.to_thread.run_sync(_levels_from_rows, published["levels"])
+        if store.scope != scope:
+            # An alias repoint meanwhile: these levels are for the old indices.
+            return False
+        self._levels = levels
+        self._built_at = time.monotonic() - max(time.time() - stamp, 0.0)
+        self._stamp = stamp
+        return True
+
+    @staticmethod
+    async def _aggregate(es_client, *, index: str, precision: int) -> list[GeoCluster]:
+        clusters = []
+        after = None
+        while True:
+            composite = {
+                "size": COMPOSITE_PAGE_SIZE,
+                "sources": [{"tile": {"geotile_grid": {"field": "location", "precision": precision}}}],
+            }
+            if after is not None:
+                composite["after"] = after
+            body = {
+                "size": 0,
+                "aggs": {"grid": {
+                    "composite": composite,
+                    "aggs": {"centroid": {"geo_centroid": {"field": "location"}}},
+                }},
+            }
+            response = await timed_es_call(
+                "geo_pyramid", es_client.search(index=index, body=body), body=body, shed=False,
+            )
+            grid = response["aggregations"]["grid"]
+            clusters.extend(
+                GeoCluster(
+                    lat=b["centroid"]["location"]["lat"],
+                    lon=b["centroid"]["location"]["lon"],
+                    count=b["doc_count"],
+                    key=b["key"]["tile"],
+                )
+                for b in grid["buckets"]
+            )
+            after = grid.get("after_key")
+            if not grid["buckets"] or after is None:
+                break
+        # Same order ES returns geotile_grid buckets in.
+        clusters.sort(key=lambda c: c.count, reverse=True)
+        return clusters
+
+    def clusters(self, params) -> GeoAggregationResponse | None:
+        """Answer an unfiltered geo aggregation from memory, or None if not possible.
+
+        With bounds, cells intersecting the viewport are returned whole, where
+        ES would count only the documents inside it.
+        """
+        precision = min(max(params.zoom + 2, MIN_PRECISION), MAX_PRECISION)
+        level = self._levels.get(precision)
+        if level is None:
+            return None
+        if not params.has_bounds():
+            return GeoAggregationResponse(clusters=[c for _, c in level[:MAX_CLUSTERS]])
+
+        south, north = params.bottom_right_lat, params.top_left_lat
+        lon_ranges = _lon_ranges(params.top_left_lon, params.bottom_right_lon)
+        selected = []
+        for (west, s, east, n), cluster in level:
+            if s > north or n < south:
+                continue
+            if any(west <= hi and east >= lo for lo, hi in lon_ranges):
+                selected.append(cluster)
+                if len(selected) == MAX_CLUSTERS:
+                    break
+        return GeoAggregationResponse(clusters=selected)
+
+
+geo_pyramid = GeoPyramid()
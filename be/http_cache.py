@@ -0,0 +1,91 @@
+# be/http_cache.py
+import hashlib
+import json
+from pathlib import Path
+from urllib.parse import parse_qsl
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+
+
+def source_digest(directory: Path) -> str:
+    """Digest of the modules in `directory`: changes with every deploy that changes the code."""
+    digest = hashlib.sha1()
+    for path in sorted(directory.glob("*.py")):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:12]
+
+
+def compute_etag(generation, path: str, query_string: bytes, variant: str = "") -> str:
+    """Weak ETag over the index generation, the path and the order-normalised query.
+
+    `variant` names whatever else shapes the body (build, response mode), so
+    a deploy invalidates validators even without an alias repoint. Weak
+    because the same data may go out with different content encodings.
+    """
+    params = sorted(parse_qsl(query_string.decode("latin-1"), keep_blank_values=True))
+    digest = hashlib.sha1(
+        json.dumps([generation, path, params, variant], separators=(",", ":")).encode()
+    ).hexdigest()
+    return f'W/"{digest[:20]}"'
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    opaque = etag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == opaque:
+            return True
+    return False
+
+
+class ETagMiddleware:
+    """Conditional GETs for a read-only API whose data only changes with the index generation.
+
+    `route_max_age` maps path prefixes to Cache-Control max-age seconds; the
+    longest matching prefix wins and paths matching none are left alone. While
+    the generation is unknown (empty), no validators are issued. `variant` is
+    mixed into every ETag (see compute_etag).
+    """
+
+    def __init__(self, app, *, generation, route_max_age: dict[str, int], variant: str = ""):
+        self.app = app
+        self.generation = generation
+        self.variant = variant
+        self.route_max_age = sorted(route_max_age.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def _max_age(self, path: str) -> int | None:
+        for prefix, max_age in self.route_max_age:
+            if path.startswith(prefix):
+                return max_age
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+        max_age = self._max_age(scope["path"])
+        generation = self.generation()
+        if max_age is None or not generation:
+            await self.app(scope, receive, send)
+            return
+
+        etag = compute_etag(generation, scope["path"], scope["query_string"], self.variant)
+        cache_control = f"public, max-age={max_age}"
+        if _etag_matches(Headers(scope=scope).get("if-none-match"), etag):
+            response = Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+            await response(scope, receive, send)
+            return
+
+        async def send_with_validators(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                headers = MutableHeaders(scope=message)
+                headers["ETag"] = etag
+                if "cache-control" not in headers:
+                    headers["Cache-Control"] = cache_control
+            await send(message)
+
+        await self.app(scope, receive, send_with_validators)
@@ -1,30 +1,234 @@
+import functools
+import hmac
+import json
+import logging
+import math
 import os
+import pathlib
 from contextlib import asynccontextmanager
 from typing import Annotated
 
-from fastapi import APIRouter, FastAPI, Query, Path, Request
-from fastapi.responses import JSONResponse
+import anyio
+import orjson
+from prometheus_client import CONTENT_TYPE_LATEST
+from prometheus_client.multiprocess import mark_process_dead
+from fastapi import APIRouter, Body, Depends, FastAPI, HTTPException, Query, Path, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from elasticsearch import AsyncElasticsearch
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import ValidationError
 
 from models import (
-    ElasticResponse, ElasticDetailsResponse,
-    DataPortalData, DataPortalSearchParams, DataPortalAggregationResponse,
-    SampleData, SampleSearchParams, SampleAggregationResponse,
-    GeoAggregationParams, GeoAggregationResponse,
+    ElasticResponse, ElasticDetailsResponse, ElasticMgetResponse, FacetsResponse, MgetRequest,
+    BatchQuery, BatchRequest, BatchResponse,
+    DataPortalData, DataPortalPartialData, DataPortalRecord,
+    DataPortalSearchParams, DataPortalAggregationResponse,
+    SampleData, SamplePartialData, SampleRecord,
+    SampleSearchParams, SampleAggregationResponse,
+    GeoAggregationParams, GeoAggregationResponse, SampleTileParams,
+    SuggestParams, SuggestResponse, SpeciesSummaryResponse,
+    SampleTreeParams, SampleTreeResponse,
 )
 from queries import (
-    QueryError,
+    QueryError, InvalidCursorError,
     DATA_PORTAL_INDEX, SAMPLES_INDEX,
-    elastic_search, elastic_details,
-    data_portal_search_full, samples_geo_aggregation_query,
+    elastic_search, elastic_details, elastic_mget, elastic_facets, build_query, export_search,
+    data_portal_filters, data_portal_search_full, data_portal_facets_full, data_portal_suggest,
+    samples_geo_aggregation_query, samples_vector_tile, species_summary,
+    prepare_search, prepare_facets, prepare_details, prepare_samples_geo_aggregation,
+    prepare_data_portal_search, prepare_data_portal_facets, msearch_prepared,
+    refresh_index_generation, index_generation,
 )
+from cache import is_lead_worker, lead_lock, lead_store
+from geo_pyramid import geo_pyramid
+from sample_tree import species_sample_tree
+from warmup import warmer
 from mcp_server import build_mcp_app, set_es_client
+from http_cache import ETagMiddleware, source_digest
+from compression import CompressionMiddleware
+from admission import AdmissionMiddleware, Overloaded, batch_cost, mget_cost, page_size_cost
+from metrics import PROMETHEUS_MULTIPROC_DIR, MetricsMiddleware, exposition, publish_process_metrics
+from server_timing import ServerTimingMiddleware, current_timings
+from slow_queries import set_caller, slow_query_log
 
 
+logger = logging.getLogger(__name__)
+
+# How often to re-resolve the data_portal/samples aliases. A repoint flushes
+# the query cache, so this bounds how long stale results can be served.
+ALIAS_POLL_SECONDS = float(os.getenv("ALIAS_POLL_SECONDS", "60"))
+
+# The unfiltered geotile pyramid is rebuilt on alias repoints and at this interval.
+GEO_PYRAMID_REFRESH_SECONDS = float(os.getenv("GEO_PYRAMID_REFRESH_SECONDS", "3600"))
+# While there is no pyramid (a build failed, was cut short by the warm-up
+# deadline or discarded by a repoint), another is tried this often.
+GEO_PYRAMID_RETRY_SECONDS = float(os.getenv("GEO_PYRAMID_RETRY_SECONDS", "60"))
+# With several workers, how often the others look for a pyramid the lead
+# worker has published (see prime_caches).
+GEO_PYRAMID_POLL_SECONDS = float(os.getenv("GEO_PYRAMID_POLL_SECONDS", "10"))
+
+# Opt-in: serve search/mget results straight from ES `_source` via orjson,
+# skipping per-hit Pydantic validation. Documents missing optional fields then
+# omit them instead of returning null. The OpenAPI schema is unchanged.
+FAST_RESPONSES = os.getenv("FAST_RESPONSES", "").lower() in ("1", "true", "yes")
+
+# With several workers, how often each one publishes its cache and admission
+# stats for scrapes answered by the others (see metrics.publish_process_metrics).
+METRICS_PUBLISH_SECONDS = float(os.getenv("METRICS_PUBLISH_SECONDS", "5"))
+
+# Vector tiles are fixed-address; let browsers and the CDN keep them this long.
+TILE_MAX_AGE_SECONDS = int(os.getenv("TILE_MAX_AGE_SECONDS", "3600"))
+
+# Cache-Control max-age per route prefix (longest prefix wins). Responses also
+# carry an ETag derived from the concrete indices behind the aliases, so once
+# max-age lapses a revalidation costs a bodyless 304 until the next repoint or deploy.
+CACHE_MAX_AGE_SECONDS = int(os.getenv("CACHE_MAX_AGE_SECONDS", "60"))
+ROUTE_MAX_AGE = {
+    "/api/data_portal": CACHE_MAX_AGE_SECONDS,
+    "/api/samples": CACHE_MAX_AGE_SECONDS,
+    "/api/samples/tiles/": TILE_MAX_AGE_SECONDS,
+    # Whole-index dumps: always revalidate rather than reuse silently.
+    "/api/data_portal/export": 0,
+    "/api/samples/export": 0,
+}
+# Also in every ETag: the build (BUILD_VERSION, else a digest of the BE's
+# sources) and the response mode, since both change bodies without a repoint.
+BUILD_VERSION = os.getenv("BUILD_VERSION") or source_digest(pathlib.Path(__file__).parent)
+ETAG_VARIANT = f"{BUILD_VERSION}:{'fast' if FAST_RESPONSES else 'validated'}"
+
+# Responses smaller than this go out uncompressed; gzip/brotli framing would
+# eat most of the saving. br is preferred when the client accepts it.
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+# `profile=true` (ES Profile API output in the response) is a debug tool that
+# bypasses the query cache; it needs this shared secret in X-Profile-Token and
+# is refused when it is unset.
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+
+# /api/metrics and /api/slow_queries are operator endpoints on a public path:
+# they need this shared secret as a bearer token (Prometheus'
+# `authorization.credentials`) and are refused when it is unset.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Admission control, per client (see admission.py; the process-wide ES budget
+# is configured there). The rate is in tokens per second; a request costs one
+# plus one per 100 results it pages, summed over a _batch's sub-queries (and
+# per 100 ids for _mget). The BE sits behind a proxy, so name the
+# header carrying the real client address; without one every client is the
+# proxy. A rate of 0 turns the per-client limits off.
+# The limits are per client across the whole BE. Each of the WEB_CONCURRENCY
+# worker processes (see serve.py) keeps its own buckets and enforces its share;
+# the proxy's pooled upstream connections spread a client's requests over them.
+WORKER_PROCESSES = max(int(os.getenv("WEB_CONCURRENCY", "1") or 1), 1)
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "20")) / WORKER_PROCESSES
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "60")) / WORKER_PROCESSES
+CLIENT_MAX_IN_FLIGHT = math.ceil(int(os.getenv("CLIENT_MAX_IN_FLIGHT", "8")) / WORKER_PROCESSES)
+CLIENT_IP_HEADER = os.getenv("CLIENT_IP_HEADER", "")
+# Shared with the Dash FE (its BACKEND_CLIENT_TOKEN), which calls the BE from
+# its own server for every portal user: with it, the FE's X-End-User header
+# names the client instead of the FE's address.
+TRUSTED_CLIENT_TOKEN = os.getenv("TRUSTED_CLIENT_TOKEN", "")
+
 mcp_app = build_mcp_app()
 
 
+# Published levels outlive a missed refresh; the lead keeps replacing them.
+PUBLISHED_PYRAMID_TTL_SECONDS = 2 * GEO_PYRAMID_REFRESH_SECONDS + GEO_PYRAMID_RETRY_SECONDS
+# The end of the lead's last warm-up pass, read by the others (see prime_caches).
+WARMED_KEY = "warmed"
+WARMED_TTL_SECONDS = 7 * 24 * 3600
+
+
+async def publish_geo_pyramid():
+    if lead_store is not None and await geo_pyramid.publish(lead_store, ttl=PUBLISHED_PYRAMID_TTL_SECONDS):
+        logger.info("Geotile pyramid published to the other workers")
+
+
+async def rebuild_geo_pyramid(es_client):
+    try:
+        if await geo_pyramid.build(es_client, index=SAMPLES_INDEX, generation=index_generation):
+            logger.info("Geotile pyramid rebuilt")
+            await publish_geo_pyramid()
+    except Exception:
+        logger.exception("Failed to build geotile pyramid")
+
+
+async def load_geo_pyramid():
+    try:
+        if await geo_pyramid.load(lead_store):
+            logger.info("Geotile pyramid loaded from the lead worker")
+    except Exception:
+        logger.exception("Failed to load the lead worker's geotile pyramid")
+
+
+async def mark_warmed(stats: dict) -> None:
+    if lead_store is not None:
+        await lead_store.set_eventually(WARMED_KEY, stats, WARMED_TTL_SECONDS)
+
+
+async def lead_warmed() -> dict | None:
+    """The lead worker's warm-up stats for this generation, once its pass is over."""
+    await load_geo_pyramid()
+    found, stats, _ = await lead_store.get(WARMED_KEY)
+    return stats if found else None
+
+
+async def prime_caches(es_client):
+    """Rebuild the geotile pyramid, then replay popular requests (see warmup.py).
+
+    Both run under WARMUP_TIMEOUT_SECONDS: /api/ready reports ready once the
+    first pass is over or out of time. A pyramid build cut short is retried
+    by refresh_geo_pyramid; geo_aggregation queries ES until then.
+
+    With several workers only the lead (see cache.LeadLock) does this, so ES
+    sees one pyramid build and one replay per repoint rather than one per
+    worker. The replayed results reach the others through the shared cache,
+    and the pyramid through lead_store; they wait for both before reporting
+    ready.
+    """
+    if is_lead_worker():
+        await warmer.run(app, prepare=functools.partial(rebuild_geo_pyramid, es_client), done=mark_warmed)
+    else:
+        await warmer.follow(lead_warmed)
+
+
+async def watch_index_generation(es_client, task_group):
+    while True:
+        try:
+            if await refresh_index_generation(es_client):
+                logger.info("Index aliases resolved to new indices; query cache flushed")
+                task_group.start_soon(prime_caches, es_client)
+        except Exception:
+            logger.exception("Failed to resolve index aliases")
+        await anyio.sleep(ALIAS_POLL_SECONDS)
+
+
+async def refresh_geo_pyramid(es_client):
+    while True:
+        if not is_lead_worker():
+            await anyio.sleep(GEO_PYRAMID_POLL_SECONDS)
+            await load_geo_pyramid()
+            continue
+        await anyio.sleep(min(GEO_PYRAMID_RETRY_SECONDS, GEO_PYRAMID_REFRESH_SECONDS))
+        if geo_pyramid.building:
+            continue
+        if geo_pyramid.age() >= GEO_PYRAMID_REFRESH_SECONDS:
+            await rebuild_geo_pyramid(es_client)
+        elif not geo_pyramid.published:
+            # The last publish lost out to another worker's write lock.
+            await publish_geo_pyramid()
+
+
+async def publish_metrics():
+    """Keep this worker's scrape-time metrics visible to scrapes answered by the others."""
+    while True:
+        publish_process_metrics()
+        await anyio.sleep(METRICS_PUBLISH_SECONDS)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # FastMCP's Streamable HTTP app has its own session-manager lifespan.
@@ -38,9 +242,21 @@ async def lifespan(app: FastAPI):
         app.state.es_client = es_client
         set_es_client(es_client)
         try:
-            yield
+            async with anyio.create_task_group() as tg:
+                tg.start_soon(watch_index_generation, es_client, tg)
+                tg.start_soon(refresh_geo_pyramid, es_client)
+                if PROMETHEUS_MULTIPROC_DIR:
+                    tg.start_soon(publish_metrics)
+                yield
+                tg.cancel_scope.cancel()
         finally:
             await es_client.close()
+            if lead_lock is not None:
+                # Let another worker take the lead without waiting for this process to exit.
+                lead_lock.release()
+            if PROMETHEUS_MULTIPROC_DIR:
+                # Drop this worker from the live gauges' sums.
+                mark_process_dead(os.getpid())
 
 
 # Initialize FastAPI with lifespan manager.
@@ -54,31 +270,201 @@ app = FastAPI(
     openapi_url="/api/openapi.json",
     license_info={"name": "Apache 2.0", "url": "https://www.apache.org/licenses/LICENSE-2.0.html"},
 )
-api = APIRouter(prefix="/api")
+
+
+async def tag_slow_query_caller(request: Request):
+    """Attribute slow ES calls to the route template that made them."""
+    route = request.scope.get("route")
+    set_caller(getattr(route, "path", None) or request.url.path)
+
+
+api = APIRouter(prefix="/api", dependencies=[Depends(tag_slow_query_caller)])
+# Innermost, so its phases cover only the handler's own work.
+app.add_middleware(ServerTimingMiddleware)
+app.add_middleware(ETagMiddleware, generation=index_generation, route_max_age=ROUTE_MAX_AGE, variant=ETAG_VARIANT)
+# Outside ETag, so 304s pass through untouched; like the rest it wraps the
+# mounted MCP app too.
+app.add_middleware(
+    CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE, gzip_level=GZIP_LEVEL, brotli_quality=BROTLI_QUALITY
+)
+# Refusals are tiny and should be cheap, so this sits outside compression, but
+# inside metrics so that 429s are counted.
+app.add_middleware(
+    AdmissionMiddleware,
+    rate=RATE_LIMIT_PER_SECOND,
+    burst=RATE_LIMIT_BURST,
+    max_client_in_flight=CLIENT_MAX_IN_FLIGHT,
+    client_header=CLIENT_IP_HEADER,
+    trusted_token=TRUSTED_CLIENT_TOKEN,
+    exempt=("/api/ready",),
+    cost=page_size_cost,
+    priced_bodies={"/api/_batch": batch_cost, "/api/data_portal/_mget": mget_cost, "/api/samples/_mget": mget_cost},
+)
 # Public, unauthenticated, read-only API: allow any origin but NOT credentials.
 # "*" + allow_credentials=True is the dangerous combo (Starlette reflects the
 # Origin and returns Access-Control-Allow-Credentials: true). There is no cookie
 # or auth state to share cross-origin, so credentials must stay off.
-app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=False, allow_methods=["*"], allow_headers=["*"])
+# Outside admission and ETag, so browsers can read 429s and 304s too, including
+# Retry-After.
+app.add_middleware(
+    CORSMiddleware, allow_origins=["*"], allow_credentials=False, allow_methods=["*"], allow_headers=["*"],
+    expose_headers=["Retry-After"],
+)
+# Outside compression, so latency covers it and sizes are bytes on the wire.
+app.add_middleware(MetricsMiddleware)
+
+
+class OrjsonResponse(Response):
+    """JSON encoded by orjson, with no response-model pass: for trusted results only."""
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _respond(result):
+    """Trusted (FAST_RESPONSES) results are plain dicts; send them without revalidation.
+
+    Profiled requests get the ES profiles appended and are never cached.
+    """
+    timings = current_timings()
+    if timings is not None and timings.profile:
+        content = result if isinstance(result, dict) else result.model_dump(mode="json")
+        return OrjsonResponse({**content, "profile": timings.profiles}, headers={"Cache-Control": "no-store"})
+    if isinstance(result, dict):
+        return OrjsonResponse(result)
+    return result
+
+
+def _start_profile(request: Request, params) -> None:
+    if not params.profile:
+        return
+    token = request.headers.get("x-profile-token", "")
+    if not PROFILE_TOKEN or not hmac.compare_digest(token, PROFILE_TOKEN):
+        raise HTTPException(status_code=403, detail="profile=true needs a valid X-Profile-Token")
+    current_timings().profile = True
+
+
+def require_metrics_token(request: Request) -> None:
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if not METRICS_TOKEN or scheme.lower() != "bearer" or not hmac.compare_digest(token, METRICS_TOKEN):
+        raise HTTPException(status_code=403, detail="Needs a valid bearer token (METRICS_TOKEN)")
+
+
+def _overloaded_response(exc: Overloaded) -> JSONResponse:
+    return JSONResponse(
+        status_code=503, content={"detail": str(exc)}, headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
+
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return _overloaded_response(exc)
 
 
 @app.exception_handler(QueryError)
 async def query_error_handler(request: Request, exc: QueryError):
+    if isinstance(exc.__cause__, Overloaded):
+        return _overloaded_response(exc.__cause__)
     return JSONResponse(status_code=500, content={"detail": str(exc)})
 
 
+@app.exception_handler(InvalidCursorError)
+async def invalid_cursor_handler(request: Request, exc: InvalidCursorError):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+
+@api.get("/metrics", response_class=Response, include_in_schema=False, dependencies=[Depends(require_metrics_token)])
+async def metrics():
+    """Prometheus exposition: route/MCP tool latency, ES took vs wall time, payload sizes, cache ratios."""
+    return Response(exposition(), media_type=CONTENT_TYPE_LATEST)
+
+
+@api.get("/ready", include_in_schema=False)
+async def ready():
+    """Readiness probe: 503 until the first cache-warming pass after startup is over."""
+    if not warmer.ready:
+        return JSONResponse(status_code=503, content={"status": "warming"}, headers={"Cache-Control": "no-store"})
+    return JSONResponse({"status": "ready", **warmer.last}, headers={"Cache-Control": "no-store"})
+
+
+@api.get("/slow_queries", include_in_schema=False, dependencies=[Depends(require_metrics_token)])
+async def slow_queries(
+    limit: Annotated[int, Query(ge=1, le=100, description="Number of fingerprints to return")] = 10,
+):
+    """Query shapes ranked by total time over the recent slow ES calls."""
+    return {"threshold_ms": slow_query_log.threshold_ms, "fingerprints": slow_query_log.top(limit)}
+
+
 @api.get("/data_portal")
 async def data_portal_search(
+    request: Request,
     params: Annotated[DataPortalSearchParams, Query()],
-) -> ElasticResponse[DataPortalData, DataPortalAggregationResponse]:
-    return await data_portal_search_full(
+) -> ElasticResponse[DataPortalRecord, DataPortalAggregationResponse]:
+    _start_profile(request, params)
+    return _respond(await data_portal_search_full(
         es_client=app.state.es_client,
         params=params,
         samples_index=SAMPLES_INDEX,
         data_portal_index=DATA_PORTAL_INDEX,
         data_class=DataPortalData,
         aggregation_class=DataPortalAggregationResponse,
+        partial_class=DataPortalPartialData,
+        trusted=FAST_RESPONSES,
+    ))
+
+
+@api.get("/data_portal/facets")
+async def data_portal_facets(
+    request: Request,
+    params: Annotated[DataPortalSearchParams, Query()],
+) -> FacetsResponse[DataPortalAggregationResponse]:
+    _start_profile(request, params)
+    return _respond(await data_portal_facets_full(
+        es_client=app.state.es_client,
+        params=params,
+        samples_index=SAMPLES_INDEX,
+        data_portal_index=DATA_PORTAL_INDEX,
+        aggregation_class=DataPortalAggregationResponse,
+    ))
+
+
+@api.get("/data_portal/suggest")
+async def data_portal_suggest_names(
+    params: Annotated[SuggestParams, Query()],
+) -> SuggestResponse:
+    """Typeahead: taxId and names of species matching a prefix of any of their names or taxa."""
+    return await data_portal_suggest(
+        es_client=app.state.es_client,
+        params=params,
+        data_portal_index=DATA_PORTAL_INDEX,
+    )
+
+
+async def _ndjson(documents):
+    async for document in documents:
+        yield json.dumps(document, separators=(",", ":")) + "\n"
+
+
+@api.get("/data_portal/export", response_class=StreamingResponse)
+async def data_portal_export(
+    params: Annotated[DataPortalSearchParams, Query()],
+):
+    """Stream every matching record as NDJSON. Paging and sort params are ignored."""
+    additional_filters = await data_portal_filters(
+        es_client=app.state.es_client, params=params, samples_index=SAMPLES_INDEX,
     )
+    documents = await export_search(
+        es_client=app.state.es_client,
+        index_name=DATA_PORTAL_INDEX,
+        query=build_query(
+            params=params, aggregation_class=DataPortalAggregationResponse,
+            additional_filters=additional_filters,
+        ),
+        source=params.source_filter(),
+    )
+    return StreamingResponse(_ndjson(documents), media_type="application/x-ndjson")
 
 
 @api.get("/data_portal/{record_id}")
@@ -93,17 +479,95 @@ async def data_portal_details(
     )
 
 
+@api.get("/data_portal/{tax_id}/summary")
+async def data_portal_summary(
+    tax_id: Annotated[int, Path(description="Species taxId")],
+) -> SpeciesSummaryResponse:
+    """Sample count, countries, organism part/sex breakdowns and map points over all of a species' samples."""
+    return await species_summary(
+        es_client=app.state.es_client,
+        tax_id=tax_id,
+        samples_index=SAMPLES_INDEX,
+    )
+
+
+@api.get("/data_portal/{tax_id}/sample_tree")
+async def data_portal_sample_tree(
+    tax_id: Annotated[int, Path(description="Species taxId")],
+    params: Annotated[SampleTreeParams, Query()],
+) -> SampleTreeResponse:
+    """A species' samples as a derivedFrom hierarchy, one level per page.
+
+    Without `parent`, pages through the root samples; with it, through the
+    samples derived from that accession. Each result carries its `childCount`.
+    """
+    tree = await species_sample_tree(
+        es_client=app.state.es_client,
+        tax_id=tax_id,
+        samples_index=SAMPLES_INDEX,
+    )
+    page = tree.page(tax_id=tax_id, parent=params.parent, start=params.start, size=params.size, expand=params.expand)
+    if page is None:
+        raise HTTPException(status_code=404, detail=f"No sample {params.parent} for taxId {tax_id}")
+    return page
+
+
+@api.post("/data_portal/_mget")
+async def data_portal_mget(
+    request: Annotated[MgetRequest, Body()],
+) -> ElasticMgetResponse[DataPortalData]:
+    return _respond(await elastic_mget(
+        es_client=app.state.es_client,
+        index_name=DATA_PORTAL_INDEX,
+        record_ids=request.record_ids(),
+        data_class=DataPortalData,
+        trusted=FAST_RESPONSES,
+    ))
+
+
 @api.get("/samples")
 async def samples_search(
+    request: Request,
     params: Annotated[SampleSearchParams, Query()],
-) -> ElasticResponse[SampleData, SampleAggregationResponse]:
-    return await elastic_search(
+) -> ElasticResponse[SampleRecord, SampleAggregationResponse]:
+    _start_profile(request, params)
+    return _respond(await elastic_search(
         es_client=app.state.es_client,
         index_name=SAMPLES_INDEX,
         params=params,
         data_class=SampleData,
         aggregation_class=SampleAggregationResponse,
+        partial_class=SamplePartialData,
+        trusted=FAST_RESPONSES,
+    ))
+
+
+@api.get("/samples/export", response_class=StreamingResponse)
+async def samples_export(
+    params: Annotated[SampleSearchParams, Query()],
+):
+    """Stream every matching record as NDJSON. Paging and sort params are ignored."""
+    documents = await export_search(
+        es_client=app.state.es_client,
+        index_name=SAMPLES_INDEX,
+        query=build_query(params=params, aggregation_class=SampleAggregationResponse),
+        source=params.source_filter(),
     )
+    return StreamingResponse(_ndjson(documents), media_type="application/x-ndjson")
+
+
+@api.get("/samples/facets")
+async def samples_facets(
+    request: Request,
+    params: Annotated[SampleSearchParams, Query()],
+) -> FacetsResponse[SampleAggregationResponse]:
+    _start_profile(request, params)
+    return _respond(await elastic_facets(
+        es_client=app.state.es_client,
+        index_name=SAMPLES_INDEX,
+        params=params,
+        aggregation_class=SampleAggregationResponse,
+    ))
 
 
 @api.get("/samples/geo_aggregation")
@@ -117,6 +581,46 @@ async def samples_geo_aggregation(
     )
 
 
+@api.post("/samples/_mget")
+async def samples_mget(
+    request: Annotated[MgetRequest, Body()],
+) -> ElasticMgetResponse[SampleData]:
+    return _respond(await elastic_mget(
+        es_client=app.state.es_client,
+        index_name=SAMPLES_INDEX,
+        record_ids=request.record_ids(),
+        data_class=SampleData,
+        trusted=FAST_RESPONSES,
+    ))
+
+
+@api.get(
+    "/samples/tiles/{z}/{x}/{y}.mvt",
+    response_class=Response,
+    responses={200: {"content": {"application/vnd.mapbox-vector-tile": {}}}},
+)
+async def samples_tiles(
+    z: Annotated[int, Path(ge=0, le=29, description="Tile zoom")],
+    x: Annotated[int, Path(ge=0, description="Tile column")],
+    y: Annotated[int, Path(ge=0, description="Tile row")],
+    params: Annotated[SampleTileParams, Query()],
+):
+    """Sample clusters as a Mapbox Vector Tile: one centroid point per geotile cell, with `_count`."""
+    if x >= 2 ** z or y >= 2 ** z:
+        raise HTTPException(status_code=404, detail="Tile out of range")
+    tile = await samples_vector_tile(
+        es_client=app.state.es_client,
+        params=params,
+        samples_index=SAMPLES_INDEX,
+        z=z, x=x, y=y,
+    )
+    return Response(
+        content=tile,
+        media_type="application/vnd.mapbox-vector-tile",
+        headers={"Cache-Control": f"public, max-age={TILE_MAX_AGE_SECONDS}"},
+    )
+
+
 @api.get("/samples/{accession}")
 async def samples_details(
     accession: Annotated[str, Path(description="Sample accession")],
@@ -129,5 +633,73 @@ async def samples_details(
     )
 
 
+def _batch_params(name: str, query: BatchQuery):
+    """Validate a sub-query's params with the same model as its GET route."""
+    if query.type == "geo_aggregation":
+        params_class = GeoAggregationParams
+    elif query.index == "data_portal":
+        params_class = DataPortalSearchParams
+    else:
+        params_class = SampleSearchParams
+    loc = ("body", "queries", name, "params")
+    try:
+        params = params_class.model_validate(query.params)
+    except ValidationError as e:
+        raise RequestValidationError([{**error, "loc": loc + tuple(error["loc"])} for error in e.errors()])
+    if getattr(params, "cursor", None) is not None:
+        raise RequestValidationError([{
+            "type": "value_error", "loc": loc + ("cursor",), "msg": "cursor paging is not supported in a batch",
+            "input": params.cursor,
+        }])
+    return params
+
+
+async def _prepare_batch_query(name: str, query: BatchQuery):
+    es_client = app.state.es_client
+    if query.type == "details":
+        index_name, data_class = (
+            (DATA_PORTAL_INDEX, DataPortalData) if query.index == "data_portal" else (SAMPLES_INDEX, SampleData)
+        )
+        return prepare_details(index_name=index_name, record_id=query.id, data_class=data_class)
+
+    params = _batch_params(name, query)
+    if query.type == "geo_aggregation":
+        return prepare_samples_geo_aggregation(params=params, samples_index=SAMPLES_INDEX)
+    if query.index == "data_portal":
+        if query.type == "facets":
+            return await prepare_data_portal_facets(
+                es_client=es_client, params=params, samples_index=SAMPLES_INDEX,
+                data_portal_index=DATA_PORTAL_INDEX, aggregation_class=DataPortalAggregationResponse,
+            )
+        return await prepare_data_portal_search(
+            es_client=es_client, params=params, samples_index=SAMPLES_INDEX,
+            data_portal_index=DATA_PORTAL_INDEX, data_class=DataPortalData,
+            aggregation_class=DataPortalAggregationResponse, partial_class=DataPortalPartialData,
+            trusted=FAST_RESPONSES,
+        )
+    if query.type == "facets":
+        return prepare_facets(index_name=SAMPLES_INDEX, params=params, aggregation_class=SampleAggregationResponse)
+    return prepare_search(
+        index_name=SAMPLES_INDEX, params=params, data_class=SampleData,
+        aggregation_class=SampleAggregationResponse, partial_class=SamplePartialData,
+        trusted=FAST_RESPONSES,
+    )
+
+
+@api.post("/_batch")
+async def batch(
+    request: Annotated[BatchRequest, Body()],
+) -> BatchResponse:
+    """Run named search/facets/geo_aggregation/details sub-queries in one ES `msearch`.
+
+    Each result has the shape its GET route returns. A sub-query that fails in
+    ES is reported under `errors` without failing the others; invalid params
+    reject the whole batch with 422.
+    """
+    prepared = {name: await _prepare_batch_query(name, query) for name, query in request.queries.items()}
+    results, errors = await msearch_prepared(app.state.es_client, prepared)
+    return BatchResponse(results=results, errors=errors)
+
+
 app.include_router(api)
 app.mount("/api/mcp", mcp_app)
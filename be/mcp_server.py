@@ -1,4 +1,5 @@
 # be/mcp_server.py
+import os
 import shlex
 
 from elasticsearch import AsyncElasticsearch
@@ -6,6 +7,7 @@ from mcp.server.fastmcp import FastMCP
 from mcp.server.transport_security import TransportSecuritySettings
 from mcp.shared.exceptions import McpError
 from mcp.types import ErrorData, INTERNAL_ERROR
+from metrics import timed_tool
 from models import (
     DataPortalSearchParams, DataPortalAggregationResponse, DataPortalData,
     GeoAggregationParams,
@@ -52,7 +54,13 @@ mcp = FastMCP(
 )
 
 
-def build_mcp_app():
+# Stateless Streamable HTTP: no Mcp-Session-Id, every request stands alone.
+# Needed when several worker processes serve the BE (serve.py turns it on),
+# since a session's requests may land on any of them.
+MCP_STATELESS = os.getenv("MCP_STATELESS", "").lower() in ("1", "true", "yes")
+
+
+def build_mcp_app(*, stateless: bool = MCP_STATELESS):
     """Return a Streamable HTTP ASGI app backed by a fresh session manager.
 
     Each call resets the FastMCP instance's cached session manager so that a
@@ -63,10 +71,12 @@ def build_mcp_app():
     is a no-op from an operational standpoint.
     """
     mcp._session_manager = None  # ensure a fresh StreamableHTTPSessionManager
+    mcp.settings.stateless_http = stateless
     return mcp.streamable_http_app()
 
 
 @mcp.tool()
+@timed_tool
 async def search_species(
     q: str | None = None,
     kingdom: str | None = None,
@@ -124,6 +134,7 @@ async def search_species(
 
 
 @mcp.tool()
+@timed_tool
 async def get_species(tax_id: int) -> dict:
     """Fetch the full AEGIS data portal record for one species by NCBI tax_id.
 
@@ -151,6 +162,7 @@ async def get_species(tax_id: int) -> dict:
 
 
 @mcp.tool()
+@timed_tool
 async def search_samples(
     q: str | None = None,
     taxId: int | None = None,
@@ -197,6 +209,7 @@ async def search_samples(
 
 
 @mcp.tool()
+@timed_tool
 async def get_sample(accession: str) -> dict:
     """Fetch the full AEGIS sample record for one BioSamples accession.
 
@@ -217,6 +230,7 @@ async def get_sample(accession: str) -> dict:
 
 
 @mcp.tool()
+@timed_tool
 async def aggregate_samples_by_location(
     zoom: int,
     top_left_lat: float | None = None,
@@ -264,6 +278,7 @@ async def aggregate_samples_by_location(
 
 
 @mcp.tool()
+@timed_tool
 def build_bulk_download_command(
     types: str | None = None,
     tax_id: str | None = None,
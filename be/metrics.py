@@ -0,0 +1,262 @@
+# be/metrics.py
+import functools
+import inspect
+import os
+import time
+
+from prometheus_client import CollectorRegistry, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from starlette.routing import Match
+
+import admission
+from admission import Overloaded, es_budget
+from cache import query_cache, search_flights, shared_store
+from slow_queries import calling, slow_query_log
+import server_timing
+
+# Set (by serve.py) when several worker processes serve the BE. The metrics
+# below then live in per-process files there, and a scrape of any worker
+# reports the sum over all of them (see exposition()).
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+
+REQUEST_LATENCY = Histogram(
+    "aegis_http_request_duration_seconds",
+    "HTTP request latency, from the first byte in to the last byte out.",
+    ["method", "route", "status"],
+)
+RESPONSE_SIZE = Histogram(
+    "aegis_http_response_size_bytes",
+    "HTTP response body size on the wire (after compression).",
+    ["route"],
+    buckets=[2 ** i for i in range(8, 27, 2)],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "aegis_http_requests_in_flight", "HTTP requests currently being served.", multiprocess_mode="livesum",
+)
+MCP_TOOL_LATENCY = Histogram(
+    "aegis_mcp_tool_duration_seconds",
+    "MCP tool call latency.",
+    ["tool", "outcome"],
+)
+ES_WALL = Histogram(
+    "aegis_es_request_duration_seconds",
+    "Wall time of ES calls as seen by the BE, including transport and JSON decoding.",
+    ["query_type"],
+)
+ES_TOOK = Histogram(
+    "aegis_es_took_seconds",
+    "ES-reported `took` for the same calls; the gap to the wall time is transport and client overhead.",
+    ["query_type"],
+)
+
+
+async def timed_es_call(query_type: str, call, *, body=None, shed: bool = True):
+    """Await an ES client coroutine, recording its wall time and, when reported, its `took`.
+
+    Both also go into the request's Server-Timing header, and slow calls are
+    logged with the shape of `body` (see slow_queries.py). The call first
+    takes a slot in the process-wide ES budget; when that is saturated it
+    raises Overloaded, unless `shed` is off (see EsBudget.slot).
+    """
+    try:
+        async with es_budget.slot(shed=shed):
+            started = time.perf_counter()
+            response = await call
+            wall = time.perf_counter() - started
+    except Overloaded:
+        call.close()
+        raise
+    ES_WALL.labels(query_type).observe(wall)
+    server_timing.record(query_type, wall * 1000)
+    slow_query_log.observe(query_type=query_type, body=body, wall_ms=wall * 1000, response=response)
+    try:
+        took = response["took"]
+    except (KeyError, TypeError):
+        took = None
+    if took is not None:
+        ES_TOOK.labels(query_type).observe(took / 1000)
+        server_timing.record(f"{query_type}_took", took)
+    return response
+
+
+def timed_tool(fn):
+    """Record an MCP tool's latency; the wrapper keeps the signature FastMCP introspects."""
+    def observe(started, outcome):
+        MCP_TOOL_LATENCY.labels(fn.__name__, outcome).observe(time.perf_counter() - started)
+
+    if not inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        def sync_wrapper(*args, **kwargs):
+            started, outcome = time.perf_counter(), "error"
+            try:
+                result = fn(*args, **kwargs)
+                outcome = "ok"
+                return result
+            finally:
+                observe(started, outcome)
+
+        return sync_wrapper
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        started, outcome = time.perf_counter(), "error"
+        try:
+            with calling(f"mcp:{fn.__name__}"):
+                result = await fn(*args, **kwargs)
+            outcome = "ok"
+            return result
+        finally:
+            observe(started, outcome)
+
+    return wrapper
+
+
+def _route_label(scope) -> str:
+    """The matched route's path template, so ids in paths do not explode label cardinality.
+
+    Called once the app has run: the router records its match in the scope.
+    """
+    route = scope.get("route")
+    if route is None:
+        # Older Starlette does not record the match; redo it.
+        for candidate in scope["app"].router.routes:
+            if getattr(candidate, "path", None) and candidate.matches(scope)[0] == Match.FULL:
+                route = candidate
+                break
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """Per-route latency and response size, plus the in-flight gauge."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+        size = 0
+
+        async def send_measured(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        started = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_measured)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            route = _route_label(scope)
+            REQUEST_LATENCY.labels(scope["method"], route, str(status)).observe(time.perf_counter() - started)
+            RESPONSE_SIZE.labels(route).observe(size)
+
+
+class CacheCollector:
+    """Query cache and single-flight counters, read at scrape time."""
+
+    def collect(self):
+        stats = query_cache.stats()
+        hits = CounterMetricFamily("aegis_query_cache_hits", "Query cache lookups answered from the cache.")
+        hits.add_metric([], stats["hits"])
+        misses = CounterMetricFamily("aegis_query_cache_misses", "Query cache lookups that went to ES.")
+        misses.add_metric([], stats["misses"])
+        lookups = stats["hits"] + stats["misses"]
+        ratio = GaugeMetricFamily("aegis_query_cache_hit_ratio", "Hits over lookups since startup.")
+        ratio.add_metric([], stats["hits"] / lookups if lookups else 0.0)
+        entries = GaugeMetricFamily("aegis_query_cache_entries", "Entries currently held.")
+        entries.add_metric([], stats["entries"])
+
+        flights = search_flights.stats()
+        coalesced = CounterMetricFamily(
+            "aegis_es_coalesced_requests", "Identical concurrent ES queries that waited on one in flight."
+        )
+        coalesced.add_metric([], flights["coalesced"])
+        in_flight = GaugeMetricFamily("aegis_es_queries_in_flight", "Distinct ES queries currently in flight.")
+        in_flight.add_metric([], flights["in_flight"])
+        yield from (hits, misses, ratio, entries, coalesced, in_flight)
+
+        if shared_store is not None:
+            shared = shared_store.stats()
+            shared_hits = CounterMetricFamily(
+                "aegis_shared_cache_hits", "Local cache misses answered by another worker's entry."
+            )
+            shared_hits.add_metric([], shared["hits"])
+            shared_misses = CounterMetricFamily("aegis_shared_cache_misses", "Lookups missing both cache tiers.")
+            shared_misses.add_metric([], shared["misses"])
+            shared_skipped = CounterMetricFamily(
+                "aegis_shared_cache_skipped_writes", "Writes not shared: value too large or store locked by another worker."
+            )
+            shared_skipped.add_metric([], shared["skipped"])
+            shared_errors = CounterMetricFamily("aegis_shared_cache_errors", "Failed shared cache reads and writes.")
+            shared_errors.add_metric([], shared["errors"])
+            yield from (shared_hits, shared_misses, shared_skipped, shared_errors)
+
+
+class AdmissionCollector:
+    """ES budget occupancy and requests shed, read at scrape time."""
+
+    def collect(self):
+        budget = es_budget.stats()
+        in_flight = GaugeMetricFamily("aegis_es_budget_in_flight", "ES queries holding a slot in the budget.")
+        in_flight.add_metric([], budget["in_flight"])
+        waiting = GaugeMetricFamily("aegis_es_budget_waiting", "ES queries queued for a slot.")
+        waiting.add_metric([], budget["waiting"])
+        rejected = CounterMetricFamily(
+            "aegis_admission_rejected", "Requests refused by admission control, by reason.", labels=["reason"]
+        )
+        for reason, count in admission.rejected.items():
+            rejected.add_metric([reason], count)
+        rejected.add_metric(["es_budget"], budget["shed"])
+        yield from (in_flight, waiting, rejected)
+
+
+COLLECTORS = [CacheCollector(), AdmissionCollector()]
+for _collector in COLLECTORS:
+    REGISTRY.register(_collector)
+
+# The collectors above read this process's state at scrape time, which a
+# multiprocess scrape cannot see; publish_process_metrics copies it into
+# multiprocess gauges of the same sample names, keyed here by name.
+_published: dict[str, Gauge] = {}
+
+
+def publish_process_metrics() -> None:
+    """Copy the scrape-time collectors' samples into this process's multiprocess files.
+
+    Counters are summed over every worker that has run since serve.py
+    started, so they do not drop when one exits; gauges over the live ones.
+    Ratios are kept per worker (labelled by pid).
+    """
+    for collector in COLLECTORS:
+        for family in collector.collect():
+            if family.type == "counter":
+                mode = "sum"
+            elif family.name.endswith("_ratio"):
+                mode = "liveall"
+            else:
+                mode = "livesum"
+            for sample in family.samples:
+                gauge = _published.get(sample.name)
+                if gauge is None:
+                    gauge = _published[sample.name] = Gauge(
+                        sample.name, family.documentation, sorted(sample.labels),
+                        registry=None, multiprocess_mode=mode,
+                    )
+                (gauge.labels(**sample.labels) if sample.labels else gauge).set(sample.value)
+
+
+def exposition() -> bytes:
+    """The /api/metrics body: this process's registry, or every worker's in multiprocess mode."""
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return generate_latest()
+    publish_process_metrics()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
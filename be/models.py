@@ -1,5 +1,9 @@
-from pydantic import BaseModel, Field, create_model
-from typing import Generic, Literal, TypeVar
+from functools import cache
+
+from pydantic import (
+    BaseModel, Discriminator, Field, Tag, create_model, model_serializer, model_validator,
+)
+from typing import Annotated, Any, Generic, Literal, TypeVar
 
 T = TypeVar("T")  # Datasource data type
 A = TypeVar("A")  # Datasource aggregation type
@@ -32,12 +36,73 @@ class ElasticResponse(BaseModel, Generic[T, A]):
     size: int
     results: list[T]
     aggregations: dict
+    # Opaque token for the next page when paging with `cursor`; None on the
+    # last page or when classic start/size paging was used.
+    next_cursor: str | None = None
+
+
+class FacetsResponse(BaseModel, Generic[A]):
+    total: int
+    aggregations: dict
 
 
 class ElasticDetailsResponse(BaseModel, Generic[T]):
     results: list[T]
 
 
+MGET_MAX_IDS = 5000
+
+
+class MgetRequest(BaseModel):
+    model_config = {"extra": "forbid"}
+    ids: list[int | str] = Field(
+        ..., min_length=1, max_length=MGET_MAX_IDS, description="Record IDs to fetch"
+    )
+
+    def record_ids(self) -> list[str]:
+        return [str(i) for i in self.ids]
+
+
+class ElasticMgetResponse(BaseModel, Generic[T]):
+    results: list[T]
+    missing: list[str]
+
+
+BATCH_MAX_QUERIES = 20
+
+
+class BatchQuery(BaseModel):
+    model_config = {"extra": "forbid"}
+    type: Literal["search", "facets", "geo_aggregation", "details"]
+    index: Literal["data_portal", "samples"]
+    params: dict = Field(
+        default_factory=dict, description="Parameters as for the matching GET route (not used by details)"
+    )
+    id: str | None = Field(None, description="Record ID, for details")
+
+    @model_validator(mode="after")
+    def check_target(self):
+        if self.type == "details" and not self.id:
+            raise ValueError("details queries need an id")
+        if self.type == "geo_aggregation" and self.index != "samples":
+            raise ValueError("geo_aggregation is only available on samples")
+        return self
+
+
+class BatchRequest(BaseModel):
+    model_config = {"extra": "forbid"}
+    queries: dict[str, BatchQuery] = Field(
+        ..., min_length=1, max_length=BATCH_MAX_QUERIES, description="Sub-queries keyed by a caller-chosen name"
+    )
+
+
+class BatchResponse(BaseModel):
+    # Each value has the shape the matching GET route returns.
+    results: dict[str, Any]
+    # Sub-queries that failed, by name; the rest of the batch still succeeds.
+    errors: dict[str, str] = {}
+
+
 # Base Elastic query class.
 
 
@@ -50,9 +115,98 @@ class SearchParams(BaseModel):
     q: str | None = Field(None, description="Search query string")
     start: int = Field(0, description="Starting point of the results")
     size: int = Field(10, gt=0, description="Number of results per page")
+    aggs: bool = Field(True, description="Compute facet aggregations alongside the hits")
+    cursor: str | None = Field(
+        None,
+        description="Cursor paging: pass '*' for the first page, then the previous "
+                    "response's next_cursor. Ignores start and is not capped at 10,000 hits.",
+    )
     # No sorting by default, child classes can override this.
     sort_field: str | None = None
     sort_order: Literal["desc", "asc"] = "asc"
+    # Field projection, comma-separated.
+    fields: str | None = Field(None, description="Comma-separated fields to return")
+    exclude: str | None = Field(None, description="Comma-separated fields to leave out")
+    # Diagnostics; only honoured with the X-Profile-Token header (see main.py).
+    profile: bool = Field(False, description="Attach ES Profile API output for the query and aggregations")
+
+    def projected(self) -> bool:
+        return bool(self.fields or self.exclude)
+
+    def source_filter(self) -> dict | None:
+        """The ES `_source` filter for `fields`/`exclude`, or None to fetch whole documents."""
+        if not self.projected():
+            return None
+        source = {}
+        if self.fields:
+            source["includes"] = _split_fields(self.fields)
+        if self.exclude:
+            source["excludes"] = _split_fields(self.exclude)
+        return source
+
+
+def _split_fields(value: str) -> list[str]:
+    return [f.strip() for f in value.split(",") if f.strip()]
+
+
+# Partial records (field projection).
+
+
+class PartialRecord(BaseModel):
+    """Base for generated partial data classes: only fields present in `_source` are emitted."""
+
+    @model_serializer(mode="wrap")
+    def _drop_unset(self, handler):
+        return {k: v for k, v in handler(self).items() if k in self.model_fields_set}
+
+
+@cache
+def record_type(data_class, partial_class):
+    """Response item type that is either a full record or a projected one.
+
+    Instances are routed by class; serialised dicts (full records always carry
+    every field) by whether any field is absent.
+    """
+    field_names = frozenset(data_class.model_fields)
+
+    def discriminate(value):
+        if isinstance(value, BaseModel):
+            return "partial" if isinstance(value, PartialRecord) else "full"
+        return "full" if field_names <= value.keys() else "partial"
+
+    return Annotated[
+        Annotated[data_class, Tag("full")] | Annotated[partial_class, Tag("partial")],
+        Discriminator(discriminate),
+    ]
+
+
+# Compiled query plans.
+
+
+class QueryPlan:
+    """The request-invariant parts of a DataSource's queries, compiled once at import.
+
+    Requests only fill in the query, filters and paging; nothing here may be
+    mutated once built.
+    """
+
+    def __init__(self, *, data_class, partial_class, aggregation_class):
+        self.data_class = data_class
+        self.partial_class = partial_class
+        self.aggregation_class = aggregation_class
+        self.filter_fields = tuple(get_list_of_aggregations(aggregation_class))
+        self.aggregations = {f: {"terms": {"field": f}} for f in self.filter_fields}
+        self.response_class = ElasticResponse[data_class, aggregation_class]
+        self.record_response_class = ElasticResponse[record_type(data_class, partial_class), aggregation_class]
+        self.facets_response_class = FacetsResponse[aggregation_class]
+
+
+_query_plans: dict[type, QueryPlan] = {}
+
+
+def query_plan(aggregation_class) -> QueryPlan:
+    """The plan compiled by DataSource.generate_classes for `aggregation_class`."""
+    return _query_plans[aggregation_class]
 
 
 # Datasource definition.
@@ -90,6 +244,11 @@ class DataSource:
                 data_field_definitions[name] = (type_, ...)
 
         Data = create_model("Data", **data_field_definitions)
+        PartialData = create_model(
+            "PartialData",
+            __base__=PartialRecord,
+            **{name: (type_ | None, None) for name, (type_, _) in fields.items()},
+        )
 
         class AggregationResponse(BaseModel):
             __annotations__ = {
@@ -98,6 +257,8 @@ class DataSource:
                 if filterable
             }
 
+        known_fields = frozenset(fields)
+
         class SearchParamsExtended(SearchParams):
             # Define filterable fields with default values
             locals().update(
@@ -120,7 +281,20 @@ class DataSource:
                 self.default_sort_order, description="Sort order"
             )
 
-        return Data, AggregationResponse, SearchParamsExtended
+            @model_validator(mode="after")
+            def _check_projection(self):
+                for value in (self.fields, self.exclude):
+                    unknown = set(_split_fields(value or "")) - known_fields
+                    if unknown:
+                        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+                return self
+
+        self.plan = QueryPlan(
+            data_class=Data, partial_class=PartialData, aggregation_class=AggregationResponse,
+        )
+        _query_plans[AggregationResponse] = self.plan
+
+        return Data, PartialData, AggregationResponse, SearchParamsExtended
 
 
 # Bounds and taxonomy filter mixins.
@@ -169,9 +343,10 @@ data_portal = DataSource(
     default_sort_field="currentStatusOrder",
     default_sort_order="desc",
 )
-(DataPortalData, DataPortalAggregationResponse, DataPortalSearchParams) = (
+(DataPortalData, DataPortalPartialData, DataPortalAggregationResponse, DataPortalSearchParams) = (
     data_portal.generate_classes()
 )
+DataPortalRecord = record_type(DataPortalData, DataPortalPartialData)
 
 
 class DataPortalSearchParamsExtended(DataPortalSearchParams, BoundsFilterMixin, TaxonomyFilterMixin):
@@ -252,9 +427,31 @@ samples_source = DataSource(
     default_sort_field="accession",
     default_sort_order="asc",
 )
-(SampleData, SampleAggregationResponse, SampleSearchParams) = (
+(SampleData, SamplePartialData, SampleAggregationResponse, SampleSearchParams) = (
     samples_source.generate_classes()
 )
+SampleRecord = record_type(SampleData, SamplePartialData)
+
+
+# Typeahead.
+
+SUGGEST_MAX_SIZE = 20
+
+
+class SuggestParams(BaseModel):
+    model_config = {"extra": "forbid"}
+    prefix: str = Field(..., min_length=1, max_length=100, description="What has been typed so far")
+    size: int = Field(8, ge=1, le=SUGGEST_MAX_SIZE, description="Number of suggestions")
+
+
+class Suggestion(BaseModel):
+    taxId: int
+    scientificName: str
+    commonName: str | None = None
+
+
+class SuggestResponse(BaseModel):
+    suggestions: list[Suggestion]
 
 
 # Geo aggregation models.
@@ -280,6 +477,15 @@ class GeoAggregationParams(BaseModel):
         )
 
 
+class SampleTileParams(BaseModel):
+    model_config = {"extra": "forbid"}
+    tax_id: int | None = Field(None, description="Filter to a specific species")
+    tax_ids: str | None = Field(None, description="Comma-separated taxIds to filter by")
+    q: str | None = Field(None, description="Full text search query")
+    country: str | None = Field(None, description="Filter by country")
+    trackingSystem: str | None = Field(None, description="Filter by tracking status")
+
+
 class GeoCluster(BaseModel):
     lat: float
     lon: float
@@ -289,3 +495,72 @@ class GeoCluster(BaseModel):
 
 class GeoAggregationResponse(BaseModel):
     clusters: list[GeoCluster]
+
+
+# Species page summary.
+
+
+class SummaryLocation(BaseModel):
+    lat: float
+    lon: float
+    count: int
+    # The sample itself when it is alone at this point, for the marker tooltip.
+    accession: str | None = None
+    organismPart: str | None = None
+
+
+class SpeciesSummaryResponse(BaseModel):
+    taxId: int
+    sampleCount: int
+    countries: list[str]
+    organismParts: list[AggregationBucket]
+    sex: list[AggregationBucket]
+    locations: list[SummaryLocation]
+    # geo_bounds of every sample location ({"top_left": {...}, "bottom_right": {...}}), or None.
+    bounds: dict[str, dict[str, float]] | None = None
+
+
+# Sample derivation tree.
+
+SAMPLE_TREE_MAX_PAGE = 1000
+# Nodes in one page, results and their inlined children together.
+SAMPLE_TREE_MAX_NODES = 10000
+
+
+class SampleTreeParams(BaseModel):
+    model_config = {"extra": "forbid"}
+    parent: str | None = Field(None, description="Accession whose derived samples to list; roots when omitted")
+    start: int = Field(0, ge=0, description="Starting point of the page")
+    size: int = Field(100, ge=1, le=SAMPLE_TREE_MAX_PAGE, description="Samples per page")
+    expand: int = Field(
+        0, ge=0, le=SAMPLE_TREE_MAX_PAGE, description="Inline up to this many derived samples under each result"
+    )
+
+    @model_validator(mode="after")
+    def _check_nodes(self):
+        if self.size * (1 + self.expand) > SAMPLE_TREE_MAX_NODES:
+            raise ValueError(f"size * (1 + expand) must not exceed {SAMPLE_TREE_MAX_NODES}")
+        return self
+
+
+class SampleTreeNode(BaseModel):
+    accession: str
+    derivedFrom: str | None = None
+    sampleSameAs: str | None = None
+    relationship: str | None = None
+    organismPart: str | None = None
+    sex: str | None = None
+    trackingSystem: str | None = None
+    childCount: int
+    # First `expand` derived samples; page the rest with `parent`.
+    children: list["SampleTreeNode"] | None = None
+
+
+class SampleTreeResponse(BaseModel):
+    taxId: int
+    sampleCount: int
+    parent: str | None
+    total: int
+    start: int
+    size: int
+    results: list[SampleTreeNode]
@@ -1,13 +1,21 @@
 # be/queries.py
-import urllib.parse
-from collections import defaultdict
+import base64
+import json
 
+from elasticsearch import NotFoundError
+
+from cache import cache_key, lead_store, query_cache, sample_tree_cache, search_flights, shared_store
+from geo_pyramid import geo_pyramid
+from metrics import timed_es_call
+from server_timing import current_timings, phase
 from models import (
-    get_list_of_aggregations,
-    ElasticResponse,
+    query_plan,
     ElasticDetailsResponse,
+    ElasticMgetResponse,
     GeoCluster,
     GeoAggregationResponse,
+    SuggestResponse,
+    SpeciesSummaryResponse,
 )
 
 # Point at stable aliases rather than a dated index. Reindexing now == repoint
@@ -16,87 +24,511 @@ DATA_PORTAL_INDEX = "data_portal"
 SAMPLES_INDEX = "samples"
 
 
+# Cursor paging keeps a point-in-time open between pages; each page extends it.
+CURSOR_START = "*"
+PIT_KEEP_ALIVE = "2m"
+
+
 class QueryError(RuntimeError):
     """Raised when an Elasticsearch query fails. Transport-agnostic."""
     pass
 
 
-async def elastic_search(
-    *,
-    es_client,
-    index_name: str,
-    params,
-    data_class,
-    aggregation_class,
-    additional_aggs: dict | None = None,
-    additional_filters: list | None = None,
-):
+class InvalidCursorError(ValueError):
+    """Raised when a client-supplied cursor cannot be decoded."""
+    pass
+
+
+# Species docs carry their samples' coordinates here. When it is mapped as
+# geo_point, bounding boxes filter data_portal directly instead of expanding
+# through a samples taxId aggregation.
+DATA_PORTAL_GEO_FIELD = "locations"
+
+# Species docs may carry a `completion` field fed with scientificName,
+# commonName and the phylogeny names. When it is mapped, typeahead is an
+# in-memory suggester lookup; otherwise a prefix match on the name fields.
+DATA_PORTAL_SUGGEST_FIELD = "suggest"
+
+# Concrete indices currently behind the aliases; see refresh_index_generation.
+_index_generation: tuple = ()
+_data_portal_geo_native = False
+_data_portal_suggest_native = False
+
+
+def index_generation() -> tuple:
+    return _index_generation
+
+
+async def refresh_index_generation(es_client) -> bool:
+    """Re-resolve the aliases; on a repoint, flush everything cached against the old indices.
+
+    Returns True when the generation changed.
+    """
+    global _index_generation, _data_portal_geo_native, _data_portal_suggest_native
+    response = await es_client.indices.resolve_index(name=[DATA_PORTAL_INDEX, SAMPLES_INDEX])
+    generation = tuple(sorted(
+        [(a["name"], tuple(sorted(a["indices"]))) for a in response.get("aliases", [])]
+        + [(i["name"], (i["name"],)) for i in response.get("indices", [])]
+    ))
+    if generation == _index_generation:
+        return False
+    # Detect before committing, so a failure here is retried on the next poll.
+    geo_native = await _is_mapped_as(es_client, DATA_PORTAL_INDEX, DATA_PORTAL_GEO_FIELD, "geo_point")
+    suggest_native = await _is_mapped_as(es_client, DATA_PORTAL_INDEX, DATA_PORTAL_SUGGEST_FIELD, "completion")
+    _index_generation = generation
+    _data_portal_geo_native = geo_native
+    _data_portal_suggest_native = suggest_native
+    query_cache.clear()
+    sample_tree_cache.clear()
+    if shared_store is not None:
+        # Other workers may not have seen the repoint yet; leave their entries be.
+        shared_store.scope = lead_store.scope = cache_key(generation)
+    geo_pyramid.clear()
+    return True
+
+
+async def _is_mapped_as(es_client, index: str, field: str, field_type: str) -> bool:
+    """True when `field` is mapped as `field_type` in every index behind `index`."""
+    response = await es_client.indices.get_field_mapping(index=index, fields=field)
+    types = [
+        mapping.get("mappings", {}).get(field, {}).get("mapping", {}).get(field, {}).get("type")
+        for mapping in response.values()
+    ]
+    return bool(types) and all(t == field_type for t in types)
+
+
+def _bounding_box(params, field: str) -> dict:
+    return {"geo_bounding_box": {field: {
+        "top_left": {"lat": params.top_left_lat, "lon": params.top_left_lon},
+        "bottom_right": {"lat": params.bottom_right_lat, "lon": params.bottom_right_lon},
+    }}}
+
+
+async def cached_search(es_client, *, index: str, body: dict, query_type: str = "search"):
+    """`es_client.search` through query_cache, keyed on the normalised body.
+
+    Concurrent misses for the same key share one ES request. `query_type`
+    labels the call in the ES metrics. A request profiling its searches goes
+    straight to ES with the Profile API on, and its response is not cached.
+    """
+    timings = current_timings()
+    if timings is not None and timings.profile:
+        profiled = {**body, "profile": True}
+        response = await timed_es_call(query_type, es_client.search(index=index, body=profiled), body=body)
+        timings.add_profile(query_type, response.get("profile"))
+        return response
+
+    key = cache_key(index, body)
+    hit, response = await query_cache.fetch(key)
+    if hit:
+        return response
+
+    async def search():
+        result = await timed_es_call(query_type, es_client.search(index=index, body=body), body=body)
+        await query_cache.put(key, result)
+        return result
+
+    return await search_flights.do(key, search)
+
+
+def encode_cursor(pit_id: str, search_after: list) -> str:
+    payload = json.dumps({"pit": pit_id, "after": search_after}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[str, list]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        pit_id, search_after = payload["pit"], payload["after"]
+    except Exception as e:
+        raise InvalidCursorError("Invalid cursor") from e
+    if not isinstance(pit_id, str) or not isinstance(search_after, list):
+        raise InvalidCursorError("Invalid cursor")
+    return pit_id, search_after
+
+
+def build_query(*, params, aggregation_class, additional_filters: list | None = None) -> dict:
+    """The bool query shared by paged search and export: free text plus filterable-field terms."""
     if params.q:
         query_body = {"multi_match": {"query": params.q, "fields": ["*"]}}
     else:
         query_body = {"match_all": {}}
 
     filters = []
-    aggregation_fields = get_list_of_aggregations(aggregation_class)
-    if aggregation_fields:
-        for aggregation_field in aggregation_fields:
-            filter_value = getattr(params, aggregation_field)
-            if filter_value:
-                if isinstance(filter_value, list):
-                    filters.append({"terms": {aggregation_field: filter_value}})
-                else:
-                    filters.append({"terms": {aggregation_field: [filter_value]}})
+    for aggregation_field in query_plan(aggregation_class).filter_fields:
+        filter_value = getattr(params, aggregation_field)
+        if filter_value:
+            if isinstance(filter_value, list):
+                filters.append({"terms": {aggregation_field: filter_value}})
+            else:
+                filters.append({"terms": {aggregation_field: [filter_value]}})
 
     if additional_filters:
         filters.extend(additional_filters)
 
-    search_body = {
+    return {"bool": {"must": query_body, "filter": filters}}
+
+
+def build_aggregations(*, aggregation_class, additional_aggs: dict | None = None) -> dict:
+    """A `terms` facet per filterable field, plus any source-specific extras."""
+    aggs = query_plan(aggregation_class).aggregations
+    if additional_aggs:
+        return {**aggs, **additional_aggs}
+    return aggs
+
+
+class PreparedQuery:
+    """One ES search, split into its body and the parse of its response.
+
+    Keeping the two apart lets several queries share an `msearch` round trip
+    (see msearch_prepared). When the answer is known without ES (the geo
+    pyramid), `body` is None and `result` holds it.
+    """
+
+    def __init__(self, *, index: str | None = None, body: dict | None = None, parse=None, query_type: str = "search", error_prefix: str = "Search", result=None):
+        self.index = index
+        self.body = body
+        self.parse = parse
+        self.query_type = query_type
+        self.error_prefix = error_prefix
+        self.result = result
+
+
+async def run_prepared(es_client, query: PreparedQuery):
+    if query.body is None:
+        return query.result
+    try:
+        response = await cached_search(
+            es_client, index=query.index, body=query.body, query_type=query.query_type,
+        )
+        with phase("parse"):
+            return query.parse(response)
+    except Exception as e:
+        raise QueryError(f"{query.error_prefix} error: {str(e)}") from e
+
+
+async def msearch_prepared(es_client, queries: dict[str, PreparedQuery]) -> tuple[dict, dict]:
+    """Run many prepared queries in a single `msearch` round trip.
+
+    Queries answered from query_cache (or without ES) are not sent, and
+    identical bodies are sent once. Returns `(results, errors)` keyed like
+    `queries`: a failing sub-query only fails its own key.
+    """
+    responses, errors, pending = {}, {}, {}
+    for name, query in queries.items():
+        if query.body is None:
+            continue
+        key = cache_key(query.index, query.body)
+        hit, response = await query_cache.fetch(key)
+        if hit:
+            responses[name] = response
+        else:
+            pending.setdefault(key, (query, []))[1].append(name)
+
+    if pending:
+        searches = []
+        for query, _ in pending.values():
+            searches.extend([{"index": query.index}, query.body])
+        try:
+            response = await timed_es_call("msearch", es_client.msearch(searches=searches), body=searches)
+        except Exception as e:
+            raise QueryError(f"Batch error: {str(e)}") from e
+        for (key, (query, names)), item in zip(pending.items(), response["responses"]):
+            if "error" in item:
+                for name in names:
+                    errors[name] = f"{query.error_prefix} error: {item['error']}"
+                continue
+            await query_cache.put(key, item)
+            for name in names:
+                responses[name] = item
+
+    results = {}
+    for name, query in queries.items():
+        if query.body is None:
+            results[name] = query.result
+        elif name in responses:
+            try:
+                with phase("parse"):
+                    results[name] = query.parse(responses[name])
+            except Exception as e:
+                errors[name] = f"{query.error_prefix} error: {str(e)}"
+    return results, errors
+
+
+def build_search_body(*, params, aggregation_class, additional_aggs: dict | None = None, additional_filters: list | None = None, partial_class=None) -> dict:
+    """The from/size search body behind elastic_search."""
+    body = {
         "from": params.start,
         "size": params.size,
-        "query": {"bool": {"must": query_body, "filter": filters}},
-        "aggs": defaultdict(dict),
+        "query": build_query(
+            params=params, aggregation_class=aggregation_class,
+            additional_filters=additional_filters,
+        ),
     }
+    if params.aggs:
+        body["aggs"] = build_aggregations(
+            aggregation_class=aggregation_class, additional_aggs=additional_aggs,
+        )
 
-    if aggregation_fields:
-        for aggregation_field in aggregation_fields:
-            search_body["aggs"][aggregation_field] = {"terms": {"field": aggregation_field}}
+    sort = [{params.sort_field: {"order": params.sort_order}}] if params.sort_field else []
+    body["sort"] = sort
 
-    if additional_aggs:
-        search_body["aggs"].update(additional_aggs)
+    if partial_class is not None and params.projected():
+        body["_source"] = params.source_filter()
+    return body
 
-    search_body["sort"] = [{params.sort_field: {"order": params.sort_order}}]
 
-    try:
-        response = await es_client.search(index=index_name, body=search_body)
-        total = response["hits"]["total"]["value"]
-        hits = [r["_source"] for r in response["hits"]["hits"]]
-        aggregations = response["aggregations"]
-        return ElasticResponse[data_class, aggregation_class](
-            total=total, start=params.start, size=params.size,
-            results=hits, aggregations=aggregations,
+def prepare_search(
+    *,
+    index_name: str,
+    params,
+    data_class,
+    aggregation_class,
+    additional_aggs: dict | None = None,
+    additional_filters: list | None = None,
+    partial_class=None,
+    trusted: bool = False,
+) -> PreparedQuery:
+    """A from/size page of elastic_search; cursor paging cannot be prepared."""
+    def parse(response):
+        return _search_response(
+            [r["_source"] for r in response["hits"]["hits"]],
+            total=response["hits"]["total"]["value"], start=params.start,
+            aggregations=response.get("aggregations", {}), next_cursor=None,
+            params=params, data_class=data_class, aggregation_class=aggregation_class,
+            partial_class=partial_class, trusted=trusted,
         )
+
+    return PreparedQuery(
+        index=index_name,
+        body=build_search_body(
+            params=params, aggregation_class=aggregation_class, additional_aggs=additional_aggs,
+            additional_filters=additional_filters, partial_class=partial_class,
+        ),
+        parse=parse,
+    )
+
+
+async def elastic_search(
+    *,
+    es_client,
+    index_name: str,
+    params,
+    data_class,
+    aggregation_class,
+    additional_aggs: dict | None = None,
+    additional_filters: list | None = None,
+    partial_class=None,
+    trusted: bool = False,
+):
+    """Paged search with facets.
+
+    Pass `partial_class` to honour `fields`/`exclude` projection; results are
+    then typed as `record_type(data_class, partial_class)`. With `trusted`, a
+    plain dict is returned instead (see _search_response).
+    """
+    if params.cursor is not None:
+        return await _cursor_search(
+            es_client=es_client, index_name=index_name, params=params,
+            search_body=build_search_body(
+                params=params, aggregation_class=aggregation_class, additional_aggs=additional_aggs,
+                additional_filters=additional_filters, partial_class=partial_class,
+            ),
+            data_class=data_class, aggregation_class=aggregation_class,
+            partial_class=partial_class, trusted=trusted,
+        )
+    return await run_prepared(es_client, prepare_search(
+        index_name=index_name, params=params, data_class=data_class,
+        aggregation_class=aggregation_class, additional_aggs=additional_aggs,
+        additional_filters=additional_filters, partial_class=partial_class, trusted=trusted,
+    ))
+
+
+def prepare_facets(
+    *,
+    index_name: str,
+    params,
+    aggregation_class,
+    additional_aggs: dict | None = None,
+    additional_filters: list | None = None,
+) -> PreparedQuery:
+    """Aggregations only (`size: 0`), so facets can be fetched and cached apart from hits."""
+    def parse(response):
+        return query_plan(aggregation_class).facets_response_class(
+            total=response["hits"]["total"]["value"],
+            aggregations=response["aggregations"],
+        )
+
+    return PreparedQuery(
+        index=index_name,
+        body={
+            "size": 0,
+            "query": build_query(
+                params=params, aggregation_class=aggregation_class,
+                additional_filters=additional_filters,
+            ),
+            "aggs": build_aggregations(
+                aggregation_class=aggregation_class, additional_aggs=additional_aggs,
+            ),
+        },
+        parse=parse,
+        query_type="facets",
+    )
+
+
+async def elastic_facets(
+    *,
+    es_client,
+    index_name: str,
+    params,
+    aggregation_class,
+    additional_aggs: dict | None = None,
+    additional_filters: list | None = None,
+):
+    return await run_prepared(es_client, prepare_facets(
+        index_name=index_name, params=params, aggregation_class=aggregation_class,
+        additional_aggs=additional_aggs, additional_filters=additional_filters,
+    ))
+
+
+def _search_response(
+    hits: list[dict], *, total: int, start: int, aggregations: dict, next_cursor: str | None,
+    params, data_class, aggregation_class, partial_class, trusted: bool,
+):
+    """Wrap a page of hits as an ElasticResponse.
+
+    With `trusted`, return the same shape as a plain dict instead: documents
+    from our own index are passed through without per-hit validation.
+    """
+    if trusted:
+        return {
+            "total": total, "start": start, "size": params.size,
+            "results": hits, "aggregations": aggregations, "next_cursor": next_cursor,
+        }
+    plan = query_plan(aggregation_class)
+    if partial_class is None:
+        response_class, results = plan.response_class, hits
+    else:
+        # Projectable searches build their records up front (see record_type).
+        record_class = partial_class if params.projected() else data_class
+        response_class = plan.record_response_class
+        results = [record_class.model_validate(h) for h in hits]
+    return response_class(
+        total=total, start=start, size=params.size,
+        results=results, aggregations=aggregations, next_cursor=next_cursor,
+    )
+
+
+async def _cursor_search(*, es_client, index_name: str, params, search_body: dict, data_class, aggregation_class, partial_class, trusted):
+    """One page of a point-in-time + search_after walk.
+
+    `_shard_doc` is the PIT tiebreaker, so every page is a seek rather than a
+    from/size skip and the 10,000-hit window does not apply.
+    """
+    if params.cursor == CURSOR_START:
+        pit_id, search_after = None, None
+    else:
+        pit_id, search_after = decode_cursor(params.cursor)
+
+    try:
+        if pit_id is None:
+            pit = await timed_es_call("pit", es_client.open_point_in_time(index=index_name, keep_alive=PIT_KEEP_ALIVE))
+            pit_id = pit["id"]
+
+        search_body.pop("from")
+        search_body["sort"] = search_body["sort"] + [{"_shard_doc": "asc"}]
+        search_body["pit"] = {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE}
+        if search_after is not None:
+            search_body["search_after"] = search_after
+
+        # Requests against a PIT must not name an index.
+        response = await timed_es_call("search", es_client.search(body=search_body), body=search_body)
+        raw_hits = response["hits"]["hits"]
+        pit_id = response.get("pit_id", pit_id)
+
+        next_cursor = None
+        if len(raw_hits) == params.size:
+            next_cursor = encode_cursor(pit_id, raw_hits[-1]["sort"])
+        else:
+            await timed_es_call("pit", es_client.close_point_in_time(id=pit_id), shed=False)
+
+        with phase("parse"):
+            return _search_response(
+                [r["_source"] for r in raw_hits],
+                total=response["hits"]["total"]["value"], start=0,
+                aggregations=response.get("aggregations", {}), next_cursor=next_cursor,
+                params=params, data_class=data_class, aggregation_class=aggregation_class,
+                partial_class=partial_class, trusted=trusted,
+            )
     except Exception as e:
         raise QueryError(f"Search error: {str(e)}") from e
 
 
 async def elastic_details(*, es_client, index_name: str, record_id: str, data_class):
+    """Realtime GET by document id; a missing document yields an empty result list."""
     try:
-        response = await es_client.search(
-            index=index_name, q=f"_id:{urllib.parse.quote(record_id, safe='')}"
-        )
-        hits = [r["_source"] for r in response["hits"]["hits"]]
+        try:
+            response = await timed_es_call(
+                "details", es_client.get(index=index_name, id=record_id), body={"get": record_id},
+            )
+            hits = [response["_source"]]
+        except NotFoundError as e:
+            # Only a missing document is an empty result; a missing index is an error.
+            if not isinstance(e.body, dict) or e.body.get("found") is not False:
+                raise
+            hits = []
         return ElasticDetailsResponse[data_class](results=hits)
     except Exception as e:
         raise QueryError(f"Search error: {str(e)}") from e
 
 
-async def data_portal_search_full(*, es_client, params, samples_index: str, data_portal_index: str, data_class, aggregation_class):
-    """Data-portal-specific extras: taxonomy aggregations + cross-index geo expansion."""
-    additional_aggs = {
-        "kingdom": {"terms": {"field": "phylogeny.kingdom.keyword"}},
-        "tax_order": {"terms": {"field": "phylogeny.order.keyword"}},
-        "family": {"terms": {"field": "phylogeny.family.keyword"}},
-    }
+def prepare_details(*, index_name: str, record_id: str, data_class) -> PreparedQuery:
+    """elastic_details as an `ids` search, for msearch. Unlike GET it is not realtime."""
+    return PreparedQuery(
+        index=index_name,
+        body={"size": 1, "query": {"ids": {"values": [record_id]}}},
+        parse=lambda response: ElasticDetailsResponse[data_class](
+            results=[r["_source"] for r in response["hits"]["hits"]]
+        ),
+        query_type="details",
+    )
+
+
+async def elastic_mget(*, es_client, index_name: str, record_ids: list[str], data_class, trusted: bool = False):
+    """Resolve many ids in one mget round trip, preserving request order."""
+    try:
+        response = await timed_es_call(
+            "mget", es_client.mget(index=index_name, ids=record_ids), body={"mget": record_ids},
+        )
+        results, missing = [], []
+        for doc in response["docs"]:
+            if "error" in doc:
+                raise QueryError(f"mget error for {doc['_id']}: {doc['error']}")
+            if doc.get("found"):
+                results.append(doc["_source"])
+            else:
+                missing.append(doc["_id"])
+        if trusted:
+            return {"results": results, "missing": missing}
+        return ElasticMgetResponse[data_class](results=results, missing=missing)
+    except Exception as e:
+        raise QueryError(f"Search error: {str(e)}") from e
+
+
+DATA_PORTAL_TAXONOMY_AGGS = {
+    "kingdom": {"terms": {"field": "phylogeny.kingdom.keyword"}},
+    "tax_order": {"terms": {"field": "phylogeny.order.keyword"}},
+    "family": {"terms": {"field": "phylogeny.family.keyword"}},
+}
+
+
+async def data_portal_filters(*, es_client, params, samples_index: str) -> list:
+    """Taxonomy filters plus the bounding box.
+
+    The box filters `locations` directly when it is a geo_point; otherwise it
+    costs an extra samples query to expand into matching taxIds.
+    """
     additional_filters = []
     if params.kingdom:
         additional_filters.append({"terms": {"phylogeny.kingdom.keyword": [params.kingdom]}})
@@ -105,40 +537,129 @@ async def data_portal_search_full(*, es_client, params, samples_index: str, data
     if params.family:
         additional_filters.append({"terms": {"phylogeny.family.keyword": [params.family]}})
 
-    if params.has_bounds():
+    if params.has_bounds() and _data_portal_geo_native:
+        additional_filters.append(_bounding_box(params, DATA_PORTAL_GEO_FIELD))
+    elif params.has_bounds():
         geo_query = {
             "size": 0,
-            "query": {"bool": {"filter": {"geo_bounding_box": {"location": {
-                "top_left": {"lat": params.top_left_lat, "lon": params.top_left_lon},
-                "bottom_right": {"lat": params.bottom_right_lat, "lon": params.bottom_right_lon},
-            }}}}},
+            "query": {"bool": {"filter": _bounding_box(params, "location")}},
             "aggs": {"tax_ids": {"terms": {"field": "taxId", "size": 10000}}},
         }
-        geo_response = await es_client.search(index=samples_index, body=geo_query)
+        geo_response = await cached_search(
+            es_client, index=samples_index, body=geo_query, query_type="geo_expansion",
+        )
         tax_ids = [b["key"] for b in geo_response["aggregations"]["tax_ids"]["buckets"]]
         additional_filters.append({"terms": {"taxId": tax_ids if tax_ids else [-1]}})
 
+    return additional_filters
+
+
+async def data_portal_search_full(*, es_client, params, samples_index: str, data_portal_index: str, data_class, aggregation_class, partial_class=None, trusted: bool = False):
+    """Data-portal-specific extras: taxonomy aggregations + cross-index geo expansion."""
+    additional_filters = await data_portal_filters(
+        es_client=es_client, params=params, samples_index=samples_index,
+    )
     return await elastic_search(
         es_client=es_client,
         index_name=data_portal_index,
         params=params,
         data_class=data_class,
         aggregation_class=aggregation_class,
-        additional_aggs=additional_aggs,
+        additional_aggs=DATA_PORTAL_TAXONOMY_AGGS,
         additional_filters=additional_filters if additional_filters else None,
+        partial_class=partial_class,
+        trusted=trusted,
     )
 
 
-async def samples_geo_aggregation_query(*, es_client, params, samples_index: str):
-    precision = min(max(params.zoom + 2, 4), 12)
+async def prepare_data_portal_search(*, es_client, params, samples_index: str, data_portal_index: str, data_class, aggregation_class, partial_class=None, trusted: bool = False) -> PreparedQuery:
+    """data_portal_search_full, prepared. Resolving the filters may itself query samples."""
+    additional_filters = await data_portal_filters(
+        es_client=es_client, params=params, samples_index=samples_index,
+    )
+    return prepare_search(
+        index_name=data_portal_index,
+        params=params,
+        data_class=data_class,
+        aggregation_class=aggregation_class,
+        additional_aggs=DATA_PORTAL_TAXONOMY_AGGS,
+        additional_filters=additional_filters if additional_filters else None,
+        partial_class=partial_class,
+        trusted=trusted,
+    )
 
-    filters = []
+
+async def prepare_data_portal_facets(*, es_client, params, samples_index: str, data_portal_index: str, aggregation_class) -> PreparedQuery:
+    additional_filters = await data_portal_filters(
+        es_client=es_client, params=params, samples_index=samples_index,
+    )
+    return prepare_facets(
+        index_name=data_portal_index,
+        params=params,
+        aggregation_class=aggregation_class,
+        additional_aggs=DATA_PORTAL_TAXONOMY_AGGS,
+        additional_filters=additional_filters if additional_filters else None,
+    )
+
+
+async def data_portal_facets_full(*, es_client, params, samples_index: str, data_portal_index: str, aggregation_class):
+    """Facets for the data portal, with the same taxonomy aggregations and filters as the search."""
+    return await run_prepared(es_client, await prepare_data_portal_facets(
+        es_client=es_client, params=params, samples_index=samples_index,
+        data_portal_index=data_portal_index, aggregation_class=aggregation_class,
+    ))
+
+
+SUGGEST_SOURCE = ["taxId", "scientificName", "commonName"]
+SUGGEST_MATCH_FIELDS = ["scientificName", "commonName", "phylogeny.*"]
+
+
+def prepare_data_portal_suggest(*, params, data_portal_index: str) -> PreparedQuery:
+    """Species ids and names for a typed prefix; no facets, no totals, three fields per hit."""
+    if _data_portal_suggest_native:
+        body = {
+            "size": 0,
+            "_source": SUGGEST_SOURCE,
+            "suggest": {"species": {
+                "prefix": params.prefix,
+                "completion": {"field": DATA_PORTAL_SUGGEST_FIELD, "size": params.size},
+            }},
+        }
+
+        def hits(response):
+            return [o["_source"] for o in response["suggest"]["species"][0]["options"]]
+    else:
+        body = {
+            "size": params.size,
+            "_source": SUGGEST_SOURCE,
+            "track_total_hits": False,
+            "query": {"multi_match": {
+                "query": params.prefix, "type": "bool_prefix", "fields": SUGGEST_MATCH_FIELDS,
+            }},
+        }
+
+        def hits(response):
+            return [h["_source"] for h in response["hits"]["hits"]]
+
+    return PreparedQuery(
+        index=data_portal_index,
+        body=body,
+        parse=lambda response: SuggestResponse(suggestions=hits(response)),
+        query_type="suggest",
+        error_prefix="Suggest",
+    )
+
+
+async def data_portal_suggest(*, es_client, params, data_portal_index: str):
+    return await run_prepared(es_client, prepare_data_portal_suggest(
+        params=params, data_portal_index=data_portal_index,
+    ))
+
+
+def build_samples_geo_query(params, *, filters: list | None = None) -> dict:
+    """Samples query for the map: taxId/country/trackingSystem filters plus free text."""
+    filters = list(filters or [])
     must = []
-    if params.has_bounds():
-        filters.append({"geo_bounding_box": {"location": {
-            "top_left": {"lat": params.top_left_lat, "lon": params.top_left_lon},
-            "bottom_right": {"lat": params.bottom_right_lat, "lon": params.bottom_right_lon},
-        }}})
     if params.tax_id is not None:
         filters.append({"term": {"taxId": params.tax_id}})
     if params.tax_ids:
@@ -160,16 +681,30 @@ async def samples_geo_aggregation_query(*, es_client, params, samples_index: str
             query["bool"]["must"] = must
     else:
         query = {"match_all": {}}
+    return query
 
-    search_body = {
-        "size": 0,
-        "query": query,
-        "aggs": {"grid": {"geotile_grid": {"field": "location", "precision": precision},
-                          "aggs": {"centroid": {"geo_centroid": {"field": "location"}}}}},
-    }
 
-    try:
-        response = await es_client.search(index=samples_index, body=search_body)
+def has_sample_geo_filters(params) -> bool:
+    return bool(
+        params.tax_id is not None or params.tax_ids or params.q
+        or params.country or params.trackingSystem
+    )
+
+
+def prepare_samples_geo_aggregation(*, params, samples_index: str) -> PreparedQuery:
+    # The unfiltered map (any viewport) is served from the precomputed pyramid.
+    if not has_sample_geo_filters(params):
+        response = geo_pyramid.clusters(params)
+        if response is not None:
+            return PreparedQuery(result=response)
+
+    precision = min(max(params.zoom + 2, 4), 12)
+
+    query = build_samples_geo_query(
+        params, filters=[_bounding_box(params, "location")] if params.has_bounds() else None,
+    )
+
+    def parse(response):
         clusters = [
             GeoCluster(
                 lat=b["centroid"]["location"]["lat"],
@@ -180,5 +715,187 @@ async def samples_geo_aggregation_query(*, es_client, params, samples_index: str
             for b in response["aggregations"]["grid"]["buckets"]
         ]
         return GeoAggregationResponse(clusters=clusters)
+
+    return PreparedQuery(
+        index=samples_index,
+        body={
+            "size": 0,
+            "query": query,
+            "aggs": {"grid": {"geotile_grid": {"field": "location", "precision": precision},
+                              "aggs": {"centroid": {"geo_centroid": {"field": "location"}}}}},
+        },
+        parse=parse,
+        query_type="geo_aggregation",
+        error_prefix="Geo aggregation",
+    )
+
+
+async def samples_geo_aggregation_query(*, es_client, params, samples_index: str):
+    return await run_prepared(es_client, prepare_samples_geo_aggregation(params=params, samples_index=samples_index))
+
+
+# Bucket caps for the species summary; far above any species in the index.
+SUMMARY_MAX_COUNTRIES = 500
+SUMMARY_MAX_LOCATIONS = 10000
+# Points are grouped into geotile cells this fine (~40 m at the equator), so
+# samples taken at the same site share one map marker.
+SUMMARY_LOCATION_PRECISION = 20
+
+
+def prepare_species_summary(*, tax_id: int, samples_index: str) -> PreparedQuery:
+    """Everything a species page shows about its samples, from aggregations over all of them."""
+    def parse(response):
+        aggs = response["aggregations"]
+        locations = []
+        for bucket in aggs["locations"]["buckets"]:
+            location = {
+                "lat": bucket["centroid"]["location"]["lat"],
+                "lon": bucket["centroid"]["location"]["lon"],
+                "count": bucket["doc_count"],
+            }
+            if bucket["doc_count"] == 1:
+                location.update(bucket["sample"]["hits"]["hits"][0]["_source"])
+            locations.append(location)
+        return SpeciesSummaryResponse(
+            taxId=tax_id,
+            sampleCount=response["hits"]["total"]["value"],
+            countries=[b["key"] for b in aggs["countries"]["buckets"]],
+            organismParts=aggs["organismParts"]["buckets"],
+            sex=aggs["sex"]["buckets"],
+            locations=locations,
+            bounds=aggs["bounds"].get("bounds"),
+        )
+
+    return PreparedQuery(
+        index=samples_index,
+        body={
+            "size": 0,
+            "track_total_hits": True,
+            "query": {"bool": {"filter": [{"term": {"taxId": tax_id}}]}},
+            "aggs": {
+                "countries": {"terms": {"field": "country", "size": SUMMARY_MAX_COUNTRIES, "order": {"_key": "asc"}}},
+                "organismParts": {"terms": {"field": "organismPart", "size": 50}},
+                "sex": {"terms": {"field": "sex", "size": 20}},
+                "bounds": {"geo_bounds": {"field": "location"}},
+                "locations": {
+                    "geotile_grid": {
+                        "field": "location", "precision": SUMMARY_LOCATION_PRECISION, "size": SUMMARY_MAX_LOCATIONS,
+                    },
+                    "aggs": {
+                        "centroid": {"geo_centroid": {"field": "location"}},
+                        "sample": {"top_hits": {"size": 1, "_source": ["accession", "organismPart"]}},
+                    },
+                },
+            },
+        },
+        parse=parse,
+        query_type="summary",
+        error_prefix="Summary",
+    )
+
+
+async def species_summary(*, es_client, tax_id: int, samples_index: str):
+    return await run_prepared(es_client, prepare_species_summary(tax_id=tax_id, samples_index=samples_index))
+
+
+EXPORT_BATCH_SIZE = 1000
+
+
+async def export_search(*, es_client, index_name: str, query: dict, source: dict | None = None, shed: bool = False):
+    """Open a PIT over `query` and return an async iterator of every matching `_source`.
+
+    The PIT is opened and the first page fetched eagerly, both through the ES
+    budget, so connection/index errors and a saturated budget surface as
+    QueryError before a streaming response has committed to a status code.
+    Later pages wait for a budget slot unless `shed` is set, for callers that
+    are still answering a request (see sample_tree.py). Pages skip
+    aggregations and total-hit counting and sort on `_shard_doc` only, which
+    is the cheapest order ES can produce.
+    """
+    try:
+        pit = await timed_es_call("pit", es_client.open_point_in_time(index=index_name, keep_alive=PIT_KEEP_ALIVE))
+        pages = _walk_point_in_time(es_client=es_client, pit_id=pit["id"], query=query, source=source, shed=shed)
+        first = await anext(pages)
+    except Exception as e:
+        raise QueryError(f"Export error: {str(e)}") from e
+    return _documents(first, pages)
+
+
+async def _documents(first: list[dict], pages):
+    try:
+        for document in first:
+            yield document
+        async for page in pages:
+            for document in page:
+                yield document
+    finally:
+        await pages.aclose()
+
+
+async def _walk_point_in_time(*, es_client, pit_id: str, query: dict, source: dict | None, shed: bool):
+    """Each page's `_source`s in turn; always yields at least once, and closes the PIT when done."""
+    search_after = None
+    try:
+        while True:
+            body = {
+                "size": EXPORT_BATCH_SIZE,
+                "query": query,
+                "sort": [{"_shard_doc": "asc"}],
+                "track_total_hits": False,
+                "pit": {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE},
+            }
+            if source is not None:
+                body["_source"] = source
+            if search_after is not None:
+                body["search_after"] = search_after
+            # Once a response is streaming, later pages wait for a slot rather than fail.
+            response = await timed_es_call(
+                "export", es_client.search(body=body), body=body, shed=shed or search_after is None,
+            )
+            pit_id = response.get("pit_id", pit_id)
+            hits = response["hits"]["hits"]
+            yield [hit["_source"] for hit in hits]
+            if len(hits) < EXPORT_BATCH_SIZE:
+                return
+            search_after = hits[-1]["sort"]
+    finally:
+        await timed_es_call("pit", es_client.close_point_in_time(id=pit_id), shed=False)
+
+
+# Extra zoom levels for the tile's grid cells: zoom + 2, the same cell size
+# as /samples/geo_aggregation clusters.
+TILE_GRID_PRECISION = 2
+
+
+async def samples_vector_tile(*, es_client, params, samples_index: str, z: int, x: int, y: int) -> bytes:
+    """Mapbox Vector Tile of geotile sample clusters (centroids) from the ES `_mvt` API.
+
+    The tile carries only the aggregation layer (`size=0`), each cell with its
+    `_count`. Tiles are fixed-address, so they are cached like search bodies.
+    """
+    query = build_samples_geo_query(params)
+    key = cache_key("mvt", samples_index, z, x, y, query)
+    hit, tile = await query_cache.fetch(key)
+    if hit:
+        return tile
+
+    async def fetch_tile():
+        response = await timed_es_call("tile", es_client.search_mvt(
+            index=samples_index,
+            field="location",
+            zoom=z, x=x, y=y,
+            grid_agg="geotile",
+            grid_precision=TILE_GRID_PRECISION,
+            grid_type="centroid",
+            size=0,
+            track_total_hits=False,
+            query=query,
+        ), body={"mvt": [z, x, y], "query": query})
+        result = bytes(response.body)
+        await query_cache.put(key, result)
+        return result
+
+    try:
+        return await search_flights.do(key, fetch_tile)
     except Exception as e:
-        raise QueryError(f"Geo aggregation error: {str(e)}") from e
+        raise QueryError(f"Vector tile error: {str(e)}") from e
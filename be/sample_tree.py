@@ -0,0 +1,114 @@
+# be/sample_tree.py
+from cache import cache_key, sample_tree_cache, search_flights
+from models import SampleTreeNode, SampleTreeResponse
+from queries import QueryError, export_search
+from server_timing import phase
+
+# What a tree row needs: the links between samples plus the few fields shown
+# beside each accession. Everything else stays in ES.
+TREE_FIELDS = [
+    "accession", "derivedFrom", "sampleSameAs", "relationship",
+    "organismPart", "sex", "trackingSystem",
+]
+
+
+class SampleTree:
+    """A species' samples arranged by `derivedFrom`, built once and paged from memory.
+
+    `sampleSameAs` names another accession for the same sample, so a child
+    derived from that accession hangs under this sample. Samples whose parent
+    is not among the species' samples, and one member of each derivation
+    cycle, become roots, so every sample appears exactly once.
+    """
+
+    def __init__(self, samples: list[dict]):
+        samples = sorted(samples, key=lambda s: s["accession"])
+        self.nodes = {s["accession"]: s for s in samples}
+        aliases = {
+            s["sampleSameAs"]: s["accession"]
+            for s in samples
+            if s.get("sampleSameAs") and s["sampleSameAs"] not in self.nodes
+        }
+
+        self.children: dict[str, list[str]] = {}
+        self.roots: list[str] = []
+        for sample in samples:
+            parent = sample.get("derivedFrom")
+            parent = aliases.get(parent, parent)
+            if parent in self.nodes and parent != sample["accession"]:
+                self.children.setdefault(parent, []).append(sample["accession"])
+            else:
+                self.roots.append(sample["accession"])
+
+        # A derivation cycle has no way in from a root; break each one at its
+        # first accession, keeping the rest of it as that sample's subtree.
+        reached: set[str] = set()
+        for root in self.roots:
+            self._reach(root, reached)
+        for accession in self.nodes:
+            if accession not in reached:
+                parent = self.nodes[accession]["derivedFrom"]
+                self.children[aliases.get(parent, parent)].remove(accession)
+                self.roots.append(accession)
+                self._reach(accession, reached)
+
+    def _reach(self, accession: str, reached: set[str]) -> None:
+        stack = [accession]
+        while stack:
+            current = stack.pop()
+            reached.add(current)
+            stack.extend(c for c in self.children.get(current, ()) if c not in reached)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def _node(self, accession: str, expand: int) -> SampleTreeNode:
+        children = self.children.get(accession, [])
+        return SampleTreeNode(
+            **{field: self.nodes[accession].get(field) for field in TREE_FIELDS},
+            childCount=len(children),
+            children=[self._node(c, 0) for c in children[:expand]] if expand else None,
+        )
+
+    def page(self, *, tax_id: int, parent: str | None, start: int, size: int, expand: int) -> SampleTreeResponse | None:
+        """Children of `parent` (roots when None) from `start`; None for an unknown parent."""
+        if parent is not None and parent not in self.nodes:
+            return None
+        accessions = self.roots if parent is None else self.children.get(parent, [])
+        return SampleTreeResponse(
+            taxId=tax_id,
+            sampleCount=len(self.nodes),
+            parent=parent,
+            total=len(accessions),
+            start=start,
+            size=size,
+            results=[self._node(a, expand) for a in accessions[start:start + size]],
+        )
+
+
+async def species_sample_tree(*, es_client, tax_id: int, samples_index: str) -> SampleTree:
+    """The tree over every sample of `tax_id`, from a projected PIT walk; cached per taxId."""
+    key = cache_key("sample_tree", samples_index, tax_id)
+    hit, tree = await sample_tree_cache.fetch(key)
+    if hit:
+        return tree
+
+    async def build():
+        documents = await export_search(
+            es_client=es_client,
+            index_name=samples_index,
+            query={"bool": {"filter": [{"term": {"taxId": tax_id}}]}},
+            source={"includes": TREE_FIELDS},
+            # Still answering the request: shed under load rather than queue.
+            shed=True,
+        )
+        try:
+            samples = [document async for document in documents]
+        except Exception as e:
+            raise QueryError(f"Sample tree error: {str(e)}") from e
+        with phase("build_tree"):
+            result = SampleTree(samples)
+        await sample_tree_cache.put(key, result)
+        return result
+
+    return await search_flights.do(key, build)
@@ -0,0 +1,67 @@
+# be/serve.py
+"""Run the BE under uvicorn with one worker process per available CPU.
+
+    python serve.py              # what the container runs
+
+WEB_CONCURRENCY overrides the worker count. With more than one worker:
+- the query and sample-tree caches get a second tier shared by every worker
+  (SHARED_CACHE_PATH, a SQLite file on tmpfs; see cache.SharedStore);
+- MCP runs its Streamable HTTP transport stateless, since any worker may
+  receive any request of a session;
+- one worker, the holder of a lock beside SHARED_CACHE_PATH, builds the
+  geotile pyramid and warms the caches for all (see main.prime_caches);
+- Prometheus metrics go through PROMETHEUS_MULTIPROC_DIR, so any worker's
+  /api/metrics reports them all (see metrics.exposition);
+- the per-client limits (RATE_LIMIT_*, CLIENT_MAX_IN_FLIGHT) are split
+  between the workers. ES_MAX_IN_FLIGHT stays per worker, as it protects
+  each process's event loop as much as ES.
+"""
+import math
+import os
+import shutil
+
+import uvicorn
+
+
+def available_cpus() -> int:
+    """CPUs this process may use: the cgroup quota when one is set, else the affinity mask."""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    try:
+        # cgroup v2: "<quota> <period>", or "max <period>" when unlimited.
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(cpus, 1)
+
+
+def main():
+    workers = int(os.getenv("WEB_CONCURRENCY", "0")) or available_cpus()
+    # Read by main.py in every worker to split the per-client limits.
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    if workers > 1:
+        os.environ.setdefault("SHARED_CACHE_PATH", "/dev/shm/aegis-cache.sqlite")
+        os.environ.setdefault("MCP_STATELESS", "true")
+        # Metric files from a previous run would be summed in; start empty.
+        metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/dev/shm/aegis-metrics")
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir)
+        # Start the shared stores empty; the workers create them on first use.
+        for store in ("", ".lead"):
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.remove(os.environ["SHARED_CACHE_PATH"] + store + suffix)
+                except FileNotFoundError:
+                    pass
+    uvicorn.run(
+        "main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8080")),
+        workers=workers,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# be/server_timing.py
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from starlette.datastructures import MutableHeaders
+
+_current: ContextVar["RequestTimings | None"] = ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """Phase durations for the request being served, in milliseconds.
+
+    Repeated phases (e.g. several searches behind one route) are summed.
+    With `profile` set, searches bypass the query cache and carry the ES
+    Profile API output back in `profiles`.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: dict[str, float] = {}
+        self.last_phase_end: float | None = None
+        self.profile = False
+        self.profiles: list[dict] = []
+
+    def record(self, name: str, milliseconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + milliseconds
+        self.last_phase_end = time.perf_counter()
+
+    def add_profile(self, query_type: str, profile: dict | None) -> None:
+        if not profile:
+            return
+        self.profiles.append({"query_type": query_type, "profile": profile})
+        # Shards run in parallel, so the slowest one is what the request waited on.
+        shards = profile.get("shards", [])
+        query_ns = max((sum(q["time_in_nanos"] for s in shard.get("searches", []) for q in s.get("query", []))
+                        for shard in shards), default=0)
+        aggs_ns = max((sum(a["time_in_nanos"] for a in shard.get("aggregations", [])) for shard in shards), default=0)
+        self.record(f"{query_type}_query", query_ns / 1e6)
+        self.record(f"{query_type}_aggs", aggs_ns / 1e6)
+
+    def header(self) -> str:
+        now = time.perf_counter()
+        entries = [f"{name};dur={ms:.1f}" for name, ms in self.phases.items()]
+        if self.last_phase_end is not None:
+            # From the last recorded phase to the response start: response
+            # model validation and JSON encoding.
+            entries.append(f"serialize;dur={(now - self.last_phase_end) * 1000:.1f}")
+        entries.append(f"total;dur={(now - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+
+def current_timings() -> RequestTimings | None:
+    return _current.get()
+
+
+def record(name: str, milliseconds: float) -> None:
+    timings = _current.get()
+    if timings is not None:
+        timings.record(name, milliseconds)
+
+
+@contextmanager
+def phase(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (time.perf_counter() - started) * 1000)
+
+
+class ServerTimingMiddleware:
+    """Break each HTTP response down into phases with a `Server-Timing` header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = RequestTimings()
+        token = _current.set(timings)
+
+        async def send_with_timings(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("Server-Timing", timings.header())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timings)
+        finally:
+            _current.reset(token)
@@ -0,0 +1,131 @@
+# be/slow_queries.py
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# The route template or MCP tool that issued the ES calls in this context.
+_caller: ContextVar[str | None] = ContextVar("slow_query_caller", default=None)
+
+# Values under these keys name fields rather than carry user input, so they
+# are part of a query's shape.
+_SHAPE_KEYS = frozenset({"field"})
+
+
+def set_caller(caller: str) -> None:
+    """Tag the rest of the current context (an HTTP request) with its caller."""
+    _caller.set(caller)
+
+
+@contextmanager
+def calling(caller: str):
+    """Tag ES calls made inside the block, e.g. an MCP tool run in a long-lived session task."""
+    token = _caller.set(caller)
+    try:
+        yield
+    finally:
+        _caller.reset(token)
+
+
+def query_shape(value, key: str | None = None):
+    """`value` with literals replaced by "?"; lists of literals collapse to ["?"]."""
+    if isinstance(value, dict):
+        return {k: query_shape(v, k) for k, v in sorted(value.items())}
+    if isinstance(value, list):
+        if all(not isinstance(v, (dict, list)) for v in value):
+            return ["?"] if value else []
+        return [query_shape(v) for v in value]
+    if key in _SHAPE_KEYS:
+        return value
+    return "?"
+
+
+def fingerprint(shape) -> str:
+    return hashlib.sha1(json.dumps(shape, separators=(",", ":")).encode()).hexdigest()[:16]
+
+
+def _total_hits(response) -> int | None:
+    try:
+        total = response["hits"]["total"]
+    except (KeyError, TypeError):
+        return None
+    return total["value"] if isinstance(total, dict) else total
+
+
+class SlowQueryLog:
+    """ES calls slower than `threshold_ms`: logged as JSON and kept for a top-N summary.
+
+    Only the most recent `window` slow calls are summarised, so the ranking
+    follows what is slow now rather than since startup. A threshold of 0
+    disables the log.
+    """
+
+    def __init__(self, *, threshold_ms: float, window: int):
+        self.threshold_ms = threshold_ms
+        self._entries: deque[dict] = deque(maxlen=window)
+
+    def observe(self, *, query_type: str, body, wall_ms: float, response) -> None:
+        if self.threshold_ms <= 0 or wall_ms < self.threshold_ms:
+            return
+        shape = query_shape(body)
+        took = None
+        try:
+            took = response["took"]
+        except (KeyError, TypeError):
+            pass
+        entry = {
+            "event": "slow_query",
+            "fingerprint": fingerprint(shape),
+            "query_type": query_type,
+            "caller": _caller.get() or "background",
+            "wall_ms": round(wall_ms, 1),
+            "took_ms": took,
+            "hits": _total_hits(response),
+            "aggs": len(body.get("aggs", {})) if isinstance(body, dict) else 0,
+            "timestamp": time.time(),
+        }
+        logger.warning(json.dumps(entry))
+        self._entries.append({**entry, "shape": shape})
+
+    def top(self, limit: int) -> list[dict]:
+        """Fingerprints in the window ranked by total time spent in them."""
+        groups: dict[str, dict] = {}
+        for entry in self._entries:
+            group = groups.get(entry["fingerprint"])
+            if group is None:
+                group = groups[entry["fingerprint"]] = {
+                    "fingerprint": entry["fingerprint"],
+                    "query_type": entry["query_type"],
+                    "shape": entry["shape"],
+                    "callers": [],
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "last_seen": 0.0,
+                }
+            group["count"] += 1
+            group["total_ms"] += entry["wall_ms"]
+            group["max_ms"] = max(group["max_ms"], entry["wall_ms"])
+            group["last_seen"] = entry["timestamp"]
+            if entry["caller"] not in group["callers"]:
+                group["callers"].append(entry["caller"])
+        ranked = sorted(groups.values(), key=lambda g: g["total_ms"], reverse=True)[:limit]
+        for group in ranked:
+            group["total_ms"] = round(group["total_ms"], 1)
+            group["mean_ms"] = round(group["total_ms"] / group["count"], 1)
+        return ranked
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+slow_query_log = SlowQueryLog(
+    threshold_ms=float(os.getenv("SLOW_QUERY_MS", "500")),
+    window=int(os.getenv("SLOW_QUERY_WINDOW", "1000")),
+)
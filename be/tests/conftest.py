@@ -1,7 +1,19 @@
+import os
 from unittest.mock import AsyncMock
 import pytest
 from httpx import ASGITransport, AsyncClient
-from main import app
+
+# Every test request comes from the same address; per-client rate limits are
+# exercised in test_admission.py instead.
+os.environ.setdefault("RATE_LIMIT_PER_SECOND", "0")
+os.environ.setdefault("METRICS_TOKEN", "metrics-secret")
+
+from main import app  # noqa: E402
+
+
+@pytest.fixture
+def metrics_auth():
+    return {"Authorization": f"Bearer {os.environ['METRICS_TOKEN']}"}
 
 
 @pytest.fixture
@@ -97,3 +109,19 @@ async def mcp_http_session():
     finally:
         if mount_entry is not None and original_app is not None:
             mount_entry.app = original_app
+
+
+@pytest.fixture(autouse=True)
+def clear_query_cache():
+    """Module-level caches would otherwise leak mocked ES responses between tests."""
+    import queries
+    from cache import query_cache, sample_tree_cache
+    from geo_pyramid import geo_pyramid
+    query_cache.clear()
+    sample_tree_cache.clear()
+    geo_pyramid.clear()
+    queries._index_generation = ()
+    queries._data_portal_geo_native = False
+    queries._data_portal_suggest_native = False
+    yield
+    query_cache.clear()
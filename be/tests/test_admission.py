@@ -0,0 +1,216 @@
+import json
+
+import anyio
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from admission import AdmissionMiddleware, EsBudget, Overloaded, batch_cost, mget_cost, page_size_cost
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+async def ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def admitted(app, **options):
+    middleware = AdmissionMiddleware(app, **{"rate": 1, "burst": 2, "max_client_in_flight": 0, **options})
+    return AsyncClient(transport=ASGITransport(app=middleware), base_url="http://test")
+
+
+@pytest.mark.anyio
+async def test_token_bucket_per_client_with_retry_after():
+    clock = Clock()
+    async with admitted(ok_app, client_header="X-Forwarded-For", clock=clock, exempt=("/api/ready",)) as client:
+        me = {"X-Forwarded-For": "spoofed, 10.0.0.1"}
+        assert [(await client.get("/api/samples", headers=me)).status_code for _ in range(2)] == [200, 200]
+        response = await client.get("/api/samples", headers=me)
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == "1"
+
+        # Another client, and exempt paths, are unaffected.
+        assert (await client.get("/api/samples", headers={"X-Forwarded-For": "spoofed, 10.0.0.2"})).status_code == 200
+        assert (await client.get("/api/ready", headers=me)).status_code == 200
+
+        clock.now += 1
+        assert (await client.get("/api/samples", headers=me)).status_code == 200
+
+
+@pytest.mark.anyio
+async def test_large_pages_cost_more_tokens():
+    assert page_size_cost({"query_string": b"q=x"}) == 1
+    assert page_size_cost({"query_string": b"taxId=1&size=1000"}) == 11
+    assert page_size_cost({"query_string": b"size=lots"}) == 1
+    assert page_size_cost({"query_string": b"size=10000&fields=taxId"}) == 11
+
+    async with admitted(ok_app, rate=10, burst=30, cost=page_size_cost, clock=Clock()) as client:
+        assert (await client.get("/api/samples?size=1000")).status_code == 200
+        assert (await client.get("/api/samples?size=1000")).status_code == 200
+        response = await client.get("/api/samples?size=1000")
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == "1"
+        assert (await client.get("/api/samples?size=10")).status_code == 200
+
+
+@pytest.mark.anyio
+async def test_fe_server_is_limited_per_end_user():
+    trusted = {"X-Client-Token": "secret"}
+    options = dict(rate=20, burst=60, max_client_in_flight=8, cost=page_size_cost, trusted_token="secret", clock=Clock())
+    async with admitted(ok_app, **options) as client:
+        # One portal user: the landing table, then the taxonomy expansion for the map.
+        alice = {**trusted, "X-End-User": "10.0.0.1"}
+        assert (await client.get("/api/data_portal?size=10&fields=taxId,scientificName", headers=alice)).status_code == 200
+        assert (await client.get("/api/data_portal?size=10000&fields=taxId", headers=alice)).status_code == 200
+        assert (await client.get("/api/samples/geo_aggregation?zoom=2", headers=alice)).status_code == 200
+
+        # Users have buckets of their own, not the FE's.
+        assert (await client.get("/api/samples?size=5000", headers=alice)).status_code == 429
+        bob = {**trusted, "X-End-User": "10.0.0.2"}
+        assert (await client.get("/api/samples?size=5000", headers=bob)).status_code == 200
+
+        # Without the token, X-End-User is ignored.
+        forged = {"X-Client-Token": "guess", "X-End-User": "10.0.0.3"}
+        assert (await client.get("/api/samples?size=5000", headers=forged)).status_code == 200
+        assert (await client.get("/api/samples?size=5000", headers=forged)).status_code == 429
+
+
+@pytest.mark.anyio
+async def test_batch_and_mget_bodies_are_priced():
+    big = {"type": "search", "index": "samples", "params": {"size": 1000}}
+    assert batch_cost(json.dumps({"queries": {str(i): big for i in range(3)}}).encode()) == 33
+    assert batch_cost(b"not json") == 1
+    assert mget_cost(json.dumps({"ids": list(range(500))}).encode()) == 6
+
+    received = []
+
+    async def echo_app(scope, receive, send):
+        received.append((await receive())["body"])
+        await ok_app(scope, receive, send)
+
+    async with admitted(echo_app, rate=10, burst=30, priced_bodies={"/api/_batch": batch_cost}, clock=Clock()) as client:
+        body = {"queries": {"a": big, "b": big}}
+        assert (await client.post("/api/_batch", json=body)).status_code == 200
+        assert json.loads(received[0]) == body
+        # 22 of 30 tokens spent: another such batch is refused.
+        assert (await client.post("/api/_batch", json=body)).status_code == 429
+
+
+@pytest.mark.anyio
+async def test_concurrent_requests_per_client_are_capped():
+    release = anyio.Event()
+
+    async def slow_app(scope, receive, send):
+        await release.wait()
+        await ok_app(scope, receive, send)
+
+    statuses = []
+    async with admitted(slow_app, rate=0, max_client_in_flight=1) as client:
+        async def get():
+            statuses.append((await client.get("/api/samples")).status_code)
+
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(get)
+            await anyio.sleep(0.01)
+            await get()
+            release.set()
+    assert statuses == [429, 200]
+
+
+@pytest.mark.anyio
+async def test_es_budget_queues_then_sheds():
+    budget = EsBudget(max_in_flight=1, max_queue=1, queue_timeout=5)
+    release = anyio.Event()
+    order = []
+
+    async def query(name, shed=True):
+        async with budget.slot(shed=shed):
+            order.append(name)
+            if name == "first":
+                await release.wait()
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(query, "first")
+        await anyio.sleep(0.01)
+        tg.start_soon(query, "queued")
+        await anyio.sleep(0.01)
+        assert budget.stats() == {"in_flight": 1, "waiting": 1, "shed": 0}
+        with pytest.raises(Overloaded):
+            await query("shed")
+        # Admitted work may still wait past the queue bound.
+        tg.start_soon(query, "unshed", False)
+        await anyio.sleep(0.01)
+        assert budget.waiting == 2
+        release.set()
+    assert order == ["first", "queued", "unshed"]
+    assert budget.stats() == {"in_flight": 0, "waiting": 0, "shed": 1}
+
+
+@pytest.mark.anyio
+async def test_es_budget_wait_times_out():
+    budget = EsBudget(max_in_flight=1, max_queue=10, queue_timeout=0.01)
+    async with budget.slot():
+        with pytest.raises(Overloaded):
+            async with budget.slot():
+                pass
+    assert budget.stats() == {"in_flight": 0, "waiting": 0, "shed": 1}
+
+
+@pytest.mark.anyio
+async def test_saturated_es_budget_answers_503(client, mock_es_client):
+    mock_es_client.search.side_effect = Overloaded(2)
+    response = await client.get("/api/samples")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "2"
+    assert "Server busy" in response.json()["detail"]
+
+
+@pytest.mark.anyio
+async def test_refusals_carry_cors_headers(client, monkeypatch):
+    from main import app
+    await client.get("/api/metrics")  # builds the middleware stack
+    layer = app.middleware_stack
+    while not isinstance(layer, AdmissionMiddleware):
+        layer = layer.app
+    monkeypatch.setattr(layer, "rate", 1)
+    monkeypatch.setattr(layer, "burst", 1)
+    monkeypatch.setattr(layer, "_buckets", type(layer._buckets)())
+
+    origin = {"Origin": "https://example.org"}
+    await client.get("/api/samples/facets", headers=origin)
+    response = await client.get("/api/samples/facets", headers=origin)
+    assert response.status_code == 429
+    assert response.headers["access-control-allow-origin"] == "*"
+    assert "retry-after" in response.headers["access-control-expose-headers"].lower()
+
+
+@pytest.mark.anyio
+async def test_export_sheds_before_streaming_starts(client, mock_es_client, monkeypatch):
+    import metrics
+    budget = EsBudget(max_in_flight=1, max_queue=0, queue_timeout=0.01)
+    monkeypatch.setattr(metrics, "es_budget", budget)
+    mock_es_client.close_point_in_time.return_value = {"succeeded": True}
+
+    async def open_pit(**kwargs):
+        budget.in_flight += 1  # another query takes the last slot meanwhile
+        return {"id": "pit-1"}
+
+    mock_es_client.open_point_in_time.side_effect = open_pit
+
+    async def free_slot_later():
+        await anyio.sleep(0.1)
+        budget._release()
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(free_slot_later)
+        response = await client.get("/api/samples/export")
+    assert response.status_code == 503
+    assert "retry-after" in response.headers
+    mock_es_client.search.assert_not_awaited()
+    mock_es_client.close_point_in_time.assert_awaited_once()
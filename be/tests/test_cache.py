@@ -0,0 +1,163 @@
+import anyio
+import pytest
+
+from cache import LeadLock, SharedStore, SingleFlight, TTLCache, cache_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == (True, 1)
+    cache.set("c", 3)
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, 1)
+    assert cache.get("c") == (True, 3)
+    assert cache.stats() == {"entries": 2, "hits": 3, "misses": 1}
+
+
+def test_ttl_cache_expires_entries():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=10, ttl=5, clock=clock)
+    cache.set("a", 1)
+    clock.now = 4.9
+    assert cache.get("a") == (True, 1)
+    clock.now = 5.0
+    assert cache.get("a") == (False, None)
+    assert len(cache) == 0
+
+
+def test_ttl_cache_disabled_with_zero_ttl():
+    cache = TTLCache(maxsize=10, ttl=0)
+    cache.set("a", 1)
+    assert cache.get("a") == (False, None)
+
+
+@pytest.mark.anyio
+async def test_shared_store_serves_other_workers_misses(tmp_path):
+    """Two caches over one store file stand in for two worker processes."""
+    path = str(tmp_path / "shared.sqlite")
+    clock = FakeClock()
+
+    def store():
+        return SharedStore(path, max_bytes=1 << 20, max_value_bytes=1 << 16, clock=clock)
+
+    worker_a = TTLCache(maxsize=10, ttl=60, shared=store(), namespace="q")
+    worker_b = TTLCache(maxsize=10, ttl=60, shared=store(), namespace="q")
+
+    class Response:
+        body = {"hits": {"total": {"value": 3}}}
+
+    await worker_a.put("k", Response())
+    assert await worker_b.fetch("k") == (True, {"hits": {"total": {"value": 3}}})
+    assert worker_b.shared.stats() == {"hits": 1, "misses": 0, "skipped": 0, "errors": 0}
+    # Now held locally: get alone finds it.
+    assert worker_b.get("k")[0]
+
+    # Another namespace, a repointed index generation, or expiry all miss.
+    other = TTLCache(maxsize=10, ttl=60, shared=store(), namespace="tree")
+    assert await other.fetch("k") == (False, None)
+    worker_b.clear()
+    worker_b.shared.scope = "generation-2"
+    assert await worker_b.fetch("k") == (False, None)
+    worker_a.clear()
+    clock.now = 61
+    assert await worker_a.fetch("k") == (False, None)
+
+
+@pytest.mark.anyio
+async def test_shared_store_is_bounded_in_bytes(tmp_path):
+    clock = FakeClock()
+    store = SharedStore(str(tmp_path / "shared.sqlite"), max_bytes=10_000, max_value_bytes=2_000, clock=clock)
+
+    await store.set("huge", b"x" * 5_000, ttl=60)
+    assert store.stats()["skipped"] == 1
+    assert (await store.get("huge"))[0] is False
+
+    for i in range(20):
+        clock.now = i
+        await store.set(f"k{i}", b"x" * 1_000, ttl=60)
+    size = store._db().execute("SELECT SUM(size) FROM entries").fetchone()[0]
+    assert size <= 10_000 + store.max_bytes // 10 + 2_000
+    # The entries closest to expiry went first.
+    assert (await store.get("k19"))[0] and not (await store.get("k0"))[0]
+
+
+@pytest.mark.anyio
+async def test_shared_store_failures_are_misses_logged_once(tmp_path, caplog):
+    store = SharedStore(str(tmp_path / "missing" / "shared.sqlite"), max_bytes=1 << 20, max_value_bytes=1 << 16)
+    for _ in range(3):
+        await store.set("k", 1, ttl=60)
+        assert await store.get("k") == (False, None, 0.0)
+    assert store.stats()["errors"] == 6
+    assert len([r for r in caplog.records if "Shared cache" in r.message]) == 1
+
+
+def test_cache_key_ignores_dict_order():
+    assert cache_key("samples", {"a": 1, "b": {"c": 2, "d": 3}}) == cache_key("samples", {"b": {"d": 3, "c": 2}, "a": 1})
+    assert cache_key("samples", {"a": 1}) != cache_key("data_portal", {"a": 1})
+
+
+@pytest.mark.anyio
+async def test_single_flight_coalesces_concurrent_calls():
+    flights = SingleFlight()
+    release = anyio.Event()
+    calls = 0
+    results = []
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return "value"
+
+    async def caller():
+        results.append(await flights.do("key", fetch))
+
+    async with anyio.create_task_group() as tg:
+        for _ in range(5):
+            tg.start_soon(caller)
+        await anyio.wait_all_tasks_blocked()
+        release.set()
+
+    assert calls == 1
+    assert results == ["value"] * 5
+    assert flights.stats() == {"in_flight": 0, "executed": 1, "coalesced": 4}
+
+
+@pytest.mark.anyio
+async def test_single_flight_shares_errors_and_does_not_cache_them():
+    flights = SingleFlight()
+
+    async def boom():
+        raise RuntimeError("ES down")
+
+    with pytest.raises(RuntimeError):
+        await flights.do("key", boom)
+
+    async def ok():
+        return 1
+
+    assert await flights.do("key", ok) == 1
+    assert flights.executed == 2
+
+
+def test_one_worker_leads(tmp_path):
+    path = str(tmp_path / "shared.sqlite.lock")
+    first, second = LeadLock(path), LeadLock(path)
+
+    assert first.held() and first.held()
+    assert not second.held()
+
+    first.release()
+    assert second.held()
+    assert not first.held()
+    second.release()
@@ -0,0 +1,104 @@
+import gzip
+import json
+
+import anyio
+import brotli
+import pytest
+from httpx import ASGITransport, AsyncClient
+from starlette.responses import PlainTextResponse, StreamingResponse
+
+from compression import CompressionMiddleware, choose_encoding
+from tests.test_endpoints import SAMPLE_HIT
+
+
+def _big_response():
+    hits = [{"_source": {**SAMPLE_HIT, "accession": f"SAMEA{i}"}} for i in range(200)]
+    return {"hits": {"total": {"value": len(hits)}, "hits": hits}, "aggregations": {}}
+
+
+def test_choose_encoding_prefers_br_and_honours_q_zero():
+    assert choose_encoding("gzip, deflate, br") == "br"
+    assert choose_encoding("gzip, br;q=0") == "gzip"
+    assert choose_encoding("identity") is None
+    assert choose_encoding("*") == "br"
+    assert choose_encoding(None) is None
+
+
+@pytest.mark.anyio
+async def test_large_json_is_brotli_compressed(client, mock_es_client):
+    mock_es_client.search.return_value = _big_response()
+    response = await client.get("/api/samples?aggs=false", headers={"Accept-Encoding": "br"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "br"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert len(response.json()["results"]) == 200
+
+
+@pytest.mark.anyio
+async def test_large_json_is_gzip_compressed(client, mock_es_client):
+    mock_es_client.search.return_value = _big_response()
+    response = await client.get("/api/samples?aggs=false", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()["results"]) == 200
+
+
+@pytest.mark.anyio
+async def test_small_responses_and_identity_requests_are_not_compressed(client, mock_es_client):
+    mock_es_client.search.return_value = {"hits": {"total": {"value": 0}, "hits": []}, "aggregations": {}}
+    response = await client.get("/api/samples?aggs=false", headers={"Accept-Encoding": "gzip, br"})
+    assert "content-encoding" not in response.headers
+    assert "Accept-Encoding" in response.headers["vary"]
+
+    mock_es_client.search.return_value = _big_response()
+    response = await client.get("/api/samples?aggs=false&size=200", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+
+
+@pytest.mark.anyio
+async def test_streamed_export_is_compressed_incrementally(client, mock_es_client):
+    mock_es_client.open_point_in_time.return_value = {"id": "pit-1"}
+    mock_es_client.close_point_in_time.return_value = {"succeeded": True, "num_freed": 1}
+    mock_es_client.search.return_value = {
+        "pit_id": "pit-1",
+        "hits": {"hits": [{"_source": {"accession": "A"}, "sort": [0]}]},
+    }
+    async with client.stream("GET", "/api/samples/export", headers={"Accept-Encoding": "gzip"}) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        raw = b"".join([chunk async for chunk in response.aiter_raw()])
+    assert [json.loads(line)["accession"] for line in gzip.decompress(raw).splitlines()] == ["A"]
+
+
+@pytest.mark.anyio
+async def test_event_streams_are_flushed_per_message():
+    async def events():
+        yield "data: one\n\n"
+        yield "data: two\n\n"
+
+    app = CompressionMiddleware(StreamingResponse(events(), media_type="text/event-stream"), minimum_size=0)
+    sent = []
+
+    async def receive():
+        await anyio.sleep_forever()
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"accept-encoding", b"br")]}
+    await app(scope, receive, send)
+
+    bodies = [m["body"] for m in sent if m["type"] == "http.response.body"]
+    # Each event is decodable from what has been sent so far.
+    decoder = brotli.Decompressor()
+    assert decoder.process(bodies[0]) == b"data: one\n\n"
+    assert decoder.process(bodies[1]) == b"data: two\n\n"
+
+
+@pytest.mark.anyio
+async def test_already_encoded_responses_pass_through():
+    inner = PlainTextResponse("x" * 5000, headers={"Content-Encoding": "identity"})
+    app = CompressionMiddleware(inner, minimum_size=10)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.get("/", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "identity"
+    assert response.text == "x" * 5000
@@ -119,12 +119,7 @@ async def test_samples_search(client, mock_es_client):
 @pytest.mark.anyio
 async def test_sample_detail(client, mock_es_client):
     """Mock ES, call GET /samples/SAMEA7522340, verify derivedFrom in response."""
-    mock_es_client.search.return_value = {
-        "hits": {
-            "total": {"value": 1},
-            "hits": [{"_source": SAMPLE_HIT}],
-        },
-    }
+    mock_es_client.get.return_value = {"found": True, "_source": SAMPLE_HIT}
 
     response = await client.get("/api/samples/SAMEA7522340")
     assert response.status_code == 200
@@ -132,6 +127,48 @@ async def test_sample_detail(client, mock_es_client):
     data = response.json()
     assert len(data["results"]) == 1
     assert data["results"][0]["derivedFrom"] == "SAMEA7522339"
+    assert mock_es_client.get.call_args.kwargs == {"index": "samples", "id": "SAMEA7522340"}
+    mock_es_client.search.assert_not_called()
+
+
+@pytest.mark.anyio
+async def test_sample_detail_missing_returns_empty_results(client, mock_es_client):
+    from elasticsearch import NotFoundError
+
+    mock_es_client.get.side_effect = NotFoundError(
+        "Not found", meta=None, body={"_index": "samples", "_id": "NOPE", "found": False},
+    )
+
+    response = await client.get("/api/samples/NOPE")
+    assert response.status_code == 200
+    assert response.json() == {"results": []}
+
+
+@pytest.mark.anyio
+async def test_samples_mget_resolves_ids_in_one_round_trip(client, mock_es_client):
+    mock_es_client.mget.return_value = {"docs": [
+        {"_id": "SAMEA7522340", "found": True, "_source": SAMPLE_HIT},
+        {"_id": "MISSING", "found": False},
+    ]}
+
+    response = await client.post("/api/samples/_mget", json={"ids": ["SAMEA7522340", "MISSING"]})
+    assert response.status_code == 200
+
+    data = response.json()
+    assert [r["accession"] for r in data["results"]] == ["SAMEA7522340"]
+    assert data["missing"] == ["MISSING"]
+    assert mock_es_client.mget.await_count == 1
+    assert mock_es_client.mget.call_args.kwargs["ids"] == ["SAMEA7522340", "MISSING"]
+
+
+@pytest.mark.anyio
+async def test_data_portal_mget_rejects_empty_and_oversized_batches(client, mock_es_client):
+    from models import MGET_MAX_IDS
+
+    assert (await client.post("/api/data_portal/_mget", json={"ids": []})).status_code == 422
+    too_many = list(range(MGET_MAX_IDS + 1))
+    assert (await client.post("/api/data_portal/_mget", json={"ids": too_many})).status_code == 422
+    mock_es_client.mget.assert_not_called()
 
 
 @pytest.mark.anyio
@@ -226,3 +263,284 @@ async def test_data_portal_with_taxonomy_filters(client, mock_es_client):
     ]
     assert len(kingdom_filters) == 1
     assert kingdom_filters[0]["terms"]["phylogeny.kingdom.keyword"] == ["Plantae"]
+
+
+@pytest.mark.anyio
+async def test_samples_search_rejects_malformed_cursor(client, mock_es_client):
+    response = await client.get("/api/samples?cursor=not-a-cursor")
+    assert response.status_code == 400
+    mock_es_client.search.assert_not_called()
+
+
+@pytest.mark.anyio
+async def test_samples_export_streams_ndjson_over_pit(client, mock_es_client):
+    """Export walks a PIT without aggregations and emits one JSON document per line."""
+    import json
+
+    mock_es_client.open_point_in_time.return_value = {"id": "pit-1"}
+    mock_es_client.close_point_in_time.return_value = {"succeeded": True, "num_freed": 1}
+    mock_es_client.search.return_value = {
+        "pit_id": "pit-1",
+        "hits": {"hits": [
+            {"_source": {"accession": "A"}, "sort": [0]},
+            {"_source": {"accession": "B"}, "sort": [1]},
+        ]},
+    }
+
+    response = await client.get("/api/samples/export?country=United%20Kingdom")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = response.text.splitlines()
+    assert [json.loads(line)["accession"] for line in lines] == ["A", "B"]
+
+    body = mock_es_client.search.call_args.kwargs["body"]
+    assert "aggs" not in body
+    assert body["pit"]["id"] == "pit-1"
+    assert {"terms": {"country": ["United Kingdom"]}} in body["query"]["bool"]["filter"]
+    mock_es_client.close_point_in_time.assert_awaited_with(id="pit-1")
+
+
+@pytest.mark.anyio
+async def test_data_portal_field_projection(client, mock_es_client):
+    """fields= becomes a _source filter and only the projected fields are returned."""
+    mock_es_client.search.return_value = {
+        "hits": {
+            "total": {"value": 1},
+            "hits": [{"_source": {"scientificName": "Hirudo medicinalis", "commonName": None}}],
+        },
+        "aggregations": DATA_PORTAL_AGGREGATIONS,
+    }
+
+    response = await client.get("/api/data_portal?fields=scientificName,commonName")
+    assert response.status_code == 200
+    assert response.json()["results"] == [{"scientificName": "Hirudo medicinalis", "commonName": None}]
+
+    body = mock_es_client.search.call_args.kwargs["body"]
+    assert body["_source"] == {"includes": ["scientificName", "commonName"]}
+
+
+@pytest.mark.anyio
+async def test_samples_without_projection_still_returns_every_field(client, mock_es_client):
+    mock_es_client.search.return_value = {
+        "hits": {"total": {"value": 1}, "hits": [{"_source": SAMPLE_HIT}]},
+        "aggregations": SAMPLE_AGGREGATIONS,
+    }
+
+    response = await client.get("/api/samples")
+    assert response.status_code == 200
+    record = response.json()["results"][0]
+    # Absent from _source but part of the model: still emitted as null.
+    assert record["sampleSymbiontOf"] is None
+    assert "_source" not in mock_es_client.search.call_args.kwargs["body"]
+
+
+@pytest.mark.anyio
+async def test_samples_projection_rejects_unknown_fields(client, mock_es_client):
+    response = await client.get("/api/samples?exclude=customFields,notAField")
+    assert response.status_code == 422
+    mock_es_client.search.assert_not_called()
+
+
+@pytest.mark.anyio
+async def test_samples_search_without_aggregations(client, mock_es_client):
+    """aggs=false drops the facet block from the ES body and returns empty aggregations."""
+    mock_es_client.search.return_value = {
+        "hits": {"total": {"value": 1}, "hits": [{"_source": SAMPLE_HIT}]},
+    }
+
+    response = await client.get("/api/samples?aggs=false&start=10")
+    assert response.status_code == 200
+    assert response.json()["aggregations"] == {}
+    assert "aggs" not in mock_es_client.search.call_args.kwargs["body"]
+
+
+@pytest.mark.anyio
+async def test_data_portal_facets_runs_size_zero(client, mock_es_client):
+    mock_es_client.search.return_value = {
+        "hits": {"total": {"value": 12}, "hits": []},
+        "aggregations": DATA_PORTAL_AGGREGATIONS,
+    }
+
+    response = await client.get("/api/data_portal/facets?kingdom=Plantae")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 12
+    assert set(data["aggregations"]) == set(DATA_PORTAL_AGGREGATIONS)
+
+    body = mock_es_client.search.call_args.kwargs["body"]
+    assert body["size"] == 0
+    assert {"kingdom", "tax_order", "family", "bioSamplesStatus"} <= set(body["aggs"])
+    assert {"terms": {"phylogeny.kingdom.keyword": ["Plantae"]}} in body["query"]["bool"]["filter"]
+
+
+@pytest.mark.anyio
+async def test_data_portal_suggest_returns_ids_and_names_only(client, mock_es_client):
+    mock_es_client.search.return_value = {"hits": {"hits": [
+        {"_source": {"taxId": 6344, "scientificName": "Arenicola marina", "commonName": "lugworm"}},
+        {"_source": {"taxId": 6345, "scientificName": "Arenicola defodiens"}},
+    ]}}
+
+    response = await client.get("/api/data_portal/suggest?prefix=Aren")
+    assert response.status_code == 200
+    assert response.json() == {"suggestions": [
+        {"taxId": 6344, "scientificName": "Arenicola marina", "commonName": "lugworm"},
+        {"taxId": 6345, "scientificName": "Arenicola defodiens", "commonName": None},
+    ]}
+
+    body = mock_es_client.search.call_args.kwargs["body"]
+    assert body["_source"] == ["taxId", "scientificName", "commonName"]
+    assert body["query"]["multi_match"]["type"] == "bool_prefix"
+    assert body["query"]["multi_match"]["query"] == "Aren"
+    assert "aggs" not in body
+
+    response = await client.get("/api/data_portal/suggest?prefix=")
+    assert response.status_code == 422
+
+
+@pytest.mark.anyio
+async def test_data_portal_summary_aggregates_every_sample(client, mock_es_client):
+    mock_es_client.search.return_value = {
+        "hits": {"total": {"value": 1500, "relation": "eq"}, "hits": []},
+        "aggregations": {
+            "countries": {"buckets": [{"key": "France", "doc_count": 900}, {"key": "Spain", "doc_count": 600}]},
+            "organismParts": {"buckets": [{"key": "WHOLE_ORGANISM", "doc_count": 1500}]},
+            "sex": {"buckets": [{"key": "female", "doc_count": 1000}, {"key": "male", "doc_count": 500}]},
+            "bounds": {"bounds": {"top_left": {"lat": 48.0, "lon": -4.5}, "bottom_right": {"lat": 43.0, "lon": 2.0}}},
+            "locations": {"buckets": [
+                {"key": "20/1/1", "doc_count": 1499, "centroid": {"location": {"lat": 48.0, "lon": -4.5}, "count": 1499},
+                 "sample": {"hits": {"hits": [{"_source": {"accession": "SAMEA1"}}]}}},
+                {"key": "20/2/2", "doc_count": 1, "centroid": {"location": {"lat": 43.0, "lon": 2.0}, "count": 1},
+                 "sample": {"hits": {"hits": [{"_source": {"accession": "SAMEA2", "organismPart": "MUSCLE"}}]}}},
+            ]},
+        },
+    }
+
+    response = await client.get("/api/data_portal/6344/summary")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["taxId"] == 6344
+    assert data["sampleCount"] == 1500
+    assert data["countries"] == ["France", "Spain"]
+    assert data["sex"][0] == {"key": "female", "doc_count": 1000}
+    assert data["locations"] == [
+        {"lat": 48.0, "lon": -4.5, "count": 1499, "accession": None, "organismPart": None},
+        {"lat": 43.0, "lon": 2.0, "count": 1, "accession": "SAMEA2", "organismPart": "MUSCLE"},
+    ]
+    assert data["bounds"]["top_left"] == {"lat": 48.0, "lon": -4.5}
+
+    call = mock_es_client.search.call_args.kwargs
+    assert call["index"] == "samples"
+    assert call["body"]["size"] == 0
+    assert call["body"]["query"] == {"bool": {"filter": [{"term": {"taxId": 6344}}]}}
+    assert mock_es_client.search.await_count == 1
+
+
+@pytest.mark.anyio
+async def test_samples_vector_tile(client, mock_es_client):
+    """The tile route proxies ES _mvt with the map filters and returns cacheable binary."""
+    tile_bytes = b"\x1a\x05fake"
+    mock_es_client.search_mvt.return_value = type("BinaryResponse", (), {"body": tile_bytes})()
+
+    response = await client.get("/api/samples/tiles/3/4/2.mvt?tax_id=6344")
+    assert response.status_code == 200
+    assert response.content == tile_bytes
+    assert response.headers["content-type"] == "application/vnd.mapbox-vector-tile"
+    assert "max-age" in response.headers["cache-control"]
+
+    call = mock_es_client.search_mvt.call_args.kwargs
+    assert (call["index"], call["field"], call["zoom"], call["x"], call["y"]) == ("samples", "location", 3, 4, 2)
+    assert call["size"] == 0
+    assert call["query"] == {"bool": {"filter": [{"term": {"taxId": 6344}}]}}
+
+
+@pytest.mark.anyio
+async def test_samples_vector_tile_out_of_range(client, mock_es_client):
+    response = await client.get("/api/samples/tiles/2/4/0.mvt")
+    assert response.status_code == 404
+    mock_es_client.search_mvt.assert_not_called()
+
+
+@pytest.mark.anyio
+async def test_unfiltered_geo_aggregation_served_from_pyramid(client, mock_es_client):
+    """Once the pyramid is built, unfiltered map requests skip ES; filtered ones do not."""
+    from geo_pyramid import geo_pyramid
+    from models import GeoCluster
+
+    geo_pyramid._levels = {7: [((-1.0, 51.0, 1.0, 52.0), GeoCluster(lat=51.5, lon=-0.1, count=42, key="7/63/42"))]}
+
+    response = await client.get("/api/samples/geo_aggregation?zoom=5")
+    assert response.status_code == 200
+    assert response.json()["clusters"][0]["key"] == "7/63/42"
+    mock_es_client.search.assert_not_called()
+
+    mock_es_client.search.return_value = {"aggregations": {"grid": {"buckets": []}}}
+    response = await client.get("/api/samples/geo_aggregation?zoom=5&tax_id=6344")
+    assert response.json()["clusters"] == []
+    mock_es_client.search.assert_awaited_once()
+
+
+@pytest.mark.anyio
+async def test_samples_search_fast_responses_pass_source_through(client, mock_es_client, monkeypatch):
+    """With FAST_RESPONSES, _source is returned as-is: no validation, no null-filling."""
+    import main
+
+    monkeypatch.setattr(main, "FAST_RESPONSES", True)
+    raw_hit = {"accession": "SAMEA7522340", "taxId": 6344, "scientificName": "Hirudo medicinalis"}
+    mock_es_client.search.return_value = {
+        "hits": {"total": {"value": 1}, "hits": [{"_source": raw_hit}]},
+        "aggregations": SAMPLE_AGGREGATIONS,
+    }
+
+    response = await client.get("/api/samples")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["results"] == [raw_hit]
+    assert data["total"] == 1
+    assert data["next_cursor"] is None
+    assert data["aggregations"] == SAMPLE_AGGREGATIONS
+
+
+@pytest.mark.anyio
+async def test_batch_runs_named_sub_queries_in_one_msearch(client, mock_es_client):
+    """The data portal page's search, facets and map queries come back keyed, from one msearch."""
+    mock_es_client.msearch.return_value = {"responses": [
+        {"hits": {"total": {"value": 1}, "hits": [{"_source": {"taxId": 6344}}]}},
+        {"hits": {"total": {"value": 1}, "hits": []}, "aggregations": SAMPLE_AGGREGATIONS},
+        {"aggregations": {"grid": {"buckets": []}}},
+        {"hits": {"total": {"value": 1}, "hits": [{"_source": SAMPLE_HIT}]}},
+    ]}
+    response = await client.post("/api/_batch", json={"queries": {
+        "species": {"type": "search", "index": "data_portal", "params": {"fields": "taxId", "aggs": False}},
+        "facets": {"type": "facets", "index": "samples", "params": {"country": "United Kingdom"}},
+        "map": {"type": "geo_aggregation", "index": "samples", "params": {"zoom": 3, "tax_ids": "6344"}},
+        "sample": {"type": "details", "index": "samples", "id": "SAMEA7522340"},
+    }})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["errors"] == {}
+    assert data["results"]["species"]["results"] == [{"taxId": 6344}]
+    assert data["results"]["facets"]["total"] == 1
+    assert data["results"]["map"] == {"clusters": []}
+    assert data["results"]["sample"]["results"][0]["accession"] == "SAMEA7522340"
+
+    mock_es_client.msearch.assert_awaited_once()
+    mock_es_client.search.assert_not_called()
+    searches = mock_es_client.msearch.call_args.kwargs["searches"]
+    assert searches[0] == {"index": "data_portal"}
+    assert searches[1]["_source"] == {"includes": ["taxId"]}
+    assert searches[7]["query"] == {"ids": {"values": ["SAMEA7522340"]}}
+
+
+@pytest.mark.anyio
+async def test_batch_rejects_invalid_sub_query_params(client, mock_es_client):
+    response = await client.post("/api/_batch", json={"queries": {
+        "page": {"type": "search", "index": "samples", "params": {"size": 0}},
+    }})
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "queries", "page", "params", "size"]
+
+    response = await client.post("/api/_batch", json={"queries": {
+        "page": {"type": "search", "index": "samples", "params": {"cursor": "*"}},
+    }})
+    assert response.status_code == 422
+    mock_es_client.msearch.assert_not_called()
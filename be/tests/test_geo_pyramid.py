@@ -0,0 +1,135 @@
+import anyio
+import pytest
+from unittest.mock import AsyncMock
+
+from cache import SharedStore
+from geo_pyramid import GeoPyramid, MIN_PRECISION, MAX_PRECISION
+from models import GeoAggregationParams
+
+
+def composite_page(buckets, after_key=None):
+    grid = {"buckets": buckets}
+    if after_key is not None:
+        grid["after_key"] = after_key
+    return {"aggregations": {"grid": grid}}
+
+
+def bucket(key, count, lat, lon):
+    return {"key": {"tile": key}, "doc_count": count, "centroid": {"location": {"lat": lat, "lon": lon}}}
+
+
+async def build_pyramid(buckets_by_precision):
+    def search(*, index, body):
+        composite = body["aggs"]["grid"]["composite"]
+        precision = composite["sources"][0]["tile"]["geotile_grid"]["precision"]
+        if "after" in composite:
+            return composite_page([])
+        return composite_page(buckets_by_precision.get(precision, []), after_key={"tile": "last"})
+
+    es = AsyncMock()
+    es.search.side_effect = search
+    pyramid = GeoPyramid()
+    assert await pyramid.build(es, index="samples", generation=lambda: ("g1",))
+    return pyramid, es
+
+
+@pytest.mark.anyio
+async def test_build_aggregates_every_precision_with_composite_paging():
+    pyramid, es = await build_pyramid({
+        p: [bucket(f"{p}/0/0", 1, 80.0, -179.0)] for p in range(MIN_PRECISION, MAX_PRECISION + 1)
+    })
+    precisions = {
+        c.kwargs["body"]["aggs"]["grid"]["composite"]["sources"][0]["tile"]["geotile_grid"]["precision"]
+        for c in es.search.call_args_list
+    }
+    assert precisions == set(range(MIN_PRECISION, MAX_PRECISION + 1))
+    # Two pages (first + empty follow-up after after_key) per precision.
+    assert es.search.await_count == 2 * len(precisions)
+    assert pyramid.ready
+
+
+@pytest.mark.anyio
+async def test_clusters_sorted_by_count_and_sliced_by_viewport():
+    # zoom 5 -> precision 7. 7/63/42 covers roughly Western Europe, 7/20/50 the Americas.
+    pyramid, _ = await build_pyramid({7: [
+        bucket("7/20/50", 3, 20.0, -120.0),
+        bucket("7/63/42", 40, 51.5, -0.1),
+    ]})
+
+    everything = pyramid.clusters(GeoAggregationParams(zoom=5))
+    assert [c.key for c in everything.clusters] == ["7/63/42", "7/20/50"]
+
+    europe = pyramid.clusters(GeoAggregationParams(
+        zoom=5, top_left_lat=60.0, top_left_lon=-10.0, bottom_right_lat=45.0, bottom_right_lon=10.0,
+    ))
+    assert [c.key for c in europe.clusters] == ["7/63/42"]
+
+
+@pytest.mark.anyio
+async def test_clusters_unavailable_until_built():
+    assert GeoPyramid().clusters(GeoAggregationParams(zoom=5)) is None
+
+
+@pytest.mark.anyio
+async def test_build_discarded_when_generation_changes():
+    generations = iter([("g1",), ("g2",)])
+    es = AsyncMock()
+    es.search.return_value = composite_page([])
+    pyramid = GeoPyramid()
+    assert not await pyramid.build(es, index="samples", generation=lambda: next(generations))
+    assert not pyramid.ready
+
+
+@pytest.mark.anyio
+async def test_build_asked_for_mid_build_runs_once_more():
+    # A repoint lands while a periodic build is running: that build is
+    # discarded, and the one the repoint asked for runs right after it.
+    generation = ["g1"]
+    started = anyio.Event()
+    release = anyio.Event()
+
+    async def search(*, index, body):
+        started.set()
+        await release.wait()
+        return composite_page([bucket("4/0/0", 1, 80.0, -179.0)])
+
+    es = AsyncMock()
+    es.search.side_effect = search
+    pyramid = GeoPyramid()
+    results = []
+
+    async def build():
+        results.append(await pyramid.build(es, index="samples", generation=lambda: generation[0]))
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(build)
+        await started.wait()
+        generation[0] = "g2"
+        pyramid.clear()
+        await build()
+        await build()
+        release.set()
+
+    assert results == [False, False, True]
+    assert pyramid.ready and pyramid.age() < 60
+    # One discarded pass and one kept, for every precision.
+    assert es.search.await_count == 2 * (MAX_PRECISION - MIN_PRECISION + 1)
+
+
+@pytest.mark.anyio
+async def test_other_workers_load_the_published_pyramid(tmp_path):
+    path = str(tmp_path / "lead.sqlite")
+    lead, _ = await build_pyramid({7: [bucket("7/63/42", 40, 51.5, -0.1)]})
+    follower = GeoPyramid()
+
+    def store():
+        return SharedStore(path, max_bytes=1 << 20, max_value_bytes=1 << 20)
+
+    assert not await follower.load(store())
+    assert await lead.publish(store(), ttl=60) and lead.published
+    assert await follower.load(store())
+    # Loaded once per build, not on every poll.
+    assert not await follower.load(store())
+
+    assert follower.ready and follower.age() < 60
+    assert follower.clusters(GeoAggregationParams(zoom=5)) == lead.clusters(GeoAggregationParams(zoom=5))
@@ -0,0 +1,61 @@
+import pytest
+
+from http_cache import compute_etag
+
+
+SAMPLE_RESPONSE = {
+    "hits": {"total": {"value": 0}, "hits": []},
+    "aggregations": {},
+}
+
+
+def test_etag_ignores_query_param_order_but_not_generation():
+    a = compute_etag(("g1",), "/api/samples", b"country=UK&size=10")
+    assert a == compute_etag(("g1",), "/api/samples", b"size=10&country=UK")
+    assert a != compute_etag(("g2",), "/api/samples", b"size=10&country=UK")
+    assert a.startswith('W/"')
+
+
+@pytest.fixture
+def generation(monkeypatch):
+    import queries
+    monkeypatch.setattr(queries, "_index_generation", (("samples", ("samples_v1",)),))
+
+
+@pytest.mark.anyio
+async def test_conditional_get_returns_304_without_querying_es(client, mock_es_client, generation):
+    mock_es_client.search.return_value = SAMPLE_RESPONSE
+
+    first = await client.get("/api/samples?country=UK&aggs=false")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "public, max-age=60"
+
+    second = await client.get(
+        "/api/samples?aggs=false&country=UK", headers={"If-None-Match": etag, "Origin": "https://example.org"},
+    )
+    assert second.status_code == 304
+    assert second.headers["access-control-allow-origin"] == "*"
+    assert second.content == b""
+    assert second.headers["etag"] == etag
+    assert mock_es_client.search.await_count == 1
+
+
+@pytest.mark.anyio
+async def test_no_validators_until_generation_known(client, mock_es_client):
+    mock_es_client.search.return_value = SAMPLE_RESPONSE
+    response = await client.get("/api/samples?aggs=false")
+    assert "etag" not in response.headers
+
+
+@pytest.mark.anyio
+async def test_no_validators_on_error_responses(client, mock_es_client, generation):
+    response = await client.get("/api/samples?cursor=garbage")
+    assert response.status_code == 400
+    assert "etag" not in response.headers
+
+
+def test_etag_changes_with_build_and_response_mode():
+    a = compute_etag(("g1",), "/api/samples", b"size=10", "abc123:validated")
+    assert a != compute_etag(("g1",), "/api/samples", b"size=10", "def456:validated")
+    assert a != compute_etag(("g1",), "/api/samples", b"size=10", "abc123:fast")
@@ -67,22 +67,22 @@ async def test_get_species_returns_full_record():
     from mcp_server import get_species, set_es_client
 
     es = AsyncMock()
-    es.search.return_value = {"hits": {"hits": [{"_source": {
+    es.get.return_value = {"found": True, "_source": {
         "taxId": 43171, "scientificName": "Linaria vulgaris", "commonName": None,
         "phylogeny": None, "currentStatus": "Annotation Complete", "currentStatusOrder": 5,
         "bioSamplesStatus": "Done", "rawDataStatus": "Done",
         "assembliesStatus": "Done", "annotationStatus": "Done",
         "rawData": [], "assemblies": [], "annotations": None,
         "sampleCount": 1, "locations": None, "countries": None,
-    }}]}}
+    }}
     set_es_client(es)
 
     result = await get_species(tax_id=43171)
     assert len(result["results"]) == 1
     assert result["results"][0]["taxId"] == 43171
-    call = es.search.call_args
+    call = es.get.call_args
     assert call.kwargs["index"] == "data_portal"
-    assert call.kwargs["q"] == "_id:43171"
+    assert call.kwargs["id"] == "43171"
 
 
 @pytest.mark.anyio
@@ -116,7 +116,7 @@ async def test_get_sample_returns_record_by_accession():
     from mcp_server import get_sample, set_es_client
 
     es = AsyncMock()
-    es.search.return_value = {"hits": {"hits": [{"_source": {
+    es.get.return_value = {"found": True, "_source": {
         "accession": "SAMEA7522340", "taxId": 6344, "scientificName": "Hirudo medicinalis",
         "commonName": None, "trackingSystem": "COPO", "projectTag": None, "projectName": None,
         "organismPart": None, "lifestage": None, "sex": None, "collectedBy": None,
@@ -135,13 +135,13 @@ async def test_get_sample_returns_record_by_accession():
         "insdcStatus": None, "insdcFirstPublic": None, "insdcLastUpdate": None,
         "latitudeStart": None, "longitudeStart": None, "latitudeEnd": None,
         "longitudeEnd": None, "depth": None, "customFields": None,
-    }}]}}
+    }}
     set_es_client(es)
 
     result = await get_sample(accession="SAMEA7522340")
     assert result["results"][0]["accession"] == "SAMEA7522340"
-    assert es.search.call_args.kwargs["index"] == "samples"
-    assert es.search.call_args.kwargs["q"] == "_id:SAMEA7522340"
+    assert es.get.call_args.kwargs["index"] == "samples"
+    assert es.get.call_args.kwargs["id"] == "SAMEA7522340"
 
 
 @pytest.mark.anyio
@@ -245,3 +245,31 @@ async def test_mcp_endpoint_lists_all_tools(mcp_http_session):
         "build_bulk_download_command",
     ]:
         assert name in text, f"tool {name!r} not advertised; response (first 500 chars): {text[:500]}"
+
+
+@pytest.mark.anyio
+async def test_stateless_mcp_serves_requests_without_a_session():
+    """In stateless mode (multi-worker deployments) any request may arrive at any worker."""
+    import starlette.routing as sr
+    from httpx import ASGITransport, AsyncClient
+    from mcp_server import build_mcp_app, set_es_client
+    from main import app
+
+    set_es_client(AsyncMock())
+    stateless_app = build_mcp_app(stateless=True)
+    mount = next(r for r in app.routes if isinstance(r, sr.Mount) and r.path == "/api/mcp")
+    original, mount.app = mount.app, stateless_app
+    headers = {"Accept": "application/json, text/event-stream", "Content-Type": "application/json"}
+    try:
+        async with stateless_app.router.lifespan_context(app):
+            async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+                response = await ac.post(
+                    "/api/mcp/",
+                    json={"jsonrpc": "2.0", "id": 1, "method": "tools/list", "params": {}},
+                    headers=headers,
+                )
+    finally:
+        mount.app = original
+    assert response.status_code == 200
+    assert "mcp-session-id" not in response.headers
+    assert "search_species" in response.text
@@ -0,0 +1,115 @@
+import os
+import pytest
+from unittest.mock import AsyncMock
+from prometheus_client import REGISTRY
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+@pytest.mark.anyio
+async def test_requests_are_labelled_by_route_template(client, mock_es_client):
+    mock_es_client.get.return_value = {"found": True, "_source": {"accession": "SAMEA1"}}
+    before = sample("aegis_http_request_duration_seconds_count", method="GET", route="/api/samples/{accession}", status="500")
+    before_missing = sample("aegis_http_request_duration_seconds_count", method="GET", route="unmatched", status="404")
+
+    await client.get("/api/samples/SAMEA1")
+    await client.get("/api/no/such/route")
+
+    assert sample(
+        "aegis_http_request_duration_seconds_count", method="GET", route="/api/samples/{accession}", status="500"
+    ) == before + 1
+    assert sample("aegis_http_request_duration_seconds_count", method="GET", route="unmatched", status="404") == before_missing + 1
+    assert sample("aegis_http_requests_in_flight") == 0
+
+
+@pytest.mark.anyio
+async def test_es_took_and_wall_time_recorded_per_query_type(client, mock_es_client):
+    mock_es_client.search.return_value = {
+        "took": 250, "hits": {"total": {"value": 0}, "hits": []}, "aggregations": {"grid": {"buckets": []}},
+    }
+    took_before = sample("aegis_es_took_seconds_sum", query_type="geo_aggregation")
+    wall_before = sample("aegis_es_request_duration_seconds_count", query_type="geo_aggregation")
+
+    response = await client.get("/api/samples/geo_aggregation?zoom=3&country=Spain")
+    assert response.status_code == 200
+
+    assert sample("aegis_es_took_seconds_sum", query_type="geo_aggregation") == pytest.approx(took_before + 0.25)
+    assert sample("aegis_es_request_duration_seconds_count", query_type="geo_aggregation") == wall_before + 1
+
+
+@pytest.mark.anyio
+async def test_metrics_endpoint_exposes_cache_ratio_and_payload_sizes(client, mock_es_client, metrics_auth):
+    mock_es_client.search.return_value = {"hits": {"total": {"value": 0}, "hits": []}, "aggregations": {}}
+    await client.get("/api/samples?aggs=false")
+    await client.get("/api/samples?aggs=false")
+
+    from cache import query_cache
+
+    response = await client.get("/api/metrics", headers=metrics_auth)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    stats = query_cache.stats()
+    assert stats["hits"] >= 1
+    assert sample("aegis_query_cache_hits_total") == stats["hits"]
+    assert sample("aegis_query_cache_hit_ratio") == stats["hits"] / (stats["hits"] + stats["misses"])
+    assert 'aegis_http_response_size_bytes_count{route="/api/samples"}' in response.text
+
+
+@pytest.mark.anyio
+async def test_mcp_tool_latency_recorded_with_outcome():
+    from mcp_server import get_sample, set_es_client
+
+    es = AsyncMock()
+    es.get.side_effect = RuntimeError("ES down")
+    set_es_client(es)
+    before = sample("aegis_mcp_tool_duration_seconds_count", tool="get_sample", outcome="error")
+    with pytest.raises(Exception):
+        await get_sample("SAMEA1")
+    assert sample("aegis_mcp_tool_duration_seconds_count", tool="get_sample", outcome="error") == before + 1
+
+
+WORKER = """
+import sys
+from metrics import REQUEST_LATENCY, exposition, publish_process_metrics, query_cache
+if sys.argv[1] == "serve":
+    query_cache.set("k", 1)
+    query_cache.get("k")
+    REQUEST_LATENCY.labels("GET", "/api/data_portal", "200").observe(0.1)
+    publish_process_metrics()
+else:
+    sys.stdout.write(exposition().decode())
+"""
+
+
+def test_any_worker_reports_every_worker(tmp_path):
+    import subprocess
+    import sys
+    from pathlib import Path
+    from prometheus_client.parser import text_string_to_metric_families
+
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}
+    cwd = Path(__file__).parent.parent
+
+    def worker(role):
+        return subprocess.run([sys.executable, "-c", WORKER, role], env=env, cwd=cwd,
+                              capture_output=True, text=True, check=True).stdout
+
+    worker("serve")
+    worker("serve")
+    samples = {
+        (s.name, tuple(sorted(s.labels.items()))): s.value
+        for family in text_string_to_metric_families(worker("scrape")) for s in family.samples
+    }
+
+    route = (("method", "GET"), ("route", "/api/data_portal"), ("status", "200"))
+    assert samples[("aegis_http_request_duration_seconds_count", route)] == 2
+    assert samples[("aegis_query_cache_hits_total", ())] == 2
+
+
+@pytest.mark.anyio
+async def test_operator_endpoints_need_the_metrics_token(client):
+    for path in ("/api/metrics", "/api/slow_queries"):
+        assert (await client.get(path)).status_code == 403
+        assert (await client.get(path, headers={"Authorization": "Bearer guess"})).status_code == 403
@@ -98,3 +98,23 @@ def test_geo_aggregation_response():
     assert len(response.clusters) == 2
     assert response.clusters[0].count == 10
     assert response.clusters[1].lat == 48.8
+
+
+def test_query_plan_compiled_per_data_source():
+    """generate_classes compiles a plan with the filter fields, facet block and response classes."""
+    from models import (
+        query_plan, ElasticResponse, FacetsResponse,
+        DataPortalAggregationResponse, DataPortalRecord, DataPortalPartialData,
+    )
+
+    plan = query_plan(SampleAggregationResponse)
+    assert plan.filter_fields == tuple(get_list_of_aggregations(SampleAggregationResponse))
+    assert plan.aggregations["country"] == {"terms": {"field": "country"}}
+    assert plan.data_class is SampleData
+    assert plan.response_class is ElasticResponse[SampleData, SampleAggregationResponse]
+
+    dp_plan = query_plan(DataPortalAggregationResponse)
+    assert dp_plan.partial_class is DataPortalPartialData
+    # Same class as the route annotation, so FastAPI does not revalidate it.
+    assert dp_plan.record_response_class is ElasticResponse[DataPortalRecord, DataPortalAggregationResponse]
+    assert dp_plan.facets_response_class is FacetsResponse[DataPortalAggregationResponse]
@@ -33,9 +33,206 @@ async def test_elastic_search_builds_filter_from_params():
 
 
 @pytest.mark.anyio
-async def test_elastic_details_quotes_record_id():
-    """elastic_details should url-quote the record id when querying."""
+async def test_elastic_details_gets_document_by_id():
+    """elastic_details should GET the document directly; the client handles path quoting."""
     es = AsyncMock()
-    es.search.return_value = {"hits": {"hits": [{"_source": {"taxId": 42, "scientificName": "X", "phylogeny": None, "currentStatus": "X", "currentStatusOrder": 1, "rawData": [], "assemblies": [], "annotations": None, "bioSamplesStatus": "X", "rawDataStatus": "X", "assembliesStatus": "X", "annotationStatus": None, "commonName": None, "sampleCount": None, "locations": None, "countries": None}}]}}
-    await elastic_details(es_client=es, index_name="x", record_id="some/id", data_class=DataPortalData)
-    assert es.search.call_args.kwargs["q"] == "_id:some%2Fid"
+    es.get.return_value = {"found": True, "_source": {"taxId": 42, "scientificName": "X", "phylogeny": None, "currentStatus": "X", "currentStatusOrder": 1, "rawData": [], "assemblies": [], "annotations": None, "bioSamplesStatus": "X", "rawDataStatus": "X", "assembliesStatus": "X", "annotationStatus": None, "commonName": None, "sampleCount": None, "locations": None, "countries": None}}
+    result = await elastic_details(es_client=es, index_name="x", record_id="some/id", data_class=DataPortalData)
+    assert es.get.call_args.kwargs == {"index": "x", "id": "some/id"}
+    assert result.results[0].taxId == 42
+    es.search.assert_not_called()
+
+
+@pytest.mark.anyio
+async def test_elastic_search_cursor_opens_pit_and_returns_next_cursor():
+    """cursor='*' should open a PIT, sort on _shard_doc and hand back a cursor for the next page."""
+    from queries import decode_cursor
+
+    es = AsyncMock()
+    es.open_point_in_time.return_value = {"id": "pit-1"}
+    es.close_point_in_time.return_value = {"succeeded": True, "num_freed": 1}
+    es.search.return_value = {
+        "pit_id": "pit-2",
+        "hits": {"total": {"value": 5}, "hits": [
+            {"_source": {"taxId": 1, "scientificName": "X", "currentStatus": "X", "currentStatusOrder": 1, "rawData": [], "assemblies": [], "bioSamplesStatus": "X", "rawDataStatus": "X", "assembliesStatus": "X"}, "sort": [1, 7]},
+        ]},
+        "aggregations": {},
+    }
+    params = DataPortalSearchParams(cursor="*", size=1)
+    result = await elastic_search(
+        es_client=es,
+        index_name="data_portal",
+        params=params,
+        data_class=DataPortalData,
+        aggregation_class=DataPortalAggregationResponse,
+    )
+    assert es.open_point_in_time.call_args.kwargs["index"] == "data_portal"
+    call = es.search.call_args.kwargs
+    assert "index" not in call
+    body = call["body"]
+    assert "from" not in body
+    assert body["pit"]["id"] == "pit-1"
+    assert body["sort"][-1] == {"_shard_doc": "asc"}
+    assert decode_cursor(result.next_cursor) == ("pit-2", [1, 7])
+
+    # Following the cursor reuses the PIT and seeks past the last hit; a short
+    # page ends the walk and closes the PIT.
+    es.search.return_value = {"pit_id": "pit-2", "hits": {"total": {"value": 5}, "hits": []}, "aggregations": {}}
+    result = await elastic_search(
+        es_client=es,
+        index_name="data_portal",
+        params=DataPortalSearchParams(cursor=result.next_cursor, size=1),
+        data_class=DataPortalData,
+        aggregation_class=DataPortalAggregationResponse,
+    )
+    assert es.search.call_args.kwargs["body"]["search_after"] == [1, 7]
+    assert result.next_cursor is None
+    es.close_point_in_time.assert_awaited_with(id="pit-2")
+
+
+@pytest.mark.anyio
+async def test_geo_aggregation_served_from_cache_until_alias_repoint():
+    """Identical geo bodies hit ES once; a changed alias target flushes the cache."""
+    from queries import samples_geo_aggregation_query, refresh_index_generation
+    from models import GeoAggregationParams
+
+    es = AsyncMock()
+    es.search.return_value = {"aggregations": {"grid": {"buckets": []}}}
+    es.indices.resolve_index.return_value = {"indices": [], "aliases": [{"name": "samples", "indices": ["samples_v1"]}]}
+    es.indices.get_field_mapping.return_value = {}
+    assert await refresh_index_generation(es) is True
+
+    for _ in range(3):
+        await samples_geo_aggregation_query(es_client=es, params=GeoAggregationParams(zoom=3), samples_index="samples")
+    assert es.search.await_count == 1
+
+    assert await refresh_index_generation(es) is False
+    es.indices.resolve_index.return_value = {"indices": [], "aliases": [{"name": "samples", "indices": ["samples_v2"]}]}
+    assert await refresh_index_generation(es) is True
+    await samples_geo_aggregation_query(es_client=es, params=GeoAggregationParams(zoom=3), samples_index="samples")
+    assert es.search.await_count == 2
+
+
+@pytest.mark.anyio
+async def test_data_portal_bounds_use_locations_when_geo_point():
+    """A geo_point `locations` mapping turns the bounds into one data_portal query."""
+    from queries import data_portal_search_full, refresh_index_generation
+
+    es = AsyncMock()
+    es.indices.resolve_index.return_value = {"indices": [], "aliases": [{"name": "data_portal", "indices": ["dp_v1"]}]}
+    es.indices.get_field_mapping.return_value = {"dp_v1": {"mappings": {"locations": {
+        "full_name": "locations", "mapping": {"locations": {"type": "geo_point"}},
+    }}}}
+    es.search.return_value = {"hits": {"total": {"value": 0}, "hits": []}, "aggregations": {}}
+    await refresh_index_generation(es)
+
+    params = DataPortalSearchParams(top_left_lat=60.0, top_left_lon=-10.0, bottom_right_lat=50.0, bottom_right_lon=10.0)
+    await data_portal_search_full(
+        es_client=es, params=params, samples_index="samples", data_portal_index="data_portal",
+        data_class=DataPortalData, aggregation_class=DataPortalAggregationResponse,
+    )
+    assert es.search.await_count == 1
+    assert es.search.call_args.kwargs["index"] == "data_portal"
+    filters = es.search.call_args.kwargs["body"]["query"]["bool"]["filter"]
+    assert filters[-1]["geo_bounding_box"]["locations"]["top_left"] == {"lat": 60.0, "lon": -10.0}
+
+
+@pytest.mark.anyio
+async def test_data_portal_suggest_uses_completion_field_when_mapped():
+    from queries import data_portal_suggest, refresh_index_generation
+    from models import SuggestParams
+
+    es = AsyncMock()
+    es.indices.resolve_index.return_value = {"indices": [], "aliases": [{"name": "data_portal", "indices": ["dp_v1"]}]}
+    es.indices.get_field_mapping.return_value = {"dp_v1": {"mappings": {"suggest": {
+        "full_name": "suggest", "mapping": {"suggest": {"type": "completion"}},
+    }}}}
+    await refresh_index_generation(es)
+
+    es.search.return_value = {"hits": {"hits": []}, "suggest": {"species": [{"options": [
+        {"text": "lugworm", "_source": {"taxId": 6344, "scientificName": "Arenicola marina", "commonName": "lugworm"}},
+    ]}]}}
+    result = await data_portal_suggest(
+        es_client=es, params=SuggestParams(prefix="lug", size=5), data_portal_index="data_portal",
+    )
+    assert [s.taxId for s in result.suggestions] == [6344]
+    body = es.search.call_args.kwargs["body"]
+    assert body["size"] == 0
+    assert body["suggest"]["species"] == {"prefix": "lug", "completion": {"field": "suggest", "size": 5}}
+
+
+@pytest.mark.anyio
+async def test_data_portal_bounds_expand_through_samples_without_geo_mapping():
+    from queries import data_portal_search_full
+
+    es = AsyncMock()
+    es.search.side_effect = [
+        {"aggregations": {"tax_ids": {"buckets": [{"key": 6344, "doc_count": 3}]}}},
+        {"hits": {"total": {"value": 0}, "hits": []}, "aggregations": {}},
+    ]
+    params = DataPortalSearchParams(top_left_lat=60.0, top_left_lon=-10.0, bottom_right_lat=50.0, bottom_right_lon=10.0)
+    await data_portal_search_full(
+        es_client=es, params=params, samples_index="samples", data_portal_index="data_portal",
+        data_class=DataPortalData, aggregation_class=DataPortalAggregationResponse,
+    )
+    assert [c.kwargs["index"] for c in es.search.call_args_list] == ["samples", "data_portal"]
+    assert {"terms": {"taxId": [6344]}} in es.search.call_args.kwargs["body"]["query"]["bool"]["filter"]
+
+
+@pytest.mark.anyio
+async def test_concurrent_identical_geo_queries_share_one_es_call():
+    import anyio
+    from cache import search_flights
+    from queries import samples_geo_aggregation_query
+    from models import GeoAggregationParams
+
+    release = anyio.Event()
+
+    async def slow_search(**kwargs):
+        await release.wait()
+        return {"aggregations": {"grid": {"buckets": []}}}
+
+    es = AsyncMock()
+    es.search.side_effect = slow_search
+    coalesced_before = search_flights.coalesced
+
+    async with anyio.create_task_group() as tg:
+        for _ in range(3):
+            tg.start_soon(lambda: samples_geo_aggregation_query(
+                es_client=es, params=GeoAggregationParams(zoom=3, tax_id=6344), samples_index="samples",
+            ))
+        await anyio.wait_all_tasks_blocked()
+        release.set()
+
+    assert es.search.await_count == 1
+    assert search_flights.coalesced - coalesced_before == 2
+
+
+@pytest.mark.anyio
+async def test_msearch_prepared_sends_only_uncached_distinct_queries():
+    from queries import msearch_prepared, prepare_details, prepare_samples_geo_aggregation
+    from models import GeoAggregationParams, SampleData
+
+    es = AsyncMock()
+    geo = {"aggregations": {"grid": {"buckets": [
+        {"key": "4/1/2", "doc_count": 3, "centroid": {"location": {"lat": 1.0, "lon": 2.0}}},
+    ]}}}
+    es.msearch.return_value = {"responses": [geo, {"error": {"type": "index_not_found_exception"}, "status": 404}]}
+    params = GeoAggregationParams(zoom=2, country="Spain")
+    queries = {
+        "map": prepare_samples_geo_aggregation(params=params, samples_index="samples"),
+        "same_map": prepare_samples_geo_aggregation(params=params, samples_index="samples"),
+        "record": prepare_details(index_name="missing", record_id="SAMEA1", data_class=SampleData),
+    }
+    results, errors = await msearch_prepared(es, queries)
+
+    searches = es.msearch.call_args.kwargs["searches"]
+    assert [s for s in searches[::2]] == [{"index": "samples"}, {"index": "missing"}]
+    assert results["map"].clusters[0].count == 3
+    assert results["same_map"] == results["map"]
+    assert "index_not_found_exception" in errors["record"]
+
+    # Answered from query_cache the second time round.
+    results, errors = await msearch_prepared(es, {"map": queries["map"]})
+    assert es.msearch.await_count == 1
+    assert results["map"].clusters[0].key == "4/1/2"
@@ -0,0 +1,81 @@
+import pytest
+
+from sample_tree import SampleTree
+
+
+def sample(accession, derived_from=None, same_as=None):
+    return {"accession": accession, "derivedFrom": derived_from, "sampleSameAs": same_as}
+
+
+def accessions(page):
+    return [node.accession for node in page.results]
+
+
+def test_children_hang_under_their_parent_and_roots_page():
+    tree = SampleTree([sample("C", "A"), sample("A"), sample("B"), sample("D", "A")])
+    roots = tree.page(tax_id=1, parent=None, start=0, size=10, expand=0)
+    assert accessions(roots) == ["A", "B"]
+    assert [node.childCount for node in roots.results] == [2, 0]
+    assert roots.sampleCount == 4
+
+    children = tree.page(tax_id=1, parent="A", start=1, size=10, expand=0)
+    assert (children.total, accessions(children)) == (2, ["D"])
+    assert tree.page(tax_id=1, parent="nope", start=0, size=10, expand=0) is None
+
+
+def test_expand_inlines_the_first_children():
+    tree = SampleTree([sample("A"), sample("B", "A"), sample("C", "A")])
+    root = tree.page(tax_id=1, parent=None, start=0, size=10, expand=1).results[0]
+    assert [child.accession for child in root.children] == ["B"]
+    assert root.childCount == 2
+
+
+def test_same_as_aliases_orphans_and_cycles():
+    tree = SampleTree([
+        # B derives from an accession that A is also known as.
+        sample("A", same_as="SAMEA-OLD"), sample("B", "SAMEA-OLD"),
+        # The parent of O is not a sample of this species.
+        sample("O", "ELSEWHERE"),
+        # X and Y derive from each other.
+        sample("X", "Y"), sample("Y", "X"),
+    ])
+    roots = tree.page(tax_id=1, parent=None, start=0, size=10, expand=5)
+    assert accessions(roots) == ["A", "O", "X"]
+    assert [child.accession for child in roots.results[0].children] == ["B"]
+    assert [child.accession for child in roots.results[2].children] == ["Y"]
+
+
+@pytest.mark.anyio
+async def test_sample_tree_endpoint_walks_once_per_species(client, mock_es_client):
+    mock_es_client.open_point_in_time.return_value = {"id": "pit-1"}
+    mock_es_client.close_point_in_time.return_value = {"succeeded": True, "num_freed": 1}
+    mock_es_client.search.return_value = {"pit_id": "pit-1", "hits": {"hits": [
+        {"_source": {"accession": "A"}, "sort": [0]},
+        {"_source": {"accession": "B", "derivedFrom": "A", "organismPart": "MUSCLE"}, "sort": [1]},
+    ]}}
+
+    response = await client.get("/api/data_portal/6344/sample_tree")
+    assert response.status_code == 200
+    data = response.json()
+    assert (data["taxId"], data["sampleCount"], data["total"]) == (6344, 2, 1)
+    assert data["results"][0]["accession"] == "A"
+    assert data["results"][0]["childCount"] == 1
+
+    response = await client.get("/api/data_portal/6344/sample_tree?parent=A")
+    assert response.json()["results"][0]["organismPart"] == "MUSCLE"
+    response = await client.get("/api/data_portal/6344/sample_tree?parent=Z")
+    assert response.status_code == 404
+
+    assert mock_es_client.search.await_count == 1
+    body = mock_es_client.search.call_args.kwargs["body"]
+    assert body["query"] == {"bool": {"filter": [{"term": {"taxId": 6344}}]}}
+    assert "derivedFrom" in body["_source"]["includes"]
+    assert "customFields" not in body["_source"]["includes"]
+
+
+@pytest.mark.anyio
+async def test_sample_tree_page_is_bounded_in_nodes(client):
+    response = await client.get("/api/data_portal/6344/sample_tree?size=1000&expand=1000")
+    assert response.status_code == 422
+    response = await client.get("/api/data_portal/6344/sample_tree?size=100&expand=100")
+    assert response.status_code == 422
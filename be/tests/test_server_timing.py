@@ -0,0 +1,74 @@
+import pytest
+
+from tests.test_endpoints import DATA_PORTAL_AGGREGATIONS, SAMPLE_HIT
+
+
+def timings(response) -> dict[str, float]:
+    entries = {}
+    for entry in response.headers["server-timing"].split(","):
+        name, dur = entry.strip().split(";dur=")
+        entries[name] = float(dur)
+    return entries
+
+
+PROFILE = {"shards": [
+    {"searches": [{"query": [{"time_in_nanos": 3_000_000}]}], "aggregations": [{"time_in_nanos": 5_000_000}]},
+    {"searches": [{"query": [{"time_in_nanos": 1_000_000}]}], "aggregations": [{"time_in_nanos": 9_000_000}]},
+]}
+
+
+@pytest.mark.anyio
+async def test_data_portal_search_breaks_down_into_phases(client, mock_es_client):
+    """With a bounding box and no geo_point mapping: geo pre-query, main search, parse, serialize."""
+    mock_es_client.search.side_effect = [
+        {"took": 4, "aggregations": {"tax_ids": {"buckets": [{"key": 6344}]}}},
+        {"took": 12, "hits": {"total": {"value": 0}, "hits": []}, "aggregations": DATA_PORTAL_AGGREGATIONS},
+    ]
+    response = await client.get(
+        "/api/data_portal?top_left_lat=60&top_left_lon=-10&bottom_right_lat=50&bottom_right_lon=2"
+    )
+    assert response.status_code == 200
+    phases = timings(response)
+    assert phases["geo_expansion_took"] == 4
+    assert phases["search_took"] == 12
+    assert {"geo_expansion", "search", "parse", "serialize", "total"} <= phases.keys()
+
+
+@pytest.mark.anyio
+async def test_profile_requires_token(client, mock_es_client, monkeypatch):
+    import main
+
+    response = await client.get("/api/samples?profile=true")
+    assert response.status_code == 403
+
+    monkeypatch.setattr(main, "PROFILE_TOKEN", "secret")
+    response = await client.get("/api/samples?profile=true", headers={"X-Profile-Token": "wrong"})
+    assert response.status_code == 403
+    mock_es_client.search.assert_not_called()
+
+
+@pytest.mark.anyio
+async def test_profile_attaches_es_profile_and_skips_cache(client, mock_es_client, monkeypatch):
+    import main
+    from cache import query_cache
+
+    monkeypatch.setattr(main, "PROFILE_TOKEN", "secret")
+    mock_es_client.search.return_value = {
+        "took": 20, "hits": {"total": {"value": 1}, "hits": [{"_source": SAMPLE_HIT}]},
+        "aggregations": {}, "profile": PROFILE,
+    }
+    response = await client.get(
+        "/api/samples?profile=true&aggs=false", headers={"X-Profile-Token": "secret"}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["results"][0]["accession"] == SAMPLE_HIT["accession"]
+    assert data["profile"] == [{"query_type": "search", "profile": PROFILE}]
+    assert response.headers["cache-control"] == "no-store"
+    assert mock_es_client.search.call_args.kwargs["body"]["profile"] is True
+    assert len(query_cache) == 0
+
+    # Slowest shard per phase.
+    phases = timings(response)
+    assert phases["search_query"] == 3.0
+    assert phases["search_aggs"] == 9.0
@@ -0,0 +1,73 @@
+import json
+import logging
+
+import pytest
+from unittest.mock import AsyncMock
+
+from slow_queries import fingerprint, query_shape, slow_query_log
+
+
+@pytest.fixture
+def log_everything(monkeypatch):
+    monkeypatch.setattr(slow_query_log, "threshold_ms", 1e-9)
+    slow_query_log.clear()
+    yield
+    slow_query_log.clear()
+
+
+def test_query_shape_strips_literals_but_keeps_structure():
+    a = {"query": {"bool": {"filter": [{"terms": {"country": ["Spain", "France"]}}]}}, "size": 10,
+         "aggs": {"sex": {"terms": {"field": "sex"}}}}
+    b = {"size": 50, "query": {"bool": {"filter": [{"terms": {"country": ["Kenya"]}}]}},
+         "aggs": {"sex": {"terms": {"field": "sex"}}}}
+    c = {"query": {"bool": {"filter": [{"terms": {"sex": ["male"]}}]}}, "size": 10,
+         "aggs": {"sex": {"terms": {"field": "sex"}}}}
+    assert query_shape(a) == {
+        "aggs": {"sex": {"terms": {"field": "sex"}}},
+        "query": {"bool": {"filter": [{"terms": {"country": ["?"]}}]}},
+        "size": "?",
+    }
+    assert fingerprint(query_shape(a)) == fingerprint(query_shape(b))
+    assert fingerprint(query_shape(a)) != fingerprint(query_shape(c))
+
+
+@pytest.mark.anyio
+async def test_slow_route_queries_logged_as_json_and_ranked(client, mock_es_client, log_everything, caplog, metrics_auth):
+    mock_es_client.search.return_value = {
+        "took": 900, "hits": {"total": {"value": 7}, "hits": []}, "aggregations": {"grid": {"buckets": []}},
+    }
+    with caplog.at_level(logging.WARNING, logger="slow_queries"):
+        await client.get("/api/samples/geo_aggregation?zoom=3&country=Spain")
+        await client.get("/api/samples/geo_aggregation?zoom=3&country=Kenya")
+        await client.get("/api/samples/geo_aggregation?zoom=3&tax_id=6344")
+
+    entry = json.loads(caplog.records[0].getMessage())
+    assert entry["event"] == "slow_query"
+    assert entry["query_type"] == "geo_aggregation"
+    assert entry["caller"] == "/api/samples/geo_aggregation"
+    assert entry["took_ms"] == 900
+    assert entry["hits"] == 7
+    assert entry["aggs"] == 1
+    assert "Spain" not in caplog.records[0].getMessage()
+
+    response = await client.get("/api/slow_queries?limit=5", headers=metrics_auth)
+    top = response.json()["fingerprints"]
+    assert [g["count"] for g in top] == [2, 1]
+    assert top[0]["callers"] == ["/api/samples/geo_aggregation"]
+    assert top[0]["fingerprint"] == entry["fingerprint"]
+
+
+@pytest.mark.anyio
+async def test_mcp_tool_calls_are_attributed_to_the_tool(log_everything):
+    from mcp_server import get_sample, set_es_client
+
+    es = AsyncMock()
+    es.get.return_value = {"found": True, "_source": {"accession": "SAMEA1"}}
+    set_es_client(es)
+    try:
+        await get_sample("SAMEA1")
+    except Exception:
+        pass
+    [group] = slow_query_log.top(10)
+    assert group["callers"] == ["mcp:get_sample"]
+    assert group["shape"] == {"get": "?"}
@@ -0,0 +1,173 @@
+import anyio
+import pytest
+from fastapi import FastAPI, HTTPException
+
+from admission import AdmissionMiddleware
+from warmup import Warmer, replay_list_from_access_log
+
+
+def recording_app():
+    app = FastAPI()
+    app.state.seen = []
+
+    @app.get("/api/data_portal")
+    async def page(size: int = 10):
+        app.state.seen.append(f"page size={size}")
+        return {"results": [{"taxId": 6344}, {"taxId": 9606}]}
+
+    @app.get("/api/data_portal/{tax_id}/summary")
+    async def summary(tax_id: int):
+        app.state.seen.append(f"summary {tax_id}")
+        return {}
+
+    @app.get("/api/broken")
+    async def broken():
+        raise HTTPException(status_code=500, detail="boom")
+
+    @app.get("/api/{path:path}")
+    async def anything(path: str):
+        app.state.seen.append(path)
+        return {}
+
+    return app
+
+
+@pytest.mark.anyio
+async def test_replays_landing_page_first_then_top_species():
+    app = recording_app()
+    warmer = Warmer(replay=["/api/samples/facets", "/api/data_portal?size=5"], top_species=1)
+    assert not warmer.ready
+
+    await warmer.run(app)
+
+    assert warmer.ready
+    assert app.state.seen[0] == "page size=5"
+    assert sorted(app.state.seen[1:]) == [
+        "data_portal/6344", "data_portal/6344/sample_tree", "samples/facets", "summary 6344",
+    ]
+    assert warmer.last["replayed"] == 5 and warmer.last["failed"] == 0
+
+
+@pytest.mark.anyio
+async def test_failures_are_counted_and_still_end_in_ready():
+    warmer = Warmer(replay=["/api/broken", "/api/samples/facets"], top_species=0)
+
+    await warmer.run(recording_app())
+
+    assert warmer.ready
+    assert warmer.last["replayed"] == 1 and warmer.last["failed"] == 1
+
+
+@pytest.mark.anyio
+async def test_warming_is_not_rate_limited():
+    app = AdmissionMiddleware(recording_app(), rate=1, burst=1, max_client_in_flight=1)
+    warmer = Warmer(replay=["/api/samples/facets", "/api/data_portal/facets", "/api/data_portal"], top_species=2)
+
+    await warmer.run(app)
+
+    assert warmer.last["replayed"] == 9 and warmer.last["failed"] == 0
+
+
+def test_replay_list_from_access_log_ranks_successful_gets():
+    lines = [
+        'INFO:     10.0.0.1:5000 - "GET /api/data_portal/facets HTTP/1.1" 200 OK',
+        'INFO:     10.0.0.1:5000 - "GET /api/data_portal?q=leech HTTP/1.1" 200 OK',
+        'INFO:     10.0.0.2:5001 - "GET /api/data_portal?q=leech HTTP/1.1" 200 OK',
+        'INFO:     10.0.0.2:5001 - "GET /api/data_portal?q=leech HTTP/1.1" 500 Internal Server Error',
+        'INFO:     10.0.0.2:5001 - "POST /api/batch HTTP/1.1" 200 OK',
+        'INFO:     10.0.0.2:5001 - "GET /api/samples/export HTTP/1.1" 200 OK',
+        'INFO:     10.0.0.2:5001 - "GET /api/metrics HTTP/1.1" 200 OK',
+    ]
+    assert replay_list_from_access_log(lines) == ["/api/data_portal?q=leech", "/api/data_portal/facets"]
+    assert replay_list_from_access_log(lines, limit=1) == ["/api/data_portal?q=leech"]
+
+
+@pytest.mark.anyio
+async def test_ready_only_after_warming(client, monkeypatch):
+    from warmup import warmer
+    monkeypatch.setattr(warmer, "ready", False)
+
+    response = await client.get("/api/ready")
+    assert response.status_code == 503
+    assert response.json() == {"status": "warming"}
+
+    monkeypatch.setattr(warmer, "ready", True)
+    monkeypatch.setattr(warmer, "last", {"replayed": 3, "failed": 0, "timed_out": False, "seconds": 0.1})
+    response = await client.get("/api/ready")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ready"
+    assert response.headers["cache-control"] == "no-store"
+
+
+@pytest.mark.anyio
+async def test_preparation_counts_against_the_timeout():
+    async def slow_pyramid():
+        await anyio.sleep(10)
+
+    app = recording_app()
+    warmer = Warmer(replay=["/api/samples/facets"], top_species=0, timeout=0.05)
+
+    await warmer.run(app, prepare=slow_pyramid)
+
+    assert warmer.ready and warmer.last["timed_out"]
+    assert app.state.seen == []
+
+
+@pytest.mark.anyio
+async def test_runs_asked_for_mid_pass_queue_one_more_pass():
+    app = recording_app()
+    warmer = Warmer(replay=["/api/samples/facets"], top_species=0)
+    release = anyio.Event()
+    passes = []
+
+    async def prepare():
+        passes.append(len(passes))
+        if len(passes) == 1:
+            await release.wait()
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(lambda: warmer.run(app, prepare=prepare))
+        await anyio.wait_all_tasks_blocked()
+        await warmer.run(app, prepare=prepare)
+        await warmer.run(app, prepare=prepare)
+        release.set()
+
+    assert passes == [0, 1]
+    assert app.state.seen == ["samples/facets", "samples/facets"]
+
+
+@pytest.mark.anyio
+async def test_following_worker_ready_once_the_lead_has_warmed(monkeypatch):
+    monkeypatch.setattr("warmup.WARMUP_FOLLOW_POLL_SECONDS", 0.01)
+    lead = Warmer(replay=["/api/samples/facets"], top_species=0)
+    follower = Warmer(replay=["/api/samples/facets"], top_species=0)
+    app = recording_app()
+    published = []
+
+    async def lead_stats():
+        return published[-1] if published else None
+
+    async def mark_warmed(stats):
+        published.append(stats)
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(follower.follow, lead_stats)
+        await anyio.wait_all_tasks_blocked()
+        assert not follower.ready
+        await lead.run(app, done=mark_warmed)
+
+    assert follower.ready
+    assert follower.last["followed"] and follower.last["replayed"] == 1
+    # Only the lead replayed.
+    assert app.state.seen == ["samples/facets"]
+
+
+@pytest.mark.anyio
+async def test_following_worker_ready_at_the_timeout_without_a_lead():
+    async def never():
+        return None
+
+    follower = Warmer(timeout=0.05)
+    await follower.follow(never)
+
+    assert follower.ready and follower.last["timed_out"]
@@ -0,0 +1,250 @@
+# be/warmup.py
+"""Prime the ES and BE caches by replaying popular GET requests after each alias resolution.
+
+The replay list is one request target per line ("/api/..." with its query
+string; blank lines and "#" comments are skipped). WARMUP_FILE names one; by
+default it is DEFAULT_REPLAY, followed by the details, summary and first tree
+page of the top species on the default data portal page. A list can also be
+derived from uvicorn access logs:
+
+    python warmup.py access.log [more.log ...] [--limit 50] > warmup.txt
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+import anyio
+
+from admission import INTERNAL_REQUEST
+
+logger = logging.getLogger(__name__)
+
+WARMUP_FILE = os.getenv("WARMUP_FILE", "")
+WARMUP_TOP_SPECIES = int(os.getenv("WARMUP_TOP_SPECIES", "10"))
+WARMUP_CONCURRENCY = int(os.getenv("WARMUP_CONCURRENCY", "4"))
+# Past this, readiness is reported anyway: a slow cluster should not keep
+# every worker out of rotation.
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "120"))
+# How often a worker leaving warming to the lead worker checks whether it is done.
+WARMUP_FOLLOW_POLL_SECONDS = 1.0
+
+# What the FE asks for before anyone has typed or clicked: the landing table,
+# the facet counts and the world map at the zooms it opens on.
+DEFAULT_REPLAY = [
+    "/api/data_portal?start=0&size=10&fields=taxId,scientificName,commonName,sampleCount,currentStatus",
+    "/api/data_portal/facets",
+    "/api/samples/facets",
+    "/api/samples/geo_aggregation?zoom=1",
+    "/api/samples/geo_aggregation?zoom=2",
+    "/api/samples/geo_aggregation?zoom=3",
+    "/api/samples/geo_aggregation?zoom=4",
+]
+
+# Replayed per taxId of the first data portal page in the list.
+SPECIES_REPLAY = [
+    "/api/data_portal/{tax_id}",
+    "/api/data_portal/{tax_id}/summary",
+    "/api/data_portal/{tax_id}/sample_tree?start=0&size=50&expand=100",
+]
+
+# Requests that must not be replayed: dumps, operational endpoints, MCP.
+NOT_REPLAYED = ("/api/data_portal/export", "/api/samples/export", "/api/metrics",
+                "/api/slow_queries", "/api/ready", "/api/mcp", "/api/docs", "/api/openapi.json")
+
+_ACCESS_LINE = re.compile(r'"GET (/api/\S*) HTTP/[\d.]+" 200\b')
+
+
+def load_replay_list(path: str) -> list[str]:
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def replay_list_from_access_log(lines, *, limit: int = 50) -> list[str]:
+    """The `limit` most requested successful GET /api targets in uvicorn access log lines."""
+    counts = Counter()
+    for line in lines:
+        match = _ACCESS_LINE.search(line)
+        if match and not match.group(1).startswith(NOT_REPLAYED):
+            counts[match.group(1)] += 1
+    return [target for target, _ in counts.most_common(limit)]
+
+
+async def _get(app, target: str) -> tuple[int, bytes]:
+    """GET `target` from the app in-process, as an internal request that admission lets through."""
+    url = urlsplit(target)
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "server": ("warmup", 80), "client": None,
+        "root_path": "", "path": url.path, "raw_path": url.path.encode(),
+        "query_string": url.query.encode(), "headers": [], INTERNAL_REQUEST: True,
+    }
+    status, body = 0, []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            body.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, b"".join(body)
+
+
+def _tax_ids(body: bytes, limit: int) -> list:
+    try:
+        results = json.loads(body).get("results", [])
+    except (ValueError, AttributeError):
+        return []
+    return [r["taxId"] for r in results if isinstance(r, dict) and "taxId" in r][:limit]
+
+
+class Warmer:
+    """Replays the list once per index generation; `ready` once the first pass is over.
+
+    A run asked for while a pass is going queues one more pass after it (a
+    newer generation may have arrived mid-pass); further asks fold into that
+    one. Failed requests are logged and counted, never retried: warming only
+    saves the first users a cold cache. A worker that leaves warming to
+    another uses `follow` instead.
+    """
+
+    def __init__(self, *, replay: list[str] | None = None, top_species: int = WARMUP_TOP_SPECIES,
+                 concurrency: int = WARMUP_CONCURRENCY, timeout: float = WARMUP_TIMEOUT_SECONDS):
+        self.replay = replay
+        self.top_species = top_species
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.ready = False
+        self._running = False
+        self._pending = None
+        self.last = {}
+
+    def _replay_list(self) -> list[str]:
+        if self.replay is not None:
+            return self.replay
+        if WARMUP_FILE:
+            return load_replay_list(WARMUP_FILE)
+        return DEFAULT_REPLAY
+
+    async def run(self, app, *, prepare=None, done=None) -> None:
+        """Warm `app`.
+
+        `prepare`, an async callable, runs first and counts against the
+        timeout; `done` is awaited with the stats after each pass.
+        """
+        if self._running:
+            self._pending = (app, prepare, done)
+            return
+        self._running = True
+        try:
+            while True:
+                await self._pass(app, prepare)
+                if done is not None:
+                    await done(self.last)
+                if self._pending is None:
+                    break
+                (app, prepare, done), self._pending = self._pending, None
+        finally:
+            self._running = False
+
+    async def follow(self, lead_stats) -> None:
+        """Report ready once another worker has warmed the shared caches, or at the timeout.
+
+        `lead_stats`, an async callable, returns that worker's stats when its
+        pass is over, else None.
+        """
+        started = time.perf_counter()
+        stats, timed_out = None, False
+        try:
+            with anyio.move_on_after(self.timeout) as scope:
+                while (stats := await lead_stats()) is None:
+                    await anyio.sleep(WARMUP_FOLLOW_POLL_SECONDS)
+            timed_out = scope.cancelled_caught
+        except Exception:
+            logger.exception("Following cache warming failed")
+        finally:
+            self.ready = True
+            self.last = {
+                **(stats or {}), "followed": True, "timed_out": timed_out,
+                "seconds": round(time.perf_counter() - started, 3),
+            }
+        logger.info("Cache warming done by the lead worker: %s", self.last)
+
+    async def _pass(self, app, prepare) -> None:
+        started = time.perf_counter()
+        stats = {"replayed": 0, "failed": 0, "timed_out": False}
+        try:
+            replay = self._replay_list()
+            with anyio.move_on_after(self.timeout) as scope:
+                if prepare is not None:
+                    await prepare()
+                await self._replay(app, replay, stats)
+            stats["timed_out"] = scope.cancelled_caught
+        except Exception:
+            logger.exception("Cache warming failed")
+        finally:
+            self.ready = True
+            self.last = {**stats, "seconds": round(time.perf_counter() - started, 3)}
+        logger.info("Cache warming done: %s", self.last)
+
+    async def _replay(self, app, replay: list[str], stats: dict) -> None:
+        limiter = anyio.CapacityLimiter(max(self.concurrency, 1))
+        species: list = []
+
+        async def one(target: str):
+            async with limiter:
+                try:
+                    status, body = await _get(app, target)
+                except Exception as e:
+                    status, body = 0, str(e).encode()
+            if status == 200:
+                stats["replayed"] += 1
+            else:
+                stats["failed"] += 1
+                logger.warning("Warming %s failed (%s): %.200s", target, status, body)
+            return status, body
+
+        # The landing page first: its taxIds name the top species.
+        first_page = next((t for t in replay if urlsplit(t).path == "/api/data_portal"), None)
+        if first_page is not None:
+            status, body = await one(first_page)
+            if status == 200:
+                species = _tax_ids(body, self.top_species)
+
+        async with anyio.create_task_group() as tg:
+            for target in replay:
+                if target != first_page:
+                    tg.start_soon(one, target)
+            for tax_id in species:
+                for template in SPECIES_REPLAY:
+                    tg.start_soon(one, template.format(tax_id=tax_id))
+
+
+warmer = Warmer()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print a warm-up replay list from uvicorn access logs.")
+    parser.add_argument("logs", nargs="+", help="Access log files")
+    parser.add_argument("--limit", type=int, default=50, help="Number of targets to keep")
+    args = parser.parse_args(argv)
+    lines = []
+    for path in args.logs:
+        with open(path, errors="replace") as f:
+            lines.extend(f)
+    for target in replay_list_from_access_log(lines, limit=args.limit):
+        sys.stdout.write(target + "\n")
+
+
+if __name__ == "__main__":
+    main()
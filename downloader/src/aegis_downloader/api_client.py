@@ -5,11 +5,30 @@ import httpx
 
 MAX_RESULT_WINDOW = 10000
 
+# Query params an older BE does not know and refuses (its params forbid extras).
+NEWER_PARAMS = frozenset({"cursor", "aggs"})
+
 
 class PaginationCeilingError(RuntimeError):
     pass
 
 
+def _rejects_params(response: httpx.Response, names: frozenset[str]) -> bool:
+    """Whether `response` is a 422 refusing one of the query params `names` as unknown."""
+    if response.status_code != 422:
+        return False
+    try:
+        errors = response.json().get("detail", [])
+    except ValueError:
+        return False
+    return any(
+        isinstance(error, dict)
+        and error.get("type") == "extra_forbidden"
+        and error.get("loc", [None])[-1] in names
+        for error in errors
+    )
+
+
 class ApiClient:
     def __init__(
         self,
@@ -53,19 +72,40 @@ class ApiClient:
         page_size: int,
     ) -> Iterator[dict]:
         cleaned = {k: v for k, v in filters.items() if v is not None}
+        # Ask for cursor paging; servers that support it echo `next_cursor`.
+        # Older ones reject the unknown params with a 422, so drop them and
+        # retry with start/size below.
+        cursor = "*"
+        legacy = False
         start = 0
         while True:
             params = {**cleaned, "start": start, "size": page_size}
+            if not legacy:
+                # Facets are never read here; skip their cost on every page.
+                params["aggs"] = "false"
+                if cursor is not None:
+                    params["cursor"] = cursor
             response = self._client.get(f"{self._base}{path}", params=params)
+            if not legacy and _rejects_params(response, NEWER_PARAMS):
+                legacy = True
+                cursor = None
+                continue
             response.raise_for_status()
             body = response.json()
+            results = body.get("results", [])
+            if "next_cursor" in body:
+                yield from results
+                cursor = body["next_cursor"]
+                if cursor is None or not results:
+                    return
+                continue
+            cursor = None
             total = body.get("total", 0)
             if total > MAX_RESULT_WINDOW:
                 raise PaginationCeilingError(
                     f"Filter matches {total} records; AEGIS BE caps pagination at "
                     f"{MAX_RESULT_WINDOW} — narrow your filter."
                 )
-            results = body.get("results", [])
             yield from results
             start += len(results)
             if start >= total or not results:
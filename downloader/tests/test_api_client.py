@@ -52,6 +52,7 @@ def test_iter_data_portal_sends_filter_params():
     list(client.iter_data_portal(filters={"kingdom": "Animalia", "tax_order": "Lepidoptera"}, page_size=100))
     assert captured[0].url.params["kingdom"] == "Animalia"
     assert captured[0].url.params["tax_order"] == "Lepidoptera"
+    assert captured[0].url.params["aggs"] == "false"
 
 
 def test_iter_data_portal_raises_when_total_exceeds_max_result_window():
@@ -102,3 +103,53 @@ def test_iter_samples_paginates():
     client = ApiClient("http://test", transport=make_mock_client_factory(handler))
     records = list(client.iter_samples(filters={"taxId": 43171}, page_size=2))
     assert [r["accession"] for r in records] == ["A", "B", "C"]
+
+
+def test_iter_data_portal_follows_cursor_past_max_result_window():
+    captured: list[httpx.Request] = []
+    pages = {
+        "*": {"total": 20000, "results": [{"taxId": 1}, {"taxId": 2}], "next_cursor": "c1"},
+        "c1": {"total": 20000, "results": [{"taxId": 3}], "next_cursor": None},
+    }
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        captured.append(request)
+        return httpx.Response(200, json={**pages[request.url.params["cursor"]], "aggregations": {}})
+
+    client = ApiClient("http://test", transport=make_mock_client_factory(handler))
+    records = list(client.iter_data_portal(filters={}, page_size=2))
+    assert [r["taxId"] for r in records] == [1, 2, 3]
+    assert [r.url.params["cursor"] for r in captured] == ["*", "c1"]
+
+
+def test_iter_data_portal_falls_back_when_server_rejects_cursor():
+    captured: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        captured.append(request)
+        if "cursor" in request.url.params:
+            return httpx.Response(422, json={"detail": [
+                {"type": "extra_forbidden", "loc": ["query", "cursor"], "msg": "Extra inputs are not permitted"},
+                {"type": "extra_forbidden", "loc": ["query", "aggs"], "msg": "Extra inputs are not permitted"},
+            ]})
+        start = int(request.url.params["start"])
+        results = [{"taxId": 1}, {"taxId": 2}] if start == 0 else [{"taxId": 3}]
+        return httpx.Response(200, json={"total": 3, "start": start, "size": 2, "results": results, "aggregations": {}})
+
+    client = ApiClient("http://test", transport=make_mock_client_factory(handler))
+    records = list(client.iter_data_portal(filters={}, page_size=2))
+    assert [r["taxId"] for r in records] == [1, 2, 3]
+    assert [("cursor" in r.url.params, "aggs" in r.url.params) for r in captured] == [
+        (True, True), (False, False), (False, False),
+    ]
+
+
+def test_iter_data_portal_raises_other_validation_errors():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(422, json={"detail": [
+            {"type": "extra_forbidden", "loc": ["query", "colour"], "msg": "Extra inputs are not permitted"},
+        ]})
+
+    client = ApiClient("http://test", transport=make_mock_client_factory(handler))
+    with pytest.raises(httpx.HTTPStatusError):
+        list(client.iter_data_portal(filters={"colour": "red"}, page_size=2))
@@ -3,11 +3,8 @@ import dash
 from dash import callback, Output, Input, html, dcc
 import dash_bootstrap_components as dbc
 import dash_leaflet as dl
-import requests
 
 PAGE_SIZE = 10
-import os
-BACKEND_URL = os.getenv("BACKEND_URL", "https://portal.aegisearth.bio/api")
 
 dash.register_page(
     __name__,
@@ -195,7 +192,7 @@ def return_tax_id_link(scientific_name: str, tax_id: str) -> html.A:
     )
 
 
-from .utils import return_badge_status  # noqa: E402
+from .utils import backend_get, return_badge_status, unavailable_message  # noqa: E402
 
 
 @callback(
@@ -267,13 +264,14 @@ def create_update_data_table(
     start = (page - 1) * PAGE_SIZE
     params["start"] = start
     params["size"] = PAGE_SIZE
+    # Only what the table renders; skips the rawData/assemblies/annotations arrays.
+    params["fields"] = "taxId,scientificName,commonName,sampleCount,currentStatus"
 
     # Fetch
-    response = requests.get(
-        f"{BACKEND_URL}/data_portal",
-        params=params,
-        timeout=30,
-    ).json()
+    response = backend_get("/data_portal", params=params, timeout=30)
+    if response.status_code != 200:
+        return unavailable_message("species"), [], 1, [], [], [], [], {}
+    response = response.json()
 
     # Table
     table_header = [
@@ -462,28 +460,30 @@ def update_map_clusters(viewport, active_filters):
         # If any are set, fetch matching taxIds from data_portal and pass to geo_aggregation.
         has_taxonomy = any(active_filters.get(k) for k in ("kingdom", "tax_order", "family"))
         if has_taxonomy:
-            dp_params = {"size": 10000, "start": 0}
+            dp_params = {"size": 10000, "start": 0, "fields": "taxId"}
             for k in ("kingdom", "tax_order", "family"):
                 if active_filters.get(k):
                     dp_params[k] = active_filters[k]
             try:
-                dp_resp = requests.get(f"{BACKEND_URL}/data_portal", params=dp_params, timeout=15).json()
-                tax_ids = [str(r["taxId"]) for r in dp_resp.get("results", [])]
-                if tax_ids:
-                    params["tax_ids"] = ",".join(tax_ids)
-                else:
-                    return []  # No matching species, no markers
+                dp_resp = backend_get("/data_portal", params=dp_params, timeout=15)
             except Exception:
-                pass
+                return dash.no_update
+            if dp_resp.status_code != 200:
+                # Busy, not empty: keep the markers already drawn.
+                return dash.no_update
+            tax_ids = [str(r["taxId"]) for r in dp_resp.json().get("results", [])]
+            if tax_ids:
+                params["tax_ids"] = ",".join(tax_ids)
+            else:
+                return []  # No matching species, no markers
 
     try:
-        response = requests.get(
-            f"{BACKEND_URL}/samples/geo_aggregation",
-            params=params,
-            timeout=15,
-        ).json()
+        response = backend_get("/samples/geo_aggregation", params=params, timeout=15)
     except Exception:
-        return []
+        return dash.no_update
+    if response.status_code != 200:
+        return dash.no_update
+    response = response.json()
 
     markers = []
     for c in response.get("clusters", []):
@@ -3,16 +3,16 @@ from typing import Callable
 
 import dash
 import dash_leaflet as dl
-import requests
 import json
 from dash import html, Output, Input, callback, dcc, MATCH
 import dash_bootstrap_components as dbc
 
 PAGE_SIZE = 10
-import os
-BACKEND_URL = os.getenv("BACKEND_URL", "https://portal.aegisearth.bio/api")
+# Root samples per metadata page, and derived samples listed under each.
+TREE_PAGE_SIZE = 50
+TREE_CHILDREN_SHOWN = 100
 
-from .utils import return_badge_status
+from .utils import backend_get, return_badge_status, unavailable_message
 
 dash.register_page(__name__, path_template="/data-portal/<tax_id>", order=1)
 
@@ -463,9 +463,10 @@ def taxonomy_badge(label: str, value: str, color: str) -> html.Span:
     )
 
 
-def build_sample_hierarchy(samples, tax_id):
-    """Group samples by derivedFrom into a parent/child hierarchy."""
-    if not samples:
+def build_sample_hierarchy(tree, tax_id):
+    """Render a page of the BE's sample tree: root samples with their derived samples."""
+    roots = tree.get("results", [])
+    if not roots:
         return html.Div(
             [
                 html.P(
@@ -476,21 +477,6 @@ def build_sample_hierarchy(samples, tax_id):
             className="text-center py-4",
         )
 
-    # Index samples by accession
-    by_accession = {s["accession"]: s for s in samples}
-
-    # Find root samples (derivedFrom is None/null or not present)
-    roots = [s for s in samples if not s.get("derivedFrom")]
-    children_map = {}
-    for s in samples:
-        parent = s.get("derivedFrom")
-        if parent:
-            children_map.setdefault(parent, []).append(s)
-
-    # If no roots found but samples exist, treat all as roots
-    if not roots and samples:
-        roots = samples
-
     def _format_sex(sex_value):
         if not sex_value:
             return None
@@ -554,7 +540,7 @@ def build_sample_hierarchy(samples, tax_id):
     for i, root in enumerate(roots):
         accession = root["accession"]
         detail_parts = _sample_detail_parts(root)
-        children = children_map.get(accession, [])
+        children = root.get("children") or []
         collapse_id = {"type": "sample-collapse", "index": i}
         toggle_id = {"type": "sample-toggle", "index": i}
 
@@ -579,7 +565,7 @@ def build_sample_hierarchy(samples, tax_id):
                                 "marginRight": "0.4rem",
                             },
                         ),
-                        f"+{len(children)} derived",
+                        f"+{root['childCount']} derived",
                     ],
                     id=toggle_id,
                     n_clicks=0,
@@ -633,6 +619,13 @@ def build_sample_hierarchy(samples, tax_id):
         # Collapsible children
         if children:
             child_rows = [make_child_row(c) for c in children]
+            if root["childCount"] > len(children):
+                child_rows.append(
+                    html.Div(
+                        f"… and {root['childCount'] - len(children)} more",
+                        style={"color": "var(--aegis-text-muted)", "fontSize": "0.8rem", "padding": "0.4rem 0.5rem"},
+                    )
+                )
             all_elements.append(
                 dbc.Collapse(
                     html.Div(
@@ -688,19 +681,24 @@ def update_chevron(is_open):
 def create_data_portal_record(tax_id):
     """Fetch and display species record details."""
     if not tax_id:
-        return [], [], json.dumps({"samples": [], "rawData": [], "assemblies": [], "tax_id": None}), [], html.Div(), dash.no_update
-    response = requests.get(
-        f"{BACKEND_URL}/data_portal/{tax_id}"
-    ).json()
+        return [], [], json.dumps({"rawData": [], "assemblies": [], "tax_id": None}), [], html.Div(), dash.no_update
+    unavailable = (
+        unavailable_message("this species"), [], json.dumps({"rawData": [], "assemblies": [], "tax_id": None}),
+        [], html.Div(), dash.no_update,
+    )
+    response = backend_get(f"/data_portal/{tax_id}")
+    if response.status_code != 200:
+        return unavailable
+    response = response.json()
     if not response.get("results"):
-        return [], [], json.dumps({"samples": [], "rawData": [], "assemblies": [], "tax_id": tax_id}), [], html.Div(), dash.no_update
+        return [], [], json.dumps({"rawData": [], "assemblies": [], "tax_id": tax_id}), [], html.Div(), dash.no_update
     response = response["results"][0]
 
-    # Fetch samples from dedicated endpoint
-    samples_response = requests.get(
-        f"{BACKEND_URL}/samples?taxId={tax_id}&size=1000"
-    ).json()
-    samples_list = samples_response.get("results", [])
+    # Counts, countries and map points come aggregated over every sample.
+    summary = backend_get(f"/data_portal/{tax_id}/summary")
+    if summary.status_code != 200:
+        return unavailable
+    summary = summary.json()
 
     # Build header
     children = [
@@ -723,11 +721,8 @@ def create_data_portal_record(tax_id):
         ),
     ]
 
-    # Compute sample stats
-    sample_count = len(samples_list)
-    countries = sorted(set(
-        s.get("country") for s in samples_list if s.get("country")
-    ))
+    sample_count = summary["sampleCount"]
+    countries = summary["countries"]
     countries_str = ", ".join(countries) if countries else "—"
 
     # Info grid
@@ -779,25 +774,17 @@ def create_data_portal_record(tax_id):
         },
     )
 
-    # Build map markers — deduplicate by position, show count
-    location_groups = {}
-    for s in samples_list:
-        loc = s.get("location")
-        if loc and loc.get("lat") and loc.get("lon"):
-            key = (loc["lat"], loc["lon"])
-            location_groups.setdefault(key, []).append(s)
-
+    # Build map markers — one per site, show count
     map_markers = []
-    for (lat, lon), group in location_groups.items():
-        count = len(group)
+    for location in summary["locations"]:
+        count = location["count"]
         if count == 1:
-            s = group[0]
-            tooltip_text = f"{s['accession']} \u00b7 {s.get('organismPart', '')}"
+            tooltip_text = f"{location['accession']} \u00b7 {location.get('organismPart') or ''}"
         else:
             tooltip_text = f"{count} samples"
         map_markers.append(
             dl.CircleMarker(
-                center=[lat, lon],
+                center=[location["lat"], location["lon"]],
                 radius=max(8, min(30, count / 2)),
                 children=dl.Tooltip(tooltip_text),
                 color="#4E6B66",
@@ -905,21 +892,20 @@ def create_data_portal_record(tax_id):
         )
 
     agg_data = {
-        "samples": samples_list,
         "rawData": response.get("rawData", []),
         "assemblies": response.get("assemblies", []),
         "annotations": response.get("annotations") or [],
         "tax_id": tax_id,
     }
     # Compute map viewport to fit all marker positions
-    if location_groups:
-        all_lats = [lat for lat, lon in location_groups]
-        all_lons = [lon for lat, lon in location_groups]
-        if len(location_groups) == 1:
-            map_viewport = {"center": [all_lats[0], all_lons[0]], "zoom": 10}
+    bounds = summary.get("bounds")
+    if bounds:
+        top_left, bottom_right = bounds["top_left"], bounds["bottom_right"]
+        if len(summary["locations"]) == 1:
+            map_viewport = {"center": [top_left["lat"], top_left["lon"]], "zoom": 10}
         else:
-            center_lat = (min(all_lats) + max(all_lats)) / 2
-            center_lon = (min(all_lons) + max(all_lons)) / 2
+            center_lat = (top_left["lat"] + bottom_right["lat"]) / 2
+            center_lon = (top_left["lon"] + bottom_right["lon"]) / 2
             map_viewport = {"center": [center_lat, center_lon], "zoom": 6}
     else:
         map_viewport = dash.no_update
@@ -951,11 +937,24 @@ def create_tabs(active_tab, agg_data, metadata_page, raw_data_page, assemblies_p
     hidden_pagination = {"display": "none"}
 
     if active_tab == "metadata_tab":
-        samples = agg_data.get("samples", [])
         tax_id = agg_data.get("tax_id")
+        if tax_id is None:
+            return build_sample_hierarchy({}, tax_id), 1, hidden_pagination, 1, hidden_pagination, 1, hidden_pagination
 
-        hierarchy = build_sample_hierarchy(samples, tax_id)
-        return hierarchy, 1, hidden_pagination, 1, hidden_pagination, 1, hidden_pagination
+        page = metadata_page or 1
+        tree = backend_get(
+            f"/data_portal/{tax_id}/sample_tree",
+            params={"start": (page - 1) * TREE_PAGE_SIZE, "size": TREE_PAGE_SIZE, "expand": TREE_CHILDREN_SHOWN},
+        )
+        if tree.status_code != 200:
+            return unavailable_message("samples"), 1, hidden_pagination, 1, hidden_pagination, 1, hidden_pagination
+        tree = tree.json()
+        total = tree.get("total", 0)
+        max_pages = max(1, math.ceil(total / TREE_PAGE_SIZE))
+        pagination_style = {"display": "flex"} if total > TREE_PAGE_SIZE else {"display": "none"}
+
+        hierarchy = build_sample_hierarchy(tree, tax_id)
+        return hierarchy, max_pages, pagination_style, 1, hidden_pagination, 1, hidden_pagination
 
     elif active_tab == "raw_data_tab":
         raw_data = agg_data.get("rawData", [])
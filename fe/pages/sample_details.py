@@ -1,10 +1,9 @@
 import dash
 import dash_bootstrap_components as dbc
 import dash_leaflet as dl
-import requests
 from dash import html, dcc, callback, Output, Input
 
-from .utils import return_badge_status
+from .utils import backend_get, return_badge_status
 
 dash.register_page(
     __name__,
@@ -12,9 +11,6 @@ dash.register_page(
     order=0,
 )
 
-import os
-BACKEND_URL = os.getenv("BACKEND_URL", "https://portal.aegisearth.bio/api")
-
 
 def layout(tax_id=None, accession=None, **kwargs):
     return dbc.Container(
@@ -243,9 +239,7 @@ def render_sample_detail(accession, tax_id):
     if not accession:
         return html.P("No sample accession provided."), ""
 
-    response = requests.get(
-        f"{BACKEND_URL}/samples/{accession}", timeout=30
-    )
+    response = backend_get(f"/samples/{accession}", timeout=30)
     if response.status_code != 200:
         return (
             html.Div(
@@ -1,4 +1,54 @@
+import os
+
 import dash_bootstrap_components as dbc
+import flask
+from dash import html
+import requests
+
+BACKEND_URL = os.getenv("BACKEND_URL", "https://portal.aegisearth.bio/api")
+# Shared with the BE (its TRUSTED_CLIENT_TOKEN). Every BE call comes from this
+# server, so without it the BE's per-client limits would pool all portal users.
+BACKEND_CLIENT_TOKEN = os.getenv("BACKEND_CLIENT_TOKEN", "")
+# Header carrying the browser's address when the FE sits behind a proxy.
+CLIENT_IP_HEADER = os.getenv("CLIENT_IP_HEADER", "")
+
+
+def _end_user() -> str:
+    """Address of the browser whose callback is running (the proxy-appended entry)."""
+    if CLIENT_IP_HEADER and CLIENT_IP_HEADER in flask.request.headers:
+        return flask.request.headers[CLIENT_IP_HEADER].split(",")[-1].strip()
+    return flask.request.remote_addr or "unknown"
+
+
+def backend_get(path: str, params: dict | None = None, timeout: float = 30) -> requests.Response:
+    """GET a BE route for the user behind the current callback.
+
+    Callers check the status: the BE answers 429 or 503 with a {"detail": ...}
+    body when it sheds load, and that is not a result.
+    """
+    headers = {}
+    if BACKEND_CLIENT_TOKEN:
+        headers = {"X-Client-Token": BACKEND_CLIENT_TOKEN}
+        if flask.has_request_context():
+            headers["X-End-User"] = _end_user()
+    return requests.get(f"{BACKEND_URL}{path}", params=params, headers=headers, timeout=timeout)
+
+
+def unavailable_message(what: str) -> html.Div:
+    """Shown in place of `what` when the BE answered with an error rather than data."""
+    return html.Div(
+        [
+            html.H4(
+                f"Could not load {what}",
+                style={"fontFamily": "var(--font-display)", "color": "var(--aegis-text-secondary)"},
+            ),
+            html.P(
+                "The portal is busy or unavailable. Please try again in a moment.",
+                style={"color": "var(--aegis-text-muted)"},
+            ),
+        ],
+        className="text-center py-5",
+    )
 
 
 def return_badge_status(badge_text: str, color: str = None) -> dbc.Badge: